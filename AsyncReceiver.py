@@ -0,0 +1,306 @@
+'''
+asyncio Receiver
+The Receiver's protocol handling run as an asyncio DatagramProtocol, for serving thousands of senders on one port:
+    - every connection is a small state machine:
+        OPEN:    receiving; its output file is open (or reopenable, see below)
+        CLOSING: the 'end' was acknowledged and the file closed; kept around for a while only to
+                 re-ack retransmitted packets in case our last ack got lost
+      and is dropped after that
+    - idle connections expire through one event loop timer each instead of a scan over every connection. Timers
+      aren't moved on every packet: when one fires early it is just scheduled again for the rest of the idle timeout
+    - in-order data a connection's sink is holding back is written after its flush interval by a timer of its own,
+      which is only set while there is such data
+    - output files come from a shared Sink.FilePool, so at most max_open_files of them are open at any time no matter
+      how many connections there are
+Packets are handled with the same methods as in Receiver.py.
+
+Sessions (see Session.py) hand their items to the consumer callback if one is given, like Receiver's. Or iterate
+over items(), which serves the port while it yields every piece of every session's items as (address, name, data,
+last), the same as the consumer is called with:
+
+    async for address, name, data, last in AsyncReceiver(port).items():
+        ...
+
+The pieces wait in an ItemQueue until they are taken; the ones a sender has waiting count against its receive
+window, so a loop that falls behind slows the senders down.
+'''
+
+import asyncio
+import collections
+import getopt
+import socket
+import sys
+import time
+
+import Checksum
+import DatagramIO
+import Receiver
+import Sink
+import Trace
+
+OPEN = 'open'
+CLOSING = 'closing'
+
+
+# A Session.py consumer that queues the pieces of items for AsyncReceiver.items().
+class ItemQueue(object):
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.waiting = collections.Counter() # address -> bytes queued
+
+    def __call__(self, address, name, data, last):
+        if data:
+            self.waiting[address] += len(data)
+        self.queue.put_nowait((address, name, data, last))
+
+    def queued(self, address):
+        return self.waiting[address]
+
+    async def get(self):
+        address, name, data, last = await self.queue.get()
+        if data:
+            self.waiting[address] -= len(data)
+            if not self.waiting[address]:
+                del self.waiting[address]
+        return address, name, data, last
+
+
+class AsyncReceiver(Receiver.Receiver, asyncio.DatagramProtocol):
+    def __init__(self, listenport=33122, debug=False, timeout=10, max_open_files=Sink.OPEN_FILES,
+                 sndbuf=DatagramIO.DEFAULT_BUFFER, rcvbuf=DatagramIO.DEFAULT_BUFFER, reuse_port=False,
+                 max_payload=Receiver.MAX_PAYLOAD, trace=None, window=Receiver.RECEIVE_WINDOW, consumer=None):
+        # the event loop owns the socket, so none of Receiver.__init__'s socket setup happens here
+        self.debug = debug
+        self.writer_thread = False # files are shared through the pool instead
+        self.timeout = timeout
+        self.port = listenport
+        self.host = ''
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        self.reuse_port = reuse_port
+        self.max_payload = max_payload
+        self.window = window
+        self.consumer = consumer
+        self.trace = Trace.open_trace(trace, 'AsyncReceiver', 'server')
+        self.files = Sink.FilePool(max_open_files)
+        self.connections = {} # schema is {(address, port) : Connection}
+        self.timers = {} # schema is {(address, port) : asyncio.TimerHandle}
+        self.flush_timers = {} # same, for connections whose sink holds data to write once its interval has passed
+        self.stats = collections.Counter()
+        self.transport = None
+        self.loop = None
+        self.MESSAGE_HANDLER = {
+            'start' : self._handle_start,
+            'data' : self._handle_data,
+            'end' : self._handle_end,
+            'ack' : self._handle_ack,
+            'probe' : self._handle_probe,
+            'parity' : self._handle_parity
+        }
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    # Serve the port while yielding the pieces of every session's items, see the top of the file.
+    async def items(self):
+        queue = self.consumer = ItemQueue()
+        server = asyncio.ensure_future(self.serve())
+        try:
+            while True:
+                piece = asyncio.ensure_future(queue.get())
+                await asyncio.wait((piece, server), return_when=asyncio.FIRST_COMPLETED)
+                if not piece.done():
+                    # the server stopped: say why
+                    piece.cancel()
+                    server.result()
+                    return
+                address, name, data, last = piece.result()
+                yield address, name, data, last
+                if data:
+                    self.window_update(address)
+        finally:
+            server.cancel()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        DatagramIO.configure_buffers(sock, self.sndbuf, self.rcvbuf)
+        transport, protocol = await self.loop.create_datagram_endpoint(lambda: self, sock=sock)
+        try:
+            await asyncio.Future() # serve until cancelled
+        finally:
+            transport.close()
+            self.close_all()
+
+    def close_all(self):
+        for address in list(self.connections):
+            self._drop(address)
+        if self.trace is not None:
+            self.trace.close()
+
+    # asyncio.DatagramProtocol callbacks
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self._handle_message(data, addr)
+
+    def error_received(self, exc):
+        if self.debug:
+            print("socket error: %s" % exc)
+
+    # acks go out right away; the transport queues them if the socket is full
+    def send(self, message, address):
+        self.transport.sendto(message, address)
+
+    # the transport always reads into a buffer big enough for any datagram
+    def expect_payload(self, size):
+        pass
+
+    def new_connection(self, address, seqno, filename, fmt, options):
+        conn = Receiver.Connection(address[0],address[1],seqno,filename,self.debug,fmt,
+                                   sack=options.get('sack') == '1',
+                                   size=self.file_size(options),
+                                   files=self.files,
+                                   stripe_offset=self.stripe_offset(address, filename, options),
+                                   checksum=Checksum.negotiate(options.get('checksum')) or Checksum.DEFAULT,
+                                   codec=self.codec_for(options),
+                                   checkpoint=self.checkpoint_for(filename, options),
+                                   window=self.window_for(options),
+                                   fec=self.fec_for(options),
+                                   session=options.get('session') == '1',
+                                   consumer=self.consumer)
+        conn.state = OPEN
+        self._expire_in(address, self.timeout)
+        return conn
+
+    # packets for a connection that is closing only get our final ack again
+    def _handle_data(self, seqno, data, address, fmt, flags):
+        conn = self.connections.get(address)
+        if conn is not None and conn.state == CLOSING:
+            self._ack_connection(conn, conn.current_seqno, address)
+        else:
+            super()._handle_data(seqno, data, address, fmt, flags)
+            self._flush_later(address)
+
+    def _handle_end(self, seqno, data, address, fmt, flags):
+        conn = self.connections.get(address)
+        if conn is not None and conn.state == CLOSING:
+            self._ack_connection(conn, conn.current_seqno, address)
+        else:
+            super()._handle_end(seqno, data, address, fmt, flags)
+
+    def _ack_connection(self, conn, ackno, address):
+        if conn.finished and conn.state == OPEN:
+            # everything has arrived: let go of the file before the sender hears it's done, not at the idle timeout
+            conn.end()
+            conn.state = CLOSING
+            if self.debug:
+                print("finished connection to %s" % (address,))
+        super()._ack_connection(conn, ackno, address)
+
+    def _expire_in(self, address, delay):
+        self.timers[address] = self.loop.call_later(delay, self._expire, address)
+
+    def _expire(self, address):
+        conn = self.connections.get(address)
+        if conn is None:
+            return
+        idle = time.time() - conn.updated
+        if idle < self.timeout:
+            self._expire_in(address, self.timeout - idle)
+            return
+        if self.debug:
+            print("killed connection to %s (%.2f old)" % (address, idle))
+        self._drop(address)
+
+    # Data the connection's sink buffers is written after its flush interval even if no more packets arrive.
+    def _flush_later(self, address):
+        conn = self.connections.get(address)
+        if (address not in self.flush_timers and conn is not None and conn.state == OPEN and
+                conn.sink.flush_if_due()):
+            self.flush_timers[address] = self.loop.call_later(Sink.FLUSH_INTERVAL, self._flush_due, address)
+
+    def _flush_due(self, address):
+        del self.flush_timers[address]
+        try:
+            self._flush_later(address)
+        except (OSError, OverflowError) as e:
+            self._fail(address, e)
+
+    def _drop(self, address):
+        conn = self.connections.pop(address)
+        for timers in (self.timers, self.flush_timers):
+            timer = timers.pop(address, None)
+            if timer is not None:
+                timer.cancel()
+        if conn.state == OPEN:
+            conn.end()
+        self._closed(address, conn)
+
+    def _cleanup(self):
+        pass # connections expire through their own timers
+
+
+if __name__ == "__main__":
+    def usage():
+        print("BEARS-TP asyncio Receiver")
+        print("-p PORT | --port=PORT The listen port, defaults to 33122")
+        print("-t TIMEOUT | --timeout=TIMEOUT Receiver timeout in seconds")
+        print("-m FILES | --max-open-files=FILES Output files kept open at once, defaults to %d" % Sink.OPEN_FILES)
+        print("-b BYTES | --buffer=BYTES Socket send and receive buffer size, defaults to %d" % DatagramIO.DEFAULT_BUFFER)
+        print("-s BYTES | --segment-size=BYTES Largest payload per packet to accept, defaults to %d" %
+              Receiver.MAX_PAYLOAD)
+        print("-T FILE | --trace=FILE Write a JSON lines event trace of every connection to FILE")
+        print("-W BYTES | --window=BYTES Receive window advertised to senders, defaults to %d" %
+              Receiver.RECEIVE_WINDOW)
+        print("-d | --debug Print debug messages")
+        print("-h | --help Print this usage message")
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],
+                               "p:dt:m:b:s:T:W:", ["port=", "debug=", "timeout=", "max-open-files=", "buffer=",
+                                                    "segment-size=", "trace=", "window="])
+    except:
+        usage()
+        exit()
+
+    port = 33122
+    debug = False
+    timeout = 10
+    max_open_files = Sink.OPEN_FILES
+    buffer_size = DatagramIO.DEFAULT_BUFFER
+    max_payload = Receiver.MAX_PAYLOAD
+    trace = None
+    window = Receiver.RECEIVE_WINDOW
+
+    for o,a in opts:
+        if o in ("-p", "--port"):
+            port = int(a)
+        elif o in ("-t", "--timeout"):
+            timeout = int(a)
+        elif o in ("-m", "--max-open-files"):
+            max_open_files = int(a)
+        elif o in ("-b", "--buffer"):
+            buffer_size = int(a)
+        elif o in ("-s", "--segment-size"):
+            max_payload = int(a)
+        elif o in ("-T", "--trace"):
+            trace = a
+        elif o in ("-W", "--window"):
+            window = int(a)
+        elif o in ("-d", "--debug"):
+            debug = True
+        else:
+            usage()
+            exit()
+    r = AsyncReceiver(port, debug, timeout, max_open_files, buffer_size, buffer_size, max_payload=max_payload,
+                      trace=trace, window=window)
+    r.start()
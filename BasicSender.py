@@ -1,8 +1,12 @@
+import errno
 import random
 import socket
 import sys
 
 import Checksum
+import ChunkSource
+import DatagramIO
+import Packet
 
 '''
 Modified Basic Sender
@@ -11,52 +15,72 @@ This is the basic sender class. Your sender will extend this class and will
 implement the start() method.
 '''
 class BasicSender(object):
-    def __init__(self,dest,port,filename,debug=False):
+    def __init__(self,dest,port,filename,debug=False,sndbuf=DatagramIO.DEFAULT_BUFFER,rcvbuf=DatagramIO.DEFAULT_BUFFER,
+                 source=None):
         self.debug = debug
         self.dest = dest
         self.dport = port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.settimeout(None) # blocking
-        self.sock.bind(('',random.randint(10000,40000)))
-        if filename == None:
-            self.infile = sys.stdin
+        while True:
+            try:
+                self.sock.bind(('',random.randint(10000,40000)))
+                break
+            except OSError as e:
+                # port taken (e.g. by another sender on this host): try another one
+                if e.errno != errno.EADDRINUSE:
+                    raise
+        # Batched, non-blocking socket I/O (see DatagramIO.py)
+        self.io = DatagramIO.DatagramIO(self.sock, sndbuf, rcvbuf)
+        # Wire format in use; starts out binary and drops to legacy for old receivers.
+        self.format = Packet.BINARY
+        # Binary checksum algorithm, CRC32 until the receiver accepts another one
+        self.checksum = Checksum.crc32
+        # Payload source, opened once for the whole transfer (see ChunkSource.py), unless one is given
+        if source is not None:
+            self.infile = source
+        elif filename == None:
+            self.infile = ChunkSource.StreamSource(sys.stdin.buffer)
         else:
-            self.infile = open(filename,"rb")
+            self.infile = ChunkSource.open_source(filename)
 
     # Waits until packet is received to return.
     def receive(self, timeout=None):
-        self.sock.settimeout(timeout)
         try:
-            return self.sock.recv(4096)
-        except (socket.timeout, socket.error):
+            received = self.io.receive(timeout)
+        except socket.error:
             return None
+        return received[0] if received else None
+
+    # Waits for a packet, then returns it along with every other packet that has already arrived.
+    def receive_many(self, timeout=None):
+        try:
+            return [message for message, address in self.io.receive_many(timeout)]
+        except socket.error:
+            return []
 
     # Sends a packet to the destination address.
     def send(self, message, address=None):
         if address is None:
             address = (self.dest,self.dport)
-        self.sock.sendto(message, address)
-
-    # Prepares a packet
-    def make_packet(self,msg_type=None,seqno=None,msg=None,packet=None):
-        if msg_type is not None:
-            body = b"".join([msg_type.encode(), b'|', bytes(str(seqno).encode()), b'|', msg, b'|'])
-            checksum = Checksum.generate_checksum(body)
-            return_packet = body + checksum
-            return return_packet
-        else:
-            body = b"".join([packet[0].encode(), b'|', bytes(str(packet[1]).encode()), b'|', packet[2], b'|'])
-            checksum = Checksum.generate_checksum(body)
-            return_packet = body + checksum
-            return return_packet
+        self.io.send(message, address)
+
+    # Sends a burst of packets to the destination address in as few system calls as possible.
+    def send_many(self, messages, address=None):
+        if address is None:
+            address = (self.dest,self.dport)
+        self.io.send_many([(message, address) for message in messages])
 
+    # Prepares a packet in the negotiated wire format
+    def make_packet(self,msg_type=None,seqno=None,msg=None,packet=None,flags=0):
+        if msg_type is None:
+            msg_type, seqno, msg = packet[0:3]
+        # 'start' packets are always CRC32: the receiver doesn't know about any other algorithm yet
+        checksum = Checksum.crc32 if msg_type == 'start' else self.checksum
+        return Packet.make(self.format, msg_type, seqno, msg, flags, checksum)
 
+    # Returns (msg_type, seqno, data, flags, valid); data is a memoryview, not a copy.
     def split_packet(self, message):
-        pieces = message.split(b'|')
-        msg_type, seqno = pieces[0:2]  # first two elements always treated as msg type and seqno
-        checksum = pieces[-1]  # last is always treated as checksum
-        data = b'|'.join(pieces[2:-1])  # everything in between is considered data
-        return msg_type.decode(), int(seqno), data, checksum
+        return Packet.parse(message, self.checksum)
 
     # Main sending loop.
     def start(self):
@@ -0,0 +1,121 @@
+'''
+Transfer checkpoints
+A checkpoint records which byte ranges of a receiver's output file are known to be on disk, so that a transfer that
+was cut off can later resume instead of starting over. It lives next to the output file as out_<filename>.part:
+
+    {"size": 52428800000, "mtime": 1792300000000000000, "generation": "9f86d081884c7d65", "file": [2049, 1311],
+     "ranges": [[0, 8388608000], [8390000000, 8391458000]]}
+
+size and mtime identify the version of the sender's file the data came from, and file the output file it describes
+(device and inode); a checkpoint for anything else is ignored and the transfer starts from scratch. generation
+belongs to the connection writing the output: a connection claims the checkpoint when it opens the output file and
+only saves over a checkpoint that still carries its own generation. Any transfer that rewrites the output file
+without resuming (a plain or striped transfer, a session item) discards the checkpoint, so a transfer that was
+still writing it stops saving, and a later resume can't trust ranges that were overwritten in the meantime.
+
+The receiver saves the checkpoint every CHECKPOINT_BYTES of progress or CHECKPOINT_INTERVAL seconds (after the data
+itself has been synced to disk), when a connection expires, and removes it once the file is complete. A resuming
+sender starts at offset(): the end of the range starting at byte 0.
+'''
+
+import json
+import os
+import time
+
+CHECKPOINT_BYTES = 64 << 20
+CHECKPOINT_INTERVAL = 5.0
+SUFFIX = '.part'
+
+
+# What identifies the output file on disk, as saved in the checkpoint.
+def file_id(output):
+    st = os.stat(output)
+    return [st.st_dev, st.st_ino]
+
+
+class Checkpoint(object):
+    def __init__(self, output, size, mtime, ranges=None):
+        self.output = output
+        self.path = output + SUFFIX
+        self.size = size
+        self.mtime = mtime
+        self.ranges = ranges or []
+        self.generation = os.urandom(8).hex() # tells our saves apart from any other connection's
+        self.claimed = False
+        self.saved_at = time.monotonic()
+        self.saved_position = self.offset()
+
+    # Where a resumed transfer starts: everything before it is on disk.
+    def offset(self):
+        for start, end in self.ranges:
+            if start == 0:
+                return min(end, self.size)
+        return 0
+
+    # Whether enough has happened since the last save to save again, given the current in-order position.
+    def due(self, position):
+        return (position - self.saved_position >= CHECKPOINT_BYTES or
+                time.monotonic() - self.saved_at >= CHECKPOINT_INTERVAL)
+
+    # Take the checkpoint over for a connection that has just opened the output file, replacing any other one.
+    def claim(self):
+        self.claimed = True
+        self._write(self.ranges)
+
+    # Whether the checkpoint on disk is still ours, i.e. nobody rewrote or resumed the output file since we claimed it.
+    def owned(self):
+        if not self.claimed:
+            return False
+        try:
+            with open(self.path) as f:
+                return json.load(f).get('generation') == self.generation
+        except (OSError, ValueError, AttributeError):
+            return False
+
+    # Replace the checkpoint file atomically, so a crash leaves either the old or the new one. Returns False (and
+    # saves nothing) once the checkpoint isn't ours any more.
+    def save(self, ranges):
+        if not self.owned():
+            return False
+        self._write([[start, end] for start, end in ranges if end > start])
+        return True
+
+    def remove(self):
+        if self.owned():
+            discard(self.output)
+
+    def _write(self, ranges):
+        self.ranges = ranges
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'size': self.size, 'mtime': self.mtime, 'generation': self.generation,
+                       'file': file_id(self.output), 'ranges': self.ranges}, f)
+        os.replace(temporary, self.path)
+        self.saved_at = time.monotonic()
+        self.saved_position = self.offset()
+
+
+'''
+The checkpoint for an output file and the sender's version of the file. If there is no usable one (missing, for
+another version, or for another output file) a new, empty one is returned and the transfer starts from byte 0.
+Either way the connection has to claim() it once it has opened the output file.
+'''
+def open_checkpoint(output, size, mtime):
+    try:
+        with open(output + SUFFIX) as f:
+            saved = json.load(f)
+        ranges = [[int(start), int(end)] for start, end in saved['ranges']]
+        if (saved['size'] == size and saved['mtime'] == mtime and saved['generation'] and
+                saved['file'] == file_id(output)):
+            return Checkpoint(output, size, mtime, ranges)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return Checkpoint(output, size, mtime)
+
+
+# The output file is being rewritten from scratch: whatever its checkpoint says no longer holds.
+def discard(output):
+    try:
+        os.remove(output + SUFFIX)
+    except OSError:
+        pass
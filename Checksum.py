@@ -3,18 +3,138 @@ import binascii
 '''
 Modified Checksum
 Editors: Reuben Sonnenberg and Devon Olson
+The legacy text format carries the decimal CRC32 of everything up to the last '|'. The binary format carries a 32 bit
+checksum field whose algorithm is negotiated per connection (the 'checksum' start option, see negotiate()):
+
+    crc32:    zlib's CRC32, the default
+    crc32c:   CRC32C (Castagnoli), with the crc32c or google-crc32c package. Without either there is only a
+              pure Python version, over a hundred times slower than crc32, so it is then neither offered nor
+              accepted (see usable()) and the connection stays with crc32
+    internet: the 16 bit ones' complement sum of IP/UDP/TCP (RFC 1071)
+    none:     no checksum at all, for links where an outer layer already guarantees integrity
+
+Every algorithm hashes any number of bytes-like pieces incrementally, so a header and a payload never need to be
+concatenated (or copied out of a memoryview) just to be hashed, and returns an int that is compared as is.
 '''
 
 # Assumes last field is the checksum!
 def validate_checksum(message):
     try:
-        msg,reported_checksum = message.rsplit(b'|',1)
-        msg += b'|'
-        return generate_checksum(msg) == reported_checksum
+        last = message.rindex(b'|') + 1
+        reported = message[last:]
+        # compare numbers, hashing the body in place instead of copying it out with its '|'
+        return reported.isdigit() and binascii.crc32(memoryview(message)[:last]) & 0xffffffff == int(reported)
     except:
         return False
 
 # Assumes message does NOT contain final checksum field. Message MUST end
 # with a trailing '|' character.
 def generate_checksum(message):
-    return (str(binascii.crc32(message) & 0xffffffff).encode())
\ No newline at end of file
+    return (str(binascii.crc32(message) & 0xffffffff).encode())
+
+# Binary CRC32 computed incrementally over several bytes-like pieces, so that a header
+# and a payload never need to be concatenated just to be hashed.
+def crc32(*pieces):
+    crc = 0
+    for piece in pieces:
+        crc = binascii.crc32(piece, crc)
+    return crc & 0xffffffff
+
+
+def _crc32c_table():
+    table = []
+    for n in range(256):
+        crc = n
+        for bit in range(8):
+            crc = (crc >> 1) ^ 0x82f63b78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+# Whether CRC32C comes from a compiled package; if not it is too slow to negotiate (see usable())
+CRC32C_NATIVE = True
+try:
+    from crc32c import crc32c as _crc32c_update
+except ImportError:
+    try:
+        from google_crc32c import extend as _google_extend
+        def _crc32c_update(data, crc=0):
+            return _google_extend(crc, bytes(data))
+    except ImportError:
+        CRC32C_NATIVE = False
+        _CRC32C_TABLE = _crc32c_table()
+        def _crc32c_update(data, crc=0):
+            table = _CRC32C_TABLE
+            crc ^= 0xffffffff
+            for byte in bytes(data):
+                crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+            return crc ^ 0xffffffff
+
+def crc32c(*pieces):
+    crc = 0
+    for piece in pieces:
+        crc = _crc32c_update(piece, crc)
+    return crc & 0xffffffff
+
+'''
+RFC 1071 Internet checksum. The ones' complement sum of 16 bit words is the big endian value of the whole message
+modulo 0xffff (since 2**16 == 1 mod 0xffff), so every piece is summed with one int.from_bytes instead of word by word.
+A piece of odd length shifts the next one by a byte, i.e. multiplies the sum so far by 2**8.
+'''
+def internet(*pieces):
+    total = 0
+    length = 0
+    nonzero = False
+    for piece in pieces:
+        size = len(piece)
+        if size & 1:
+            total <<= 8
+        value = int.from_bytes(piece, 'big')
+        nonzero = nonzero or value != 0
+        total = (total + value) % 0xffff
+        length += size
+    if length & 1:
+        total = (total << 8) % 0xffff # pad the last word with a zero byte
+    if total == 0 and nonzero:
+        total = 0xffff # the sum of words that aren't all zero is never zero
+    return ~total & 0xffff
+
+
+def none(*pieces):
+    return 0
+
+
+ALGORITHMS = {
+    'crc32': crc32,
+    'crc32c': crc32c,
+    'internet': internet,
+    'none': none
+}
+
+DEFAULT = 'crc32'
+
+
+def get(name=DEFAULT):
+    try:
+        return ALGORITHMS[name]
+    except KeyError:
+        raise ValueError("unknown checksum algorithm '%s' (choose from %s)" % (name, ', '.join(sorted(ALGORITHMS))))
+
+
+# Whether it makes sense to checksum every packet with the algorithm here.
+def usable(name):
+    return name in ALGORITHMS and (name != 'crc32c' or CRC32C_NATIVE)
+
+
+# What a sender that would like 'name' offers: that, if usable, and the default.
+def offer(name):
+    if name == DEFAULT or not usable(name):
+        return DEFAULT
+    return name + ',' + DEFAULT
+
+
+# The first usable algorithm of a comma separated offer, or None.
+def negotiate(offer):
+    for name in (offer or '').split(','):
+        if usable(name):
+            return name
+    return None
@@ -0,0 +1,104 @@
+'''
+Chunk sources
+Where the sender's payloads come from. A source is opened once per transfer and hands out
+payloads by stream offset:
+
+    MmapSource:   regular files. The file is memory mapped and read() returns memoryview slices
+                  of the mapping, so a payload is never copied, and the file is never reopened or
+                  seeked per packet.
+    StreamSource: pipes, stdin and anything else that can't be mapped. Reads ahead in large
+                  blocks and hands out slices of the current block. Offsets must be read in
+                  increasing order; data that is skipped over is read and thrown away.
+
+Payloads handed out stay valid for as long as they are referenced, so retransmissions don't
+need the source to keep old data around.
+'''
+
+import mmap
+import os
+import stat
+
+READ_AHEAD = 1 << 20
+
+
+class MmapSource(object):
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = None
+        self.view = memoryview(b'')
+        if self.size > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self.map, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                self.map.madvise(mmap.MADV_SEQUENTIAL)
+            self.view = memoryview(self.map)
+
+    def read(self, offset, size):
+        return self.view[offset:offset + size]
+
+    def at_end(self, offset):
+        return offset >= self.size
+
+    def close(self):
+        self.view.release()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass # payload slices are still referenced; the mapping goes away with them
+        self.file.close()
+
+
+class StreamSource(object):
+    def __init__(self, stream, block_size=READ_AHEAD):
+        self.stream = stream
+        self.block_size = block_size
+        self.size = None # unknown until the stream ends
+        self.block = memoryview(b'')
+        self.block_offset = 0 # stream offset of the first byte of the current block
+        self.eof = False
+
+    # Make the current block cover [start, end), or as much of it as the stream still has.
+    def _fill(self, start, end):
+        while not self.eof and end > self.block_offset + len(self.block):
+            keep = min(max(start - self.block_offset, 0), len(self.block))
+            leftover = self.block[keep:]
+            self.block_offset += keep
+            # only the partial chunk at the end of the old block is copied, the new data is read in place
+            block = bytearray(len(leftover) + self.block_size)
+            block[:len(leftover)] = leftover
+            count = self.stream.readinto(memoryview(block)[len(leftover):])
+            if not count:
+                self.eof = True
+                self.size = self.block_offset + len(leftover)
+            self.block = memoryview(block)[:len(leftover) + (count or 0)]
+
+    def read(self, offset, size):
+        if offset < self.block_offset:
+            raise ValueError("stream source can't go back to offset %d" % offset)
+        self._fill(offset, offset + size)
+        start = offset - self.block_offset
+        return self.block[start:start + size]
+
+    def at_end(self, offset):
+        self._fill(offset, offset + 1)
+        return self.eof and offset >= self.size
+
+    def close(self):
+        pass
+
+
+# Memory maps regular files and streams everything else (pipes, character devices, sockets).
+def open_source(filename):
+    if stat.S_ISREG(os.stat(filename).st_mode):
+        return MmapSource(filename)
+    return StreamSource(open(filename, 'rb'))
+
+
+# All of a source as consecutive slices of up to 'size' bytes.
+def blocks(source, size=READ_AHEAD):
+    offset = 0
+    while not source.at_end(offset):
+        block = source.read(offset, size)
+        offset += len(block)
+        yield block
@@ -0,0 +1,171 @@
+'''
+Per-segment compression
+A sender that asks for it in its start options ('compress=zlib' or 'compress=lzma') may send data packets whose
+payload is one independently compressed chunk of the file, marked with Packet.FLAG_COMPRESSED. A compressed packet
+still takes up as much sequence space as the raw data it stands for, so acks, SACK blocks and the receiver's
+positioned writes work exactly as for raw packets; the receiver just decompresses the payload first.
+
+SegmentCompressor cuts the file into those chunks on the sender:
+    - chunks are compressed ahead of the send loop by a pool of worker threads (zlib and lzma release the GIL)
+    - each chunk is sized from the compression ratio seen so far, so that it just fits into one packet
+    - a chunk that doesn't shrink by at least BYPASS_RATIO goes out raw instead, and after BYPASS_MISSES of
+      those in a row compression is switched off for a while (1 MiB of data at first, doubling up to 64 MiB
+      each time it still doesn't pay off), so media files and other compressed data don't waste CPU
+'''
+
+import collections
+import concurrent.futures
+import lzma
+import os
+import zlib
+
+MAX_RAW = 1 << 16 # raw bytes one compressed packet can stand for
+BYPASS_RATIO = 0.9
+BYPASS_MISSES = 3
+BYPASS_BYTES = 1 << 20
+MAX_BYPASS_BYTES = 64 << 20
+READ_AHEAD = 32 # chunks compressed ahead of the send loop
+
+_LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'dict_size': MAX_RAW}]
+
+
+class Codec(object):
+    def __init__(self, name, default_level, compress, decompressor):
+        self.name = name
+        self.default_level = default_level
+        self.compress = compress # compress(data, level) -> bytes
+        self.decompressor = decompressor # decompressor() -> object with decompress(data, max_length) and eof
+
+
+CODECS = {
+    'zlib': Codec('zlib', 6,
+                  lambda data, level: zlib.compress(data, level, wbits=-15),
+                  lambda: zlib.decompressobj(wbits=-15)),
+    'lzma': Codec('lzma', 1,
+                  lambda data, level: lzma.compress(data, format=lzma.FORMAT_RAW,
+                                                    filters=[dict(_LZMA_FILTERS[0], preset=level)]),
+                  lambda: lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS))
+}
+
+
+def get(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("unknown compression codec '%s' (choose from %s)" % (name, ', '.join(sorted(CODECS))))
+
+
+# 'codec' or 'codec:level' as given on the command line -> (codec name, level)
+def parse_spec(spec):
+    name, _, level = spec.partition(':')
+    codec = get(name)
+    return codec.name, int(level) if level else codec.default_level
+
+
+# Decompress one packet's payload. Raises ValueError for anything that isn't exactly one chunk of at most MAX_RAW bytes.
+def decompress(name, data):
+    decompressor = get(name).decompressor()
+    try:
+        raw = decompressor.decompress(data, MAX_RAW)
+    except (zlib.error, lzma.LZMAError) as e:
+        raise ValueError("bad compressed payload: %s" % e)
+    if not decompressor.eof:
+        raise ValueError("compressed payload is truncated or too large")
+    return raw
+
+
+class SegmentCompressor(object):
+    def __init__(self, name, level, source, offset, end=None, payload_size=1458, workers=None):
+        self.codec = get(name)
+        self.level = level
+        self.source = source
+        self.offset = offset # next raw offset to hand to a worker
+        self.end = end # stop at this offset rather than at the end of the source
+        self.payload_size = payload_size
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count() or 1,
+                                                          thread_name_prefix='compress')
+        self.jobs = collections.deque() # (raw, future) in offset order; future is None for raw chunks
+        self.ready = collections.deque() # (raw, payload) ready to go out; payload is None for raw chunks
+        self.factor = 2.0 # raw bytes per compressed byte, as seen so far
+        self.misses = 0
+        self.bypass = 0 # raw bytes left to send without trying to compress them
+        self.bypass_bytes = BYPASS_BYTES
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    # The next chunk as (raw data, compressed payload or None to send it raw), or None at the end of the data.
+    def next(self):
+        while not self.ready:
+            self._submit()
+            if not self.jobs:
+                return None
+            raw, future = self.jobs.popleft()
+            if future is None:
+                self.ready.append((raw, None))
+            else:
+                self._result(raw, future.result())
+        raw, payload = self.ready.popleft()
+        self.raw_bytes += len(raw)
+        self.wire_bytes += len(payload if payload is not None else raw)
+        return raw, payload
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self):
+        while len(self.jobs) < READ_AHEAD:
+            if self.bypass > 0:
+                size = self.payload_size
+            else:
+                size = int(self.payload_size * self.factor * BYPASS_RATIO)
+                size = min(max(size, self.payload_size), MAX_RAW)
+            if self.end is not None:
+                size = min(size, self.end - self.offset)
+            raw = self.source.read(self.offset, size) if size > 0 else b''
+            if len(raw) == 0:
+                return
+            self.offset += len(raw)
+            if self.bypass > 0:
+                self.bypass -= len(raw)
+                self.jobs.append((raw, None))
+            else:
+                self.jobs.append((raw, self.pool.submit(self.codec.compress, raw, self.level)))
+
+    def _result(self, raw, payload):
+        if len(payload) >= len(raw) * BYPASS_RATIO:
+            # not worth it: send it raw, and stop trying for a while if this keeps happening
+            self._split(raw)
+            self.factor = 1.0
+            self.misses += 1
+            if self.misses >= BYPASS_MISSES:
+                self.misses = 0
+                self.bypass = self.bypass_bytes
+                self.bypass_bytes = min(self.bypass_bytes * 2, MAX_BYPASS_BYTES)
+                # the chunks read ahead are part of the bypass too: their misses would only start it over
+                self._bypass_pending()
+            return
+        self.misses = 0
+        self.factor = 0.75 * self.factor + 0.25 * len(raw) / len(payload)
+        if len(payload) <= self.payload_size:
+            self.ready.append((raw, payload))
+            self.bypass_bytes = BYPASS_BYTES
+            return
+        # compresses well but too much data for one packet: compress it again in two parts that should fit
+        first = max(int(len(raw) * self.payload_size / len(payload) * BYPASS_RATIO), 1)
+        for part in (raw[first:], raw[:first]):
+            if len(part) > 0:
+                self.jobs.appendleft((part, self.pool.submit(self.codec.compress, part, self.level)))
+
+    def _bypass_pending(self):
+        pending = self.jobs
+        self.jobs = collections.deque()
+        for raw, future in pending:
+            if future is not None:
+                future.cancel()
+                self.bypass -= len(raw)
+            for start in range(0, len(raw), self.payload_size):
+                self.jobs.append((raw[start:start + self.payload_size], None))
+
+    def _split(self, raw):
+        for start in range(0, len(raw), self.payload_size):
+            self.ready.append((raw[start:start + self.payload_size], None))
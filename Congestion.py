@@ -0,0 +1,227 @@
+'''
+Congestion control
+Decides how many packets the sender may have in flight (the congestion window, in packets).
+The sender reports every ack, loss and retransmission timeout; the algorithm adjusts cwnd.
+Algorithms are picked by name from ALGORITHMS, e.g. on the Sender command line with -c.
+
+    reno:  slow start, then additive increase / multiplicative decrease (RFC 5681)
+    cubic: slow start, then the CUBIC window growth function (RFC 8312)
+    bbr:   a simplified BBR model that sizes cwnd from the measured bottleneck bandwidth and
+           minimum RTT and publishes a pacing rate instead of reacting to individual losses
+'''
+
+import math
+
+INITIAL_WINDOW = 10  # RFC 6928
+MIN_WINDOW = 2
+MAX_WINDOW = 65536
+
+
+class CongestionControl(object):
+    name = None
+
+    def __init__(self, initial_window=INITIAL_WINDOW, max_window=MAX_WINDOW):
+        self.cwnd = float(initial_window)
+        self.ssthresh = float('inf')
+        self.max_window = max_window
+
+    # The number of packets that may currently be in flight.
+    def window(self):
+        return int(min(max(self.cwnd, 1), self.max_window))
+
+    # Packets per second the sender should pace at, or None to pace the window over the RTT (see Pacing.py).
+    def pacing_rate(self):
+        return None
+
+    def in_slow_start(self):
+        return self.cwnd < self.ssthresh
+
+    # 'acked' packets were newly acknowledged. rtt is a valid RTT sample in seconds or None.
+    def on_ack(self, acked, rtt, now, in_flight):
+        raise NotImplementedError
+
+    # A loss was detected without a timeout (duplicate acks / SACK). Called at most once per window of data.
+    def on_loss(self, now, in_flight):
+        raise NotImplementedError
+
+    # A retransmission timer expired.
+    def on_timeout(self, now, in_flight):
+        self.ssthresh = max(in_flight / 2.0, MIN_WINDOW)
+        self.cwnd = 1.0
+
+
+class Reno(CongestionControl):
+    name = 'reno'
+
+    def on_ack(self, acked, rtt, now, in_flight):
+        if self.in_slow_start():
+            # exponential growth: one extra packet per packet acknowledged
+            self.cwnd += acked
+        else:
+            # additive increase: about one packet per round trip
+            self.cwnd += float(acked) / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def on_loss(self, now, in_flight):
+        self.ssthresh = max(self.cwnd / 2.0, MIN_WINDOW)
+        self.cwnd = self.ssthresh
+
+
+class Cubic(CongestionControl):
+    name = 'cubic'
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, initial_window=INITIAL_WINDOW, max_window=MAX_WINDOW):
+        super().__init__(initial_window, max_window)
+        self.w_max = 0.0
+        self.k = 0.0
+        self.epoch_start = None
+        self.w_est = 0.0
+        self.min_rtt = None
+
+    def on_ack(self, acked, rtt, now, in_flight):
+        if rtt is not None:
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        if self.in_slow_start():
+            self.cwnd = min(self.cwnd + acked, self.max_window)
+            return
+        if self.epoch_start is None:
+            # first ack of a new congestion avoidance epoch
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1.0 / 3)
+            else:
+                self.k = 0.0
+                self.w_max = self.cwnd
+            self.w_est = self.cwnd
+        t = now - self.epoch_start + (self.min_rtt or 0.0)
+        target = self.C * (t - self.k) ** 3 + self.w_max
+        if target > self.cwnd:
+            self.cwnd += (target - self.cwnd) / self.cwnd * acked
+        else:
+            self.cwnd += 0.01 * acked / self.cwnd
+        # TCP friendly region: never grow slower than Reno would
+        self.w_est += 3 * (1 - self.BETA) / (1 + self.BETA) * acked / self.cwnd
+        self.cwnd = min(max(self.cwnd, self.w_est), self.max_window)
+
+    def on_loss(self, now, in_flight):
+        self._reduce()
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self, now, in_flight):
+        self._reduce()
+        self.cwnd = 1.0
+
+    def _reduce(self):
+        # fast convergence: release bandwidth sooner if the window stopped reaching its old maximum
+        if self.cwnd < self.w_max:
+            self.w_max = self.cwnd * (1 + self.BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * self.BETA, MIN_WINDOW)
+        self.epoch_start = None
+
+
+class BBR(CongestionControl):
+    name = 'bbr'
+    STARTUP_GAIN = 2.0 / math.log(2)
+    CWND_GAIN = 2.0
+    PROBE_GAINS = [1.25, 0.75, 1, 1, 1, 1, 1, 1]
+    BW_WINDOW = 10  # rounds the bottleneck bandwidth maximum is kept for
+    MIN_RTT_WINDOW = 10.0  # seconds the minimum RTT is kept for
+
+    def __init__(self, initial_window=INITIAL_WINDOW, max_window=MAX_WINDOW):
+        super().__init__(initial_window, max_window)
+        self.mode = 'startup'
+        self.pacing_gain = self.STARTUP_GAIN
+        self.min_rtt = None
+        self.min_rtt_stamp = 0.0
+        self.bw_samples = []  # delivery rate (packets/s) of the most recent rounds
+        self.round_start = None
+        self.round_delivered = 0
+        self.full_bw = 0.0
+        self.full_bw_rounds = 0
+        self.cycle_index = 0
+
+    def btl_bw(self):
+        return max(self.bw_samples) if self.bw_samples else 0.0
+
+    def bdp(self):
+        if self.min_rtt is None or not self.bw_samples:
+            return None
+        return self.btl_bw() * self.min_rtt
+
+    def pacing_rate(self):
+        if not self.bw_samples:
+            return None
+        return self.pacing_gain * self.btl_bw()
+
+    def on_ack(self, acked, rtt, now, in_flight):
+        if rtt is not None and (self.min_rtt is None or rtt <= self.min_rtt or
+                                now - self.min_rtt_stamp > self.MIN_RTT_WINDOW):
+            self.min_rtt = rtt
+            self.min_rtt_stamp = now
+        if self.round_start is None:
+            self.round_start = now
+        self.round_delivered += acked
+        # A 'round' lasts one minimum RTT; its delivery rate is one bandwidth sample
+        if self.min_rtt is not None and now - self.round_start >= self.min_rtt:
+            self.bw_samples.append(self.round_delivered / (now - self.round_start))
+            del self.bw_samples[:-self.BW_WINDOW]
+            self.round_start = now
+            self.round_delivered = 0
+            self._next_round(in_flight)
+
+        bdp = self.bdp()
+        if bdp is None or (self.mode == 'startup' and self.cwnd < self.CWND_GAIN * bdp):
+            # no model yet, or still filling the pipe: grow like slow start
+            self.cwnd += acked
+        else:
+            self.cwnd = max(self.CWND_GAIN * bdp, 4)
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def _next_round(self, in_flight):
+        if self.mode == 'startup':
+            # the pipe is full once bandwidth stops growing by 25% for three rounds
+            if self.btl_bw() >= self.full_bw * 1.25:
+                self.full_bw = self.btl_bw()
+                self.full_bw_rounds = 0
+            else:
+                self.full_bw_rounds += 1
+                if self.full_bw_rounds >= 3:
+                    self.mode = 'drain'
+                    self.pacing_gain = 1 / self.STARTUP_GAIN
+        elif self.mode == 'drain':
+            bdp = self.bdp()
+            if bdp is None or in_flight <= bdp:
+                self.mode = 'probe_bw'
+                self.cycle_index = 0
+                self.pacing_gain = self.PROBE_GAINS[0]
+        else:
+            self.cycle_index = (self.cycle_index + 1) % len(self.PROBE_GAINS)
+            self.pacing_gain = self.PROBE_GAINS[self.cycle_index]
+
+    # BBR does not treat an isolated loss as a congestion signal
+    def on_loss(self, now, in_flight):
+        pass
+
+    def on_timeout(self, now, in_flight):
+        self.cwnd = float(MIN_WINDOW * 2)
+
+
+ALGORITHMS = {
+    Reno.name: Reno,
+    Cubic.name: Cubic,
+    BBR.name: BBR
+}
+
+DEFAULT = Cubic.name
+
+
+def create(name=DEFAULT, **kwargs):
+    try:
+        return ALGORITHMS[name](**kwargs)
+    except KeyError:
+        raise ValueError("unknown congestion control algorithm '%s' (choose from %s)" %
+                         (name, ', '.join(sorted(ALGORITHMS))))
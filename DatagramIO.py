@@ -0,0 +1,188 @@
+'''
+Batched datagram I/O
+Wraps a UDP socket so that bursts of packets cost as few system calls as possible:
+
+    send_many():    consecutive packets to the same address with the same size are handed to the kernel in one
+                    sendmsg() call using UDP generic segmentation offload (UDP_SEGMENT, Linux 4.18+), which splits
+                    them back into individual datagrams. Elsewhere, or if the kernel doesn't support it, one sendto()
+                    per packet. Other errors (EMSGSIZE, ENOBUFS, ...) are raised as they would be without GSO.
+    receive_many(): waits once, then drains every datagram already queued on the socket without waiting again.
+                    With UDP generic receive offload (UDP_GRO, Linux 5.0+) one recvmsg() can return many datagrams
+                    of a flow at once; they are split back into memoryview slices without copying.
+
+The socket is switched to non-blocking mode; waiting is done with a selector. Socket buffer sizes can be raised
+with the sndbuf/rcvbuf arguments (SO_SNDBUFFORCE/SO_RCVBUFFORCE are tried first so root can exceed the sysctl limit).
+Without GRO every datagram is read into a buffer of bufsize bytes; expect() grows it when larger datagrams have been
+negotiated, so small packets don't pay for 64 KiB allocations.
+'''
+
+import errno
+import selectors
+import socket
+import struct
+import sys
+
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
+GSO_UNSUPPORTED = (errno.EINVAL, errno.EIO, errno.ENOPROTOOPT) # what sendmsg() fails with where UDP GSO doesn't work
+MAX_DATAGRAM = 65535
+MAX_UDP_PAYLOAD = 65507 # largest datagram IPv4 can carry
+DRAIN_LIMIT = 256 # datagrams taken off the socket per wakeup
+DEFAULT_BUFFER = 4 << 20
+
+_GSO_SIZE = struct.Struct('=H')
+_GRO_SIZE = struct.Struct('=i')
+_LINUX = sys.platform.startswith('linux')
+IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)
+IP_PMTUDISC_PROBE = getattr(socket, 'IP_PMTUDISC_PROBE', 3)
+IP_DONTFRAG = getattr(socket, 'IP_DONTFRAG', 28)
+
+
+# Sets SO_SNDBUF/SO_RCVBUF, returning the sizes the kernel actually granted.
+def configure_buffers(sock, sndbuf=None, rcvbuf=None):
+    for size, option, force in ((sndbuf, socket.SO_SNDBUF, 'SO_SNDBUFFORCE'),
+                                (rcvbuf, socket.SO_RCVBUF, 'SO_RCVBUFFORCE')):
+        if not size:
+            continue
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, getattr(socket, force), size)
+        except (AttributeError, OSError):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, size)
+            except OSError:
+                pass
+    return (sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+
+
+'''
+Sets the IP don't-fragment bit on everything the socket sends, so that a datagram too big for the path is dropped
+instead of fragmented; that is what makes path MTU probing (PathMTU.py) work. On Linux this is IP_PMTUDISC_PROBE,
+which also ignores the kernel's own path MTU estimate, so only datagrams larger than the interface MTU fail to send
+(with EMSGSIZE). Returns whether the bit could be set.
+'''
+def set_dont_fragment(sock):
+    try:
+        if _LINUX:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+        else:
+            sock.setsockopt(socket.IPPROTO_IP, IP_DONTFRAG, 1)
+        return True
+    except OSError:
+        return False
+
+
+class DatagramIO(object):
+    def __init__(self, sock, sndbuf=None, rcvbuf=None, gso=True, gro=True, bufsize=MAX_DATAGRAM):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.sndbuf, self.rcvbuf = configure_buffers(sock, sndbuf, rcvbuf)
+        sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.gso = gso and _LINUX and hasattr(sock, 'sendmsg')
+        self.gro = False
+        if gro and _LINUX and hasattr(sock, 'recvmsg'):
+            try:
+                sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+                self.gro = True
+                self.bufsize = MAX_DATAGRAM # coalesced reads can be as large as a whole datagram
+            except OSError:
+                pass
+        self.cmsg_size = socket.CMSG_SPACE(_GRO_SIZE.size) if self.gro else 0
+
+    # Make sure datagrams of 'size' bytes fit the receive buffer.
+    def expect(self, size):
+        self.bufsize = max(self.bufsize, min(size, MAX_DATAGRAM))
+
+    def send(self, message, address):
+        while True:
+            try:
+                return self.sock.sendto(message, address)
+            except BlockingIOError:
+                self._wait_writable()
+
+    # Sends a list of (message, address) pairs, in order, with as few system calls as possible.
+    def send_many(self, messages):
+        i = 0
+        while i < len(messages):
+            message, address = messages[i]
+            size = len(message)
+            # a GSO run: packets of one size to one address, optionally ended by one shorter packet
+            j = i + 1
+            limit = min(GSO_MAX_SEGMENTS, GSO_MAX_BYTES // max(size, 1))
+            while (self.gso and j < len(messages) and j - i < limit and messages[j][1] == address and
+                   len(messages[j][0]) <= size):
+                j += 1
+                if len(messages[j - 1][0]) < size:
+                    break
+            if j - i > 1 and self._send_segmented([m for m, a in messages[i:j]], size, address):
+                i = j
+            else:
+                self.send(message, address)
+                i += 1
+
+    def _send_segmented(self, buffers, size, address):
+        control = [(SOL_UDP, UDP_SEGMENT, _GSO_SIZE.pack(size))]
+        while True:
+            try:
+                self.sock.sendmsg(buffers, control, 0, address)
+                return True
+            except BlockingIOError:
+                self._wait_writable()
+            except OSError as e:
+                if e.errno not in GSO_UNSUPPORTED:
+                    raise # e.g. EMSGSIZE after the MTU went down, or ENOBUFS: for the caller, GSO still works
+                # kernel or device without UDP GSO: stop trying
+                self.gso = False
+                return False
+
+    def _wait_writable(self, timeout=0.1):
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.sock, selectors.EVENT_WRITE)
+            selector.select(timeout)
+
+    # Waits up to timeout seconds (None: forever) for one datagram. Returns (message, address) or None.
+    def receive(self, timeout=None):
+        if not self.selector.select(timeout):
+            return None
+        try:
+            return self.sock.recvfrom(self.bufsize)
+        except BlockingIOError:
+            return None
+
+    '''
+    Waits up to timeout seconds for the first datagram, then returns every datagram that is already queued, as a list
+    of (message, address) pairs. The list is empty if nothing arrived in time.
+    '''
+    def receive_many(self, timeout=None, limit=DRAIN_LIMIT):
+        received = []
+        if not self.selector.select(timeout):
+            return received
+        while len(received) < limit:
+            try:
+                if self.gro:
+                    data, ancdata, flags, address = self.sock.recvmsg(self.bufsize, self.cmsg_size)
+                    segment_size = 0
+                    for level, kind, value in ancdata:
+                        if level == SOL_UDP and kind == UDP_GRO:
+                            segment_size = _GRO_SIZE.unpack(value[:_GRO_SIZE.size])[0]
+                    if 0 < segment_size < len(data):
+                        view = memoryview(data)
+                        for offset in range(0, len(data), segment_size):
+                            received.append((view[offset:offset + segment_size], address))
+                        continue
+                else:
+                    data, address = self.sock.recvfrom(self.bufsize)
+                received.append((data, address))
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                continue # ICMP port unreachable from an earlier send (Windows)
+        return received
+
+    def close(self):
+        self.selector.close()
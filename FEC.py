@@ -0,0 +1,159 @@
+'''
+Forward error correction
+On a long path every lost packet costs at least a round trip before its retransmission arrives. With FEC the sender
+follows every block of 'block' data packets with one 'parity' packet, the XOR of the block, and the receiver rebuilds
+a single lost packet of the block from the parity and the others as soon as the parity arrives, without asking for
+a retransmission. Two losses in one block can't be repaired; those packets are retransmitted as usual.
+
+A block is the data packets the sender sends for the first time, in order, so their seqnos are contiguous. The parity
+packet carries the block's first seqno in its header and this payload:
+
+    4 bytes: the seqno just past the block (modulo 2**32)
+    1 byte:  how many data packets the block has
+    the XOR of every packet's payload length (2 bytes), flags (1 byte) and payload, zero padded to the longest one
+
+so a parity packet is at most OVERHEAD bytes longer than the largest packet of its block, and the sender keeps its
+data packets that much smaller. The receiver knows which seqnos of the block it got; the one range it didn't is the
+lost packet, and the XOR of the parity with everything it got is that packet's length, flags and payload (still
+compressed if it was sent compressed).
+
+The block size is either fixed, or adapts to the loss rate the sender sees: about TARGET_LOSSES lost packets per
+block, between MIN_BLOCK and MAX_BLOCK packets. Packets the receiver repaired never show up as losses to the sender,
+so the adaptive block size errs on the large side once FEC is doing its job. Either way the sender keeps a block to
+half its congestion window at most, so a block's parity goes out in the same round trip as its data (and the
+duplicate acks the sender waits for before retransmitting, see Sender.dupack_threshold(), can add up).
+
+Reed-Solomon codes would repair more than one loss per block, but their GF(256) arithmetic costs a Python loop per
+byte; XOR runs on whole packets as big integers.
+'''
+
+import collections
+import struct
+
+import Packet
+
+PARITY = struct.Struct('!IB') # seqno past the block, packets in the block
+PREFIX = struct.Struct('!HB') # payload length, flags
+OVERHEAD = PARITY.size + PREFIX.size
+BLOCK = 8
+MIN_BLOCK = 4
+MAX_BLOCK = 32
+TARGET_LOSSES = 0.25
+LOSS_GAIN = 1.0 / 256 # weight of one packet in the loss rate average
+HISTORY = 1024 # data packets the receiver keeps to repair from
+
+
+# The block size for a loss rate (lost packets per packet sent).
+def block_for(loss):
+    if loss <= 0:
+        return MAX_BLOCK
+    return int(max(MIN_BLOCK, min(MAX_BLOCK, TARGET_LOSSES / loss)))
+
+
+# A packet as the parity covers it: its length, flags and payload as one little endian integer, so XORing payloads
+# of different lengths pads the shorter ones with zeros at the end.
+def _as_int(flags, payload):
+    return int.from_bytes(PREFIX.pack(len(payload), flags) + bytes(payload), 'little')
+
+
+class Encoder(object):
+    def __init__(self, block=BLOCK, adaptive=False):
+        self.size = block # block size asked for
+        self.block = block # size of the block being built
+        self.adaptive = adaptive
+        self.loss = 0.0
+        self.start = None # first seqno of the block being built
+        self.end = None # seqno just past it
+        self.count = 0
+        self.xor = 0
+        self.length = 0 # longest prefix + payload in the block
+
+    # A data packet sent for the first time, covering seqnos [seqno, end). Returns (block start, parity payload) once
+    # the block is complete, else None. A new block is no larger than 'limit' packets.
+    def add(self, seqno, end, flags, payload, limit=MAX_BLOCK):
+        self.loss -= self.loss * LOSS_GAIN
+        if self.start is None or self.end != seqno:
+            # not contiguous with the block (can't happen in order, but never cover a gap): start over
+            self.start = seqno
+            self.count = 0
+            self.xor = 0
+            self.length = 0
+            size = block_for(self.loss) if self.adaptive else self.size
+            self.block = max(1, min(size, limit))
+        self.end = end
+        self.count += 1
+        self.xor ^= _as_int(flags, payload)
+        self.length = max(self.length, PREFIX.size + len(payload))
+        if self.count >= self.block:
+            return self.flush()
+        return None
+
+    # The parity of the packets added since the last one, even if the block isn't full yet (no more data is coming).
+    def flush(self):
+        if self.start is None or not self.count:
+            return None
+        parity = PARITY.pack(self.end % Packet.SEQ_MODULO, self.count) + self.xor.to_bytes(self.length, 'little')
+        start = self.start
+        self.start = None
+        return start, parity
+
+    # The sender declared a packet lost.
+    def on_loss(self):
+        self.loss += LOSS_GAIN
+
+
+class Decoder(object):
+    def __init__(self, history=HISTORY):
+        self.history = history
+        self.packets = collections.OrderedDict() # seqno -> (end, flags, payload), oldest first
+        self.ends = {} # end -> seqno
+
+    # A data packet that arrived, covering seqnos [seqno, end), with the payload as it was sent.
+    def remember(self, seqno, end, flags, payload):
+        if seqno in self.packets:
+            return
+        self.packets[seqno] = (end, flags, bytes(payload))
+        self.ends[end] = seqno
+        while len(self.packets) > self.history:
+            old, (old_end, _, _) = self.packets.popitem(last=False)
+            if self.ends.get(old_end) == old:
+                del self.ends[old_end]
+
+    '''
+    The parity for the block starting at 'start' arrived. Walk the block from both ends over the packets we have; if
+    that leaves exactly one gap and one packet unaccounted for, it is the lost one: returns (seqno, end, flags,
+    payload), [seqno, end) being the gap.
+    Returns None if nothing is missing, more than one packet is, or what's missing was delivered already (below
+    'delivered', the next seqno the connection expects).
+    '''
+    def recover(self, start, parity, delivered):
+        if len(parity) < PARITY.size:
+            return None
+        end, count = PARITY.unpack_from(parity)
+        end = Packet.unwrap_seqno(end, start)
+        packets = self.packets
+        xor = int.from_bytes(parity[PARITY.size:], 'little')
+        found = 0
+        low = start
+        while low < end and low in packets:
+            packet_end, flags, payload = packets[low]
+            xor ^= _as_int(flags, payload)
+            found += 1
+            low = packet_end
+        high = end
+        while high > low and high in self.ends:
+            seqno = self.ends[high]
+            packet_end, flags, payload = packets[seqno]
+            xor ^= _as_int(flags, payload)
+            found += 1
+            high = seqno
+        if high <= low or found != count - 1 or low < delivered:
+            return None
+        try:
+            data = xor.to_bytes(len(parity) - PARITY.size, 'little')
+        except OverflowError:
+            return None # we got a packet longer than any in the block: not the packets the parity was made of
+        length, flags = PREFIX.unpack_from(data)
+        if PREFIX.size + length > len(data) or (not flags & Packet.FLAG_COMPRESSED and length != high - low):
+            return None # not what the gap can hold: the block wasn't what we thought
+        return low, high, flags, data[PREFIX.size:PREFIX.size + length]
@@ -0,0 +1,312 @@
+'''
+Network impairment proxy
+A UDP proxy for testing on one machine without any external tools: point the Sender at the proxy's port and the proxy
+forwards its packets to the Receiver, and the answers back, after running every packet through an emulated link:
+
+    loss        drop the packet
+    reorder     hold the packet back for another reorder_delay seconds, so the ones after it overtake it
+    duplicate   deliver the packet twice
+    corrupt     flip one random bit (the checksum has to catch it)
+    delay       one way delay in seconds, plus a random extra of up to jitter seconds
+    rate        bandwidth cap in bits per second: packets queue up behind each other, and once more than
+                queue_bytes are waiting new ones are dropped, like a router with a drop tail queue
+    mtu         largest IP packet (our packet plus 28 bytes of IP and UDP header) the link carries; bigger ones
+                are dropped, as a router does with the don't-fragment bit set (see PathMTU.py)
+
+loss, reorder, duplicate and corrupt are probabilities. Each direction is its own link with the same profile, shared
+by every flow going through the proxy (one bottleneck). Every sender address gets its own socket towards the receiver,
+so the receiver still sees separate senders and stripes as separate flows.
+
+stats counts packets and bytes per direction, what the link did to them, and the data packets the sender sent more
+than once (by seqno, before any impairment) so the retransmission ratio can be worked out from the outside, and the
+FEC parity packets it sent (see FEC.py).
+
+    python ImpairmentProxy.py -p 33123 -t 33122 -P wan
+    python ImpairmentProxy.py -p 33123 -t 33122 -l 0.01 -y 0.02 -j 0.002 -b 100M
+'''
+
+import collections
+import getopt
+import heapq
+import random
+import selectors
+import socket
+import struct
+import sys
+import time
+
+import DatagramIO
+import Pacing
+import Packet
+
+MAX_DATAGRAM = 65535
+IP_UDP_HEADERS = 28
+REPORT_INTERVAL = 5.0
+
+
+class Profile(object):
+    def __init__(self, loss=0.0, reorder=0.0, duplicate=0.0, corrupt=0.0, delay=0.0, jitter=0.0, rate=None,
+                 queue_bytes=256 << 10, reorder_delay=0.005, mtu=None):
+        self.loss = loss
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.corrupt = corrupt
+        self.delay = delay
+        self.jitter = jitter
+        self.rate = rate
+        self.queue_bytes = queue_bytes
+        self.reorder_delay = reorder_delay
+        self.mtu = mtu
+
+    def describe(self):
+        return dict(self.__dict__)
+
+
+PROFILES = {
+    'clean': Profile(),
+    'lossy': Profile(loss=0.01),
+    'wan': Profile(delay=0.02, jitter=0.002, rate=100e6),
+    'reorder': Profile(reorder=0.05, delay=0.002),
+    'harsh': Profile(loss=0.03, reorder=0.02, duplicate=0.01, corrupt=0.005, delay=0.01, jitter=0.005, rate=200e6),
+    'satellite': Profile(loss=0.01, delay=0.3, jitter=0.005, rate=50e6, queue_bytes=1 << 20)
+}
+
+
+# The seqno of a data packet in either wire format, or None for anything else.
+def data_seqno(message):
+    if len(message) >= Packet.HEADER_SIZE and message[0] == Packet.TYPE_CODES['data']:
+        return struct.unpack_from('!I', message, 4)[0]
+    if message.startswith(b'data|'):
+        end = message.find(b'|', 5)
+        if end > 5 and message[5:end].isdigit():
+            return int(message[5:end])
+    return None
+
+
+class ImpairmentProxy(object):
+    def __init__(self, listenport, target, profile=None, seed=None, host='127.0.0.1', debug=False):
+        self.target = target # (address, port) of the receiver
+        self.profile = profile or Profile()
+        self.random = random.Random(seed)
+        self.host = host
+        self.debug = debug
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, listenport))
+        DatagramIO.configure_buffers(self.sock, DatagramIO.DEFAULT_BUFFER, DatagramIO.DEFAULT_BUFFER)
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ, None)
+        self.upstreams = {} # sender address -> our socket towards the receiver
+        self.link_free = {'forward': 0.0, 'reverse': 0.0} # when each link has sent everything queued on it
+        self.queue = [] # heap of (delivery time, n, socket, address, packet)
+        self.sent = 0
+        self.seen = collections.defaultdict(set) # sender address -> data seqnos it has sent
+        self.stats = collections.Counter()
+        self.running = False
+
+    # Serve until stop() is called (from another thread) or for 'duration' seconds.
+    def serve(self, duration=None):
+        self.running = True
+        end = time.monotonic() + duration if duration is not None else None
+        report = time.monotonic() + REPORT_INTERVAL
+        while self.running:
+            now = time.monotonic()
+            if end is not None and now >= end:
+                break
+            timeout = 0.05
+            if self.queue:
+                timeout = min(timeout, max(0.0, self.queue[0][0] - now))
+            for key, events in self.selector.select(timeout):
+                self._drain(key.fileobj, key.data)
+            self._deliver(time.monotonic())
+            if self.debug and time.monotonic() >= report:
+                report += REPORT_INTERVAL
+                print(dict(self.stats))
+        self.close()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        self.selector.close()
+        self.sock.close()
+        for upstream in self.upstreams.values():
+            upstream.close()
+        self.upstreams = {}
+
+    # Everything waiting on one of our sockets: from a sender if client is None, else from the receiver to client.
+    def _drain(self, sock, client):
+        while True:
+            try:
+                message, address = sock.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionRefusedError:
+                continue # ICMP port unreachable from an earlier send, the receiver isn't up (yet)
+            if client is None:
+                self._count_data(address, message)
+                self._impair('forward', message, self._upstream(address), self.target)
+            else:
+                self._impair('reverse', message, self.sock, client)
+
+    def _upstream(self, client):
+        upstream = self.upstreams.get(client)
+        if upstream is None:
+            upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            upstream.bind((self.host, 0))
+            DatagramIO.configure_buffers(upstream, DatagramIO.DEFAULT_BUFFER, DatagramIO.DEFAULT_BUFFER)
+            upstream.setblocking(False)
+            self.selector.register(upstream, selectors.EVENT_READ, client)
+            self.upstreams[client] = upstream
+        return upstream
+
+    def _count_data(self, address, message):
+        seqno = data_seqno(message)
+        if seqno is None:
+            if message[:1] == bytes([Packet.TYPE_CODES['parity']]):
+                self.stats['parity_packets'] += 1
+                self.stats['parity_bytes'] += len(message)
+            return
+        self.stats['data_packets'] += 1
+        seen = self.seen[address]
+        if seqno in seen:
+            self.stats['data_retransmits'] += 1
+        else:
+            seen.add(seqno)
+
+    # Runs one packet through the link of its direction and schedules whatever copies of it survive.
+    def _impair(self, direction, message, sock, address):
+        profile = self.profile
+        rng = self.random
+        now = time.monotonic()
+        self.stats[direction + '_packets'] += 1
+        self.stats[direction + '_bytes'] += len(message)
+        if profile.mtu and len(message) + IP_UDP_HEADERS > profile.mtu:
+            self.stats['too_big'] += 1
+            return
+        if profile.loss and rng.random() < profile.loss:
+            self.stats['lost'] += 1
+            return
+        departure = now
+        if profile.rate:
+            start = max(now, self.link_free[direction])
+            if (start - now) * profile.rate / 8 > profile.queue_bytes:
+                self.stats['queue_drops'] += 1
+                return
+            departure = self.link_free[direction] = start + len(message) * 8 / profile.rate
+        arrival = departure + profile.delay
+        if profile.jitter:
+            arrival += rng.random() * profile.jitter
+        if profile.reorder and rng.random() < profile.reorder:
+            self.stats['reordered'] += 1
+            arrival += profile.reorder_delay
+        copies = 1
+        if profile.duplicate and rng.random() < profile.duplicate:
+            self.stats['duplicated'] += 1
+            copies = 2
+        for n in range(copies):
+            packet = message
+            if profile.corrupt and rng.random() < profile.corrupt and len(message) > 0:
+                self.stats['corrupted'] += 1
+                packet = bytearray(message)
+                bit = rng.randrange(len(packet) * 8)
+                packet[bit // 8] ^= 1 << (bit % 8)
+            self.sent += 1
+            heapq.heappush(self.queue, (arrival, self.sent, sock, address, packet))
+
+    def _deliver(self, now):
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            arrival, n, sock, address, packet = heapq.heappop(queue)
+            try:
+                sock.sendto(packet, address)
+            except (BlockingIOError, ConnectionRefusedError):
+                self.stats['send_drops'] += 1 # full socket buffer: the packet is lost like on a real link
+            except OSError:
+                self.stats['send_drops'] += 1
+
+
+if __name__ == "__main__":
+    def usage():
+        print("Network impairment proxy")
+        print("-p PORT | --port=PORT The port senders send to, defaults to 33123")
+        print("-a ADDRESS | --address=ADDRESS The receiver address, defaults to localhost")
+        print("-t PORT | --target=PORT The receiver port, defaults to 33122")
+        print("-P PROFILE | --profile=PROFILE Start from a named profile: %s" % ", ".join(sorted(PROFILES)))
+        print("-l RATE | --loss=RATE Probability of dropping a packet")
+        print("-r RATE | --reorder=RATE Probability of holding a packet back so later ones overtake it")
+        print("-u RATE | --duplicate=RATE Probability of delivering a packet twice")
+        print("-x RATE | --corrupt=RATE Probability of flipping a bit in a packet")
+        print("-y SECONDS | --delay=SECONDS One way delay")
+        print("-j SECONDS | --jitter=SECONDS Random extra delay of up to this much")
+        print("-b BITS | --bandwidth=BITS Bandwidth cap in bits per second, k/M/G suffixes allowed")
+        print("-q BYTES | --queue=BYTES Bytes queued at the bandwidth cap before packets are dropped")
+        print("-m BYTES | --mtu=BYTES Largest IP packet the link carries")
+        print("-s SEED | --seed=SEED Random seed, for repeatable runs")
+        print("-d | --debug Print statistics every %d seconds" % REPORT_INTERVAL)
+        print("-h | --help Print this usage message")
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "p:a:t:P:l:r:u:x:y:j:b:q:m:s:dh",
+                                   ["port=", "address=", "target=", "profile=", "loss=", "reorder=", "duplicate=",
+                                    "corrupt=", "delay=", "jitter=", "bandwidth=", "queue=", "mtu=", "seed=", "debug",
+                                    "help"])
+    except getopt.GetoptError:
+        usage()
+        exit()
+
+    port = 33123
+    address = 'localhost'
+    target = 33122
+    seed = None
+    debug = False
+    profile = Profile()
+    settings = {}
+
+    for o, a in opts:
+        if o in ("-p", "--port"):
+            port = int(a)
+        elif o in ("-a", "--address"):
+            address = a
+        elif o in ("-t", "--target"):
+            target = int(a)
+        elif o in ("-P", "--profile"):
+            if a not in PROFILES:
+                usage()
+                exit()
+            profile = Profile(**PROFILES[a].describe())
+        elif o in ("-l", "--loss"):
+            settings['loss'] = float(a)
+        elif o in ("-r", "--reorder"):
+            settings['reorder'] = float(a)
+        elif o in ("-u", "--duplicate"):
+            settings['duplicate'] = float(a)
+        elif o in ("-x", "--corrupt"):
+            settings['corrupt'] = float(a)
+        elif o in ("-y", "--delay"):
+            settings['delay'] = float(a)
+        elif o in ("-j", "--jitter"):
+            settings['jitter'] = float(a)
+        elif o in ("-b", "--bandwidth"):
+            settings['rate'] = Pacing.parse_rate(a)
+        elif o in ("-q", "--queue"):
+            settings['queue_bytes'] = int(a)
+        elif o in ("-m", "--mtu"):
+            settings['mtu'] = int(a)
+        elif o in ("-s", "--seed"):
+            seed = int(a)
+        elif o in ("-d", "--debug"):
+            debug = True
+        else:
+            usage()
+            exit()
+    # options given on their own override the profile's
+    for key, value in settings.items():
+        setattr(profile, key, value)
+
+    proxy = ImpairmentProxy(port, (socket.gethostbyname(address), target), profile, seed, debug=debug)
+    try:
+        proxy.serve()
+    except KeyboardInterrupt:
+        print(dict(proxy.stats))
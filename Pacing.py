@@ -0,0 +1,81 @@
+'''
+Send pacing
+Spreads the sender's packets out over time instead of putting the whole congestion window on the wire back to back,
+so a big window doesn't overflow the receiver's socket buffer or a shallow switch queue in one burst.
+
+A Pacer is a token bucket: tokens (bytes) come in at the pacing rate, every packet sent takes its size out, and the
+sender only sends while there are tokens left (the last packet may take the bucket below zero, the next one waits
+until it is paid off). The rate is the lower of
+    - the congestion controller's own pacing rate (BBR), or else the congestion window over the smoothed RTT, times
+      SLOW_START_GAIN or AVOIDANCE_GAIN so pacing never holds the window back (like Linux's tcp_pacing_*_ratio)
+    - an explicit cap (Sender --rate), for background transfers that should leave room for other traffic
+Before the first RTT sample there is nothing to derive a rate from, so only the cap applies.
+
+The bucket holds QUANTUM seconds worth of tokens (at least MIN_BURST packets): packets leave in small bursts that
+still go out in one sendmmsg/GSO call (see DatagramIO.py), and the sender only sleeps (in the select() it waits for
+acks in anyway) when the next burst is due. Time comes from time.monotonic(), which is a vDSO read with nanosecond
+resolution on Linux, not a system call, so pacing costs no system call per packet.
+'''
+
+SLOW_START_GAIN = 2.0
+AVOIDANCE_GAIN = 1.2
+QUANTUM = 0.002 # seconds of data the bucket can hold
+MIN_BURST = 4 # packets
+
+
+# '100M' -> 100000000.0 (bits per second)
+def parse_rate(text):
+    scale = {'k': 1e3, 'm': 1e6, 'g': 1e9}.get(text[-1:].lower())
+    return float(text[:-1]) * scale if scale else float(text)
+
+
+# Bytes per second to pace a congestion window of 'cwnd' packets of 'packet_size' bytes at, None without an RTT yet.
+def window_rate(cwnd, packet_size, srtt, slow_start):
+    if not srtt:
+        return None
+    return (SLOW_START_GAIN if slow_start else AVOIDANCE_GAIN) * cwnd * packet_size / srtt
+
+
+class Pacer(object):
+    def __init__(self, cap=None):
+        self.cap = cap # bytes per second, None for no cap
+        self.rate = None # bytes per second in effect, None while not pacing
+        self.depth = 0.0
+        self.tokens = 0.0
+        self.stamp = None
+
+    # Pace at 'rate' bytes per second (capped), or only at the cap if rate is None.
+    def set_rate(self, rate, packet_size, now):
+        if self.cap is not None and (rate is None or rate > self.cap):
+            rate = self.cap
+        self._refill(now)
+        if rate is None:
+            self.rate = None
+            return
+        self.depth = max(rate * QUANTUM, MIN_BURST * packet_size)
+        if self.rate is None:
+            self.tokens = self.depth # pacing just started: the first burst can go right away
+        self.rate = rate
+        self.tokens = min(self.tokens, self.depth)
+
+    def _refill(self, now):
+        if self.rate is not None and self.stamp is not None:
+            self.tokens = min(self.depth, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready(self, now):
+        if self.rate is None:
+            return True
+        self._refill(now)
+        return self.tokens > 0
+
+    def consume(self, size):
+        if self.rate is not None:
+            self.tokens -= size
+
+    # Seconds until the next packet may be sent (0 if it may go now).
+    def delay(self, now):
+        if self.rate is None:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens > 0 else (-self.tokens + 1) / self.rate
@@ -0,0 +1,196 @@
+'''
+Packet formats
+Both ends understand two wire formats and answer a peer in the format it spoke:
+
+Legacy (text) format:
+    msgtype|seqno|data|checksum
+    where checksum is the decimal CRC32 of everything up to and including the last '|'.
+
+Binary format, a fixed 12 byte header followed by the raw payload:
+    1 byte: msgtype (high bit always set, so it can never be mistaken for a legacy packet)
+    1 byte: flags
+    2 bytes: payload length
+    4 bytes: seqno (modulo 2**32, see unwrap_seqno)
+    4 bytes: checksum over the first 8 header bytes and the payload; CRC32 unless the connection
+             negotiated another algorithm (see Checksum.py). 'start' packets and their acks always use CRC32.
+
+The sender opens with a binary 'start' and only falls back to the legacy format when the
+receiver never answers it. The start payload is the filename, optionally followed by
+newline separated key=value options (see encode_start/decode_start). Binary packets may carry up
+to the payload size negotiated with the 'mss' option; 'probe' packets find out how much of that the path allows.
+A receiver that accepted the 'window' option starts its acks with the receive window it advertises (FLAG_WINDOW):
+how many bytes beyond the cumulative ack it can take, as a 4 byte number ahead of any SACK blocks.
+'''
+
+import struct
+
+import Checksum
+
+LEGACY = 0
+BINARY = 1
+
+TYPE_CODES = {
+    'start': 0x81,
+    'data': 0x82,
+    'end': 0x83,
+    'ack': 0x84,
+    'probe': 0x85, # path MTU probe and its answer, outside the sequence space (see PathMTU.py)
+    'parity': 0x86 # XOR of a block of data packets (see FEC.py)
+}
+TYPE_NAMES = dict((code, name) for name, code in TYPE_CODES.items())
+
+# msgtype, flags, length, seqno, checksum
+HEADER = struct.Struct('!BBHII')
+HEADER_SIZE = HEADER.size
+_PREFIX = struct.Struct('!BBHI')
+_CRC = struct.Struct('!I')
+
+SEQ_MODULO = 1 << 32
+MAX_PAYLOAD = 0xffff
+
+# flags
+FLAG_SACK = 0x01 # ack payload is a list of SACK blocks
+FLAG_COMPRESSED = 0x02 # data payload is a compressed chunk (see Compression.py)
+FLAG_WINDOW = 0x04 # ack payload starts with the advertised receive window
+
+# advertised receive window in bytes, see split_window()
+WINDOW = struct.Struct('!I')
+MAX_WINDOW = 0xffffffff
+
+# SACK blocks are (start, end) seqno pairs of data held beyond the cumulative ack, end exclusive
+SACK_BLOCK = struct.Struct('!II')
+MAX_SACK_BLOCKS = 16
+
+
+def is_binary(message):
+    return len(message) > 0 and (message[0] & 0x80) != 0
+
+
+# Builds a packet in the requested format. The payload may be any bytes-like object. checksum is one of
+# Checksum.ALGORITHMS and only applies to the binary format.
+def make(fmt, msg_type, seqno, payload=b'', flags=0, checksum=Checksum.crc32):
+    if fmt == BINARY:
+        return make_binary(msg_type, seqno, payload, flags, checksum)
+    return make_legacy(msg_type, seqno, payload)
+
+
+def make_header(msg_type, seqno, payload=b'', flags=0, checksum=Checksum.crc32):
+    prefix = _PREFIX.pack(TYPE_CODES[msg_type], flags, len(payload), seqno % SEQ_MODULO)
+    return prefix + _CRC.pack(checksum(prefix, payload))
+
+
+def make_binary(msg_type, seqno, payload=b'', flags=0, checksum=Checksum.crc32):
+    return b''.join((make_header(msg_type, seqno, payload, flags, checksum), payload))
+
+
+def make_legacy(msg_type, seqno, payload=b''):
+    head = b''.join([msg_type.encode(), b'|', str(seqno).encode(), b'|'])
+    crc = Checksum.crc32(head, payload, b'|')
+    return b''.join([head, payload, b'|', str(crc).encode()])
+
+
+'''
+Parses a packet of either format without copying the payload.
+Returns (msg_type, seqno, data, flags, valid) where data is a memoryview into the message.
+Raises ValueError if the message cannot be parsed at all.
+'''
+def parse(message, checksum=Checksum.crc32):
+    if is_binary(message):
+        return parse_binary(message, checksum)
+    return parse_legacy(message)
+
+
+# True for binary 'start' packets, which are always checksummed with CRC32.
+def is_start(message):
+    return len(message) > 0 and message[0] == TYPE_CODES['start']
+
+
+def parse_binary(message, checksum=Checksum.crc32):
+    view = memoryview(message)
+    if len(view) < HEADER_SIZE:
+        raise ValueError("short packet (%d bytes)" % len(view))
+    code, flags, length, seqno, crc = HEADER.unpack_from(view)
+    if code not in TYPE_NAMES:
+        raise ValueError("unknown packet type 0x%02x" % code)
+    data = view[HEADER_SIZE:HEADER_SIZE + length]
+    valid = (len(data) == length and
+             checksum(view[:_PREFIX.size], data) == crc)
+    return TYPE_NAMES[code], seqno, data, flags, valid
+
+
+def parse_legacy(message):
+    if isinstance(message, memoryview):
+        message = message.tobytes()  # a slice of a coalesced (GRO) receive buffer
+    first = message.index(b'|')  # first two fields are always msg type and seqno
+    second = message.index(b'|', first + 1)
+    last = message.rindex(b'|')  # last is always the checksum
+    if last <= second:
+        last = second + 1  # no data field at all, e.g. 'ack|seqno|checksum'
+    view = memoryview(message)
+    msg_type = bytes(view[:first]).decode()
+    seqno = int(view[first + 1:second])
+    data = view[second + 1:last]  # everything in between is considered data
+    valid = Checksum.validate_checksum(message)
+    return msg_type, seqno, data, 0, valid
+
+
+'''
+Binary seqnos only carry the low 32 bits. Recover the full value as the one closest to
+'expected', the same way TCP and QUIC cope with wrapping sequence spaces.
+'''
+def unwrap_seqno(seqno, expected):
+    candidate = (expected & ~(SEQ_MODULO - 1)) | (seqno % SEQ_MODULO)
+    if candidate <= expected - SEQ_MODULO // 2:
+        candidate += SEQ_MODULO
+    elif candidate > expected + SEQ_MODULO // 2:
+        candidate -= SEQ_MODULO
+    return candidate
+
+
+def encode_sack(blocks):
+    return b''.join(SACK_BLOCK.pack(start % SEQ_MODULO, end % SEQ_MODULO)
+                    for start, end in blocks[:MAX_SACK_BLOCKS])
+
+
+# Decodes SACK blocks, unwrapping their seqnos relative to the cumulative ack they arrived with.
+def decode_sack(data, ackno):
+    blocks = []
+    for offset in range(0, len(data) - SACK_BLOCK.size + 1, SACK_BLOCK.size):
+        start, end = SACK_BLOCK.unpack_from(data, offset)
+        start = unwrap_seqno(start, ackno)
+        blocks.append((start, start + (end - start) % SEQ_MODULO))
+    return blocks
+
+
+# Splits an ack payload into (advertised window, rest of the payload), the window being None without FLAG_WINDOW.
+def split_window(data, flags):
+    if not flags & FLAG_WINDOW or len(data) < WINDOW.size:
+        return None, data
+    return WINDOW.unpack_from(data)[0], data[WINDOW.size:]
+
+
+def encode_start(filename, options=None):
+    lines = [filename.encode('utf-8')]
+    for key, value in (options or {}).items():
+        lines.append(("%s=%s" % (key, value)).encode('utf-8'))
+    return b'\n'.join(lines)
+
+
+def decode_start(data):
+    lines = bytes(data).decode('utf-8').split('\n')
+    return lines[0], decode_options(lines[1:])
+
+
+def encode_options(options):
+    return '\n'.join("%s=%s" % (key, value) for key, value in options.items()).encode('utf-8')
+
+
+def decode_options(data):
+    if not isinstance(data, list):
+        data = bytes(data).decode('utf-8').split('\n')
+    options = {}
+    for line in data:
+        if '=' in line:
+            key, value = line.split('=', 1)
+            options[key] = value
+    return options
@@ -0,0 +1,91 @@
+'''
+Packetization layer path MTU discovery
+Finds the largest payload that makes it to the receiver without IP fragmentation, in the spirit of RFC 8899
+(DPLPMTUD). Sizes here are payload bytes per packet, not including our header or the IP and UDP headers.
+
+    - the sender starts at the base size that works on any ordinary Ethernet path
+    - it probes larger sizes with 'probe' packets (padding only, outside the sequence space, sent with the IP
+      don't-fragment bit set) that the receiver answers; the first probe goes straight for the maximum the two ends
+      negotiated, after that the search halves the remaining range
+    - a size whose probe goes unanswered MAX_PROBES times in a row (or that the local interface refuses) is too big
+    - once the search has converged it starts over after RAISE_INTERVAL, in case the path changed
+    - black_hole(): the sender's packets of the current size keep getting lost, so go back to the base size
+      and search again
+'''
+
+BASE_SIZE = 1458 # 1500 byte Ethernet MTU minus IP, UDP and our 12 byte header (with a little slack)
+MAX_SIZE = 8960 # 9000 byte jumbo frames
+MAX_PROBES = 3
+SEARCH_GRANULARITY = 32 # stop searching when the range left is this small
+RAISE_INTERVAL = 600.0
+BLACK_HOLE_DELAY = 30.0 # how long to wait after a black hole before searching again
+
+
+class PathMTU(object):
+    def __init__(self, base=BASE_SIZE, maximum=BASE_SIZE):
+        self.base = min(base, maximum)
+        self.maximum = maximum
+        self.size = self.base # largest payload known to get through
+        self.high = maximum # smallest size known not to, minus one
+        self.probe_size = None # size of the probe in flight
+        self.probe_id = 0
+        self.attempts = 0
+        self.deadline = None # when the probe in flight counts as lost
+        self.search_at = 0.0 # when to (re)start probing
+
+    def searching(self, now):
+        return self.high - self.size >= SEARCH_GRANULARITY and now >= self.search_at
+
+    # Size of the next probe to send now, or None. 'timeout' is how long to wait for its answer.
+    def next_probe(self, now, timeout):
+        if self.probe_size is None:
+            if not self.searching(now):
+                if self.high - self.size < SEARCH_GRANULARITY and now >= self.search_at:
+                    # converged: look again later in case the path got better
+                    self.search_at = now + RAISE_INTERVAL
+                    self.high = self.maximum
+                return None
+            self.probe_size = self.high if self.size == self.base and self.high == self.maximum else \
+                (self.size + self.high + 1) // 2
+            self.attempts = 0
+        elif self.deadline is not None and now < self.deadline:
+            return None
+        self.attempts += 1
+        self.probe_id += 1
+        self.deadline = now + timeout
+        return self.probe_size
+
+    def next_deadline(self):
+        return self.deadline if self.probe_size is not None else None
+
+    def on_probe_ack(self, probe_id, now):
+        if self.probe_size is None or probe_id != self.probe_id:
+            return False
+        self.size = self.probe_size
+        self.probe_size = None
+        self.deadline = None
+        return True
+
+    # The probe in flight wasn't answered in time (or couldn't even be sent).
+    def on_probe_timeout(self, now):
+        if self.probe_size is None:
+            return
+        if self.attempts >= MAX_PROBES:
+            self.high = self.probe_size - 1
+            self.probe_size = None
+            self.deadline = None
+        else:
+            self.deadline = now # send it again right away
+
+    # The probe in flight couldn't be sent at all (EMSGSIZE): it's too big, no need to try it again.
+    def on_probe_error(self):
+        if self.probe_size is not None:
+            self.attempts = MAX_PROBES
+            self.on_probe_timeout(None)
+
+    def black_hole(self, now):
+        self.size = self.base
+        self.high = self.maximum
+        self.probe_size = None
+        self.deadline = None
+        self.search_at = now + BLACK_HOLE_DELAY
@@ -0,0 +1,52 @@
+'''
+Round trip time estimation
+Keeps a smoothed RTT and RTT variance the way TCP does (RFC 6298) and turns them into a
+retransmission timeout (RTO). Every timeout doubles the RTO (exponential backoff). Samples must
+never be taken from retransmitted segments (Karn's rule); the sender enforces that when it calls
+sample(). A timeout requeues every packet in flight, so none of the acks that follow it are
+samples until packets sent after the retransmissions are acknowledged (and a legacy receiver, which
+doesn't buffer or SACK, still discards everything after a hole, so all of those are resent too).
+That can take several round trips, so the backoff is dropped as soon as an ack makes forward
+progress (like QUIC's PTO) instead of waiting for a sample.
+'''
+
+class RTTEstimator(object):
+    ALPHA = 1.0 / 8
+    BETA = 1.0 / 4
+    K = 4
+
+    def __init__(self, initial=1.0, minimum=0.2, maximum=60.0, granularity=0.001):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.latest = None
+        self.base_rto = initial
+        self.backoffs = 0
+        self.rto = self._clamp(initial)
+
+    # Feed a new round trip measurement (in seconds) from a segment that was only sent once.
+    def sample(self, rtt):
+        self.latest = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.base_rto = self.srtt + max(self.granularity, self.K * self.rttvar)
+        self.reset_backoff()
+
+    # A retransmission timer expired: back off until the path shows signs of life again.
+    def backoff(self):
+        self.backoffs = min(self.backoffs + 1, 16)
+        self.rto = self._clamp(self.base_rto * (2 ** self.backoffs))
+
+    # New data was acknowledged, so the path works and the backed-off timeout is no longer needed.
+    def reset_backoff(self):
+        self.backoffs = 0
+        self.rto = self._clamp(self.base_rto)
+
+    def _clamp(self, rto):
+        return min(max(rto, self.minimum), self.maximum)
@@ -1,35 +1,161 @@
+import bisect
+import collections
 import getopt
 import socket
 import sys
 import time
 
+import Checkpoint
 import Checksum
+import Compression
+import DatagramIO
+import FEC
+import Packet
+import Session
+import Sink
+import Trace
 
 '''
 Modified Receiver
 Editors: Reuben Sonnenberg and Devon Olson
 The "ack" and "handle..." methods were modified most.
+
+Senders that negotiate 'sack' in their start packet get out-of-order buffering: packets beyond a hole are kept (up
+to max_buf_size of them), acks carry the next expected seqno (a cumulative ack) and the payload lists SACK blocks
+for the data held beyond it. Out-of-order data is not kept in memory but written straight to its place in the output
+file; the in-order data is batched by the connection's FileSink (see Sink.py). The 'end' packet then takes up one
+seqno so that its arrival can be acknowledged cumulatively too. Everyone else gets the original in-order-only
+behaviour, acking the seqno of the packet received.
+
+A striped transfer sends one file as several connections, each carrying one byte range (a stripe) of it. Their start
+packets name the same file and carry the transfer ID, the stripe number, the number of stripes, the stripe's offset
+and the file size. Each stripe's connection writes its range straight into the shared output file; none of them
+truncates it, so the stripes need no shared state and may even be handled by different ReceiverPool workers.
+
+A sender that asks to resume ('resume' start option, with its file's size and mtime) gets a checkpoint of the
+received byte ranges kept next to the output file (see Checkpoint.py). If an earlier, interrupted transfer of the
+same version of the file left one, the start ack tells the sender the offset to resume from, and the connection
+carries on writing the existing output file from there, just like a stripe that starts at that offset. Any other
+transfer to the same output file discards the checkpoint, since it rewrites the data the checkpoint describes.
+
+Packets are taken off the socket in batches (see DatagramIO.py) and the acks for a batch are sent together afterwards.
+
+A binary sender offers the largest payload it would like to send per packet ('mss' start option). We accept up to
+max_payload of it, grow the socket's receive buffer to match and answer the sender's path MTU probes (see PathMTU.py)
+with an empty 'probe' packet carrying the same seqno, so it can find out how much of that the path allows.
+
+A SACK sender that offers the 'window' option gets a receive window in every ack (FLAG_WINDOW, see Packet.py): the
+bytes beyond the cumulative ack we can still take, which is the connection's window less whatever data the
+FileSink's writer thread (-w) still has to write. A slow disk then shrinks the window down to zero and the sender
+waits for it, probing now and then, instead of having its packets dropped; once the backlog has drained, the
+receive loop tells it so with a window update (see poll_connections()). The window is only advice: data beyond it
+is still taken if it arrives.
+
+A SACK sender that offers the 'fec' option follows its data with 'parity' packets (see FEC.py). The connection then
+keeps its most recent data packets as they arrived, and when a parity packet shows exactly one packet of its block
+missing, that packet is rebuilt and handled as if it had arrived, before the sender ever retransmits it.
+
+A sender that offers the 'session' option sends any number of items over the connection (see Session.py). Its data
+goes through a SessionSink instead of a FileSink, which hands each item to the receiver's consumer (a callable, see
+Session.py for how it's called), or writes it to out_<name> if there is none.
 '''
 
+# Out-of-order packets buffered per SACK connection
+SACK_BUFFER_PACKETS = 8192
+# Largest payload per packet we accept from a sender
+MAX_PAYLOAD = DatagramIO.MAX_UDP_PAYLOAD - Packet.HEADER_SIZE
+# Receive buffer until a sender negotiates larger packets; plenty for legacy packets
+RECEIVE_BUFFER = 4096
+# Receive window advertised to senders that ask for one, in bytes, while nothing is waiting for the disk
+RECEIVE_WINDOW = 8 << 20
+# Largest file size a sender may announce (the largest file offset there is)
+MAX_FILE_SIZE = (1 << 63) - 1
+# How often the receive loop looks for data to write and windows to reopen while there are some (see
+# poll_connections())
+POLL_INTERVAL = 0.05
+# What Connection.stats counts (see Connection.get_stats())
+COUNTERS = ('packets', 'duplicates', 'out_of_order', 'buffer_drops', 'checksum_failures', 'delivered_bytes',
+            'acks_sent', 'zero_windows', 'fec_recovered')
+
+
+def output_path(filename):
+    return "out_{0}".format(filename)
+
+
 class Connection():
-    def __init__(self,host,port,start_seq,filename,debug=False):
+    def __init__(self,host,port,start_seq,filename,debug=False,fmt=Packet.LEGACY,sack=False,size=None,
+                 writer_thread=False,files=None,stripe_offset=None,checksum=Checksum.DEFAULT,codec=None,
+                 checkpoint=None,window=None,fec=False,session=False,consumer=None):
         self.debug = debug
+        self.format = fmt # wire format this sender speaks, acks are sent back in it
+        self.sack = sack
+        self.checksum_name = checksum # binary checksum algorithm for everything after the start
+        self.checksum = Checksum.get(checksum)
+        self.codec = codec # compression codec of FLAG_COMPRESSED packets, if the sender asked for one
         self.updated = time.time()
+        self.started = self.updated
+        self.ended = None
+        self.stats = collections.Counter() # see COUNTERS
         self.current_seqno = start_seq # expect to ack from the start_seqno
         self.host = host
         self.port = port
-        self.max_buf_size = 5
-        self.outfile = open("out_{0}".format(filename),"wb")
+        self.max_buf_size = SACK_BUFFER_PACKETS if sack else 5
+        self.receive_window = window # bytes to advertise in acks, None if the sender didn't ask for a window
+        self.advertised = None # the window our last ack advertised
+        self.fec = FEC.Decoder() if fec else None # recent data packets to rebuild lost ones from parity
+        self.data_start = start_seq + len(filename.encode('utf-8')) # seqno of the first byte of the file
+        # file offset of data_start; only stripes and resumed transfers don't start at the beginning of the file
+        self.file_offset = stripe_offset or 0
+        striped = stripe_offset is not None
+        self.size = size
+        self.checkpoint = checkpoint
+        if checkpoint is not None:
+            self.file_offset = checkpoint.offset()
+        self.session = session # the data is a session's items, not a file
+        if session:
+            self.sink = Session.SessionSink((host, port), consumer, output_path, debug, background=writer_thread,
+                                            pool=files)
+        else:
+            self.sink = Sink.FileSink(output_path(filename), background=writer_thread, pool=files,
+                                      offset=self.file_offset, truncate=not striped and self.file_offset == 0)
+            if checkpoint is not None:
+                checkpoint.claim()
+            else:
+                # this transfer rewrites the output file, so an older transfer's checkpoint no longer describes it
+                Checkpoint.discard(output_path(filename))
+        if striped and size:
+            # every stripe sets the final length, dropping whatever an older, longer file had beyond it
+            try:
+                self.sink.resize(size)
+            except OSError:
+                self.sink.close() # the start fails, nothing will write to the file
+                raise
+        if size and not session:
+            # the sender told us how big the file is
+            self.sink.preallocate(size)
         self.seqnums = {} # enforce single instance of each seqno
+        self.sack_ranges = [] # sorted [start, end) seqno ranges buffered beyond current_seqno
+        self.latest_range = None # start of the range the last out-of-order packet went into
+        self.mss = None # negotiated payload size limit, None if the sender didn't ask (no path MTU probes then)
+        self.finished = False
 
-    def ack(self,seqno, data):
+    def ack(self,seqno, data, end=False):
+        if self.sack:
+            return self._sack_ack(seqno, data, end)
         res_data = []
         self.updated = time.time()
+        self.stats['packets'] += 1
+        if seqno < self.current_seqno:
+            self.stats['duplicates'] += 1
+        elif seqno > self.current_seqno:
+            self.stats['out_of_order'] += 1 # and dropped, we only take packets in order
         # if the sequence number of the received packet is larger than the current sequence number and
         # the window size is not exceeded
         if (seqno == self.current_seqno) and self.seqnums.__len__() <= self.max_buf_size:
             # Add the data to the window with the sequence number as the lookup value
             self.seqnums[seqno] = data
+            if end:
+                self.finished = True
             # Then, for every sequence number
             for n in sorted(self.seqnums.keys()):
                 # If the sequence number is equal to the one we need
@@ -47,47 +173,179 @@ class Connection():
         # note: we return the sequence number of the last packet received
         return (self.current_seqno - len(data)), res_data
 
+    '''
+    Out-of-order aware version of ack(): keeps track of packets beyond a hole and returns the cumulative ack, i.e. the
+    next seqno we expect, along with all the data that became deliverable in order. Out-of-order data goes straight
+    to its offset in the output file and only its length is remembered; record() then just moves past it.
+    A buffered 'end' is kept as None.
+    '''
+    def _sack_ack(self, seqno, data, end=False):
+        res_data = []
+        self.updated = time.time()
+        self.stats['packets'] += 1
+        if seqno == self.current_seqno:
+            self.seqnums[seqno] = None if end else data
+        elif seqno < self.current_seqno or seqno in self.seqnums:
+            self.stats['duplicates'] += 1
+        elif self.seqnums.__len__() >= self.max_buf_size:
+            self.stats['buffer_drops'] += 1
+        else:
+            self.stats['out_of_order'] += 1
+            if end:
+                self.seqnums[seqno] = None
+            else:
+                self.sink.write_at(self.file_offset + seqno - self.data_start, data)
+                self.seqnums[seqno] = len(data)
+            self._add_range(seqno, seqno + (1 if end else len(data)))
+
+        # deliver everything that is now in order
+        while self.current_seqno in self.seqnums:
+            data = self.seqnums.pop(self.current_seqno)
+            if data is None:
+                self.finished = True
+                self.current_seqno += 1
+            else:
+                res_data.append(data)
+                self.current_seqno += data if isinstance(data, int) else len(data)
+        while self.sack_ranges and self.sack_ranges[0][1] <= self.current_seqno:
+            del self.sack_ranges[0]
+
+        if self.debug:
+            print("next seqno should be %d, %d packets buffered" % (self.current_seqno, self.seqnums.__len__()))
+        return self.current_seqno, res_data
+
+    # Merge [start, end) into the sorted, non-overlapping list of buffered ranges.
+    def _add_range(self, start, end):
+        ranges = self.sack_ranges
+        i = bisect.bisect_left(ranges, [start, end])
+        if i > 0 and ranges[i - 1][1] >= start:
+            i -= 1
+        else:
+            ranges.insert(i, [start, end])
+        ranges[i][0] = min(ranges[i][0], start)
+        ranges[i][1] = max(ranges[i][1], end)
+        while i + 1 < len(ranges) and ranges[i + 1][0] <= ranges[i][1]:
+            ranges[i][1] = max(ranges[i][1], ranges[i + 1][1])
+            del ranges[i + 1]
+        self.latest_range = ranges[i][0]
+
+    # SACK blocks for the next ack: the block holding the latest arrival first (RFC 2018), then the lowest ones.
+    def sack_blocks(self):
+        blocks = [(start, end) for start, end in self.sack_ranges]
+        for i, block in enumerate(blocks):
+            if block[0] == self.latest_range:
+                blocks.insert(0, blocks.pop(i))
+                break
+        return blocks[:Packet.MAX_SACK_BLOCKS]
+
+    # Bytes beyond the cumulative ack we can take: the receive window less what the writer thread hasn't caught up
+    # with yet (data the sink is only holding to write in bigger batches doesn't count, it's written soon anyway).
+    def window(self):
+        return max(0, self.receive_window - self.sink.queued())
+
+    # Writes in-order data; an int stands for that many bytes that are already on disk.
     def record(self,data):
-        self.outfile.write(data)
-        self.outfile.flush()
+        if isinstance(data, int):
+            self.sink.skip_to(self.sink.position + data)
+            self.stats['delivered_bytes'] += data
+        else:
+            self.sink.write(data)
+            self.stats['delivered_bytes'] += len(data)
+        if self.checkpoint is not None and self.checkpoint.due(self.sink.position):
+            self.save_checkpoint()
+
+    # Sync the output file, then record what is in it: everything up to the in-order position plus the out-of-order
+    # ranges written beyond it.
+    def save_checkpoint(self):
+        self.sink.sync()
+        ranges = [[0, self.sink.position]]
+        for start, end in self.sack_ranges:
+            ranges.append([self.file_offset + start - self.data_start,
+                           min(self.file_offset + end - self.data_start, self.size)])
+        if not self.checkpoint.save(ranges):
+            # another transfer has rewritten or resumed the output file since: it isn't ours to describe any more
+            if self.debug:
+                print("%s: checkpoint %s taken over, not saving it" % ((self.host, self.port), self.checkpoint.path))
+            self.checkpoint = None
+
+    # The whole file is on disk: no resuming needed any more.
+    def complete(self):
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
+
+    '''
+    Counters and current state of the connection as a dict: the counters in self.stats, plus
+        elapsed:      seconds since the start arrived (until the connection ended, once it has)
+        goodput:      bytes written in order per second
+        next_seqno:   the next seqno we expect
+        buffered:     packets held beyond a hole
+        window:       the receive window we'd advertise now (None if the sender didn't ask for one)
+        items:        a session's items received completely (None if it isn't a session)
+        finished:     whether the 'end' has arrived
+    '''
+    def get_stats(self):
+        stats = dict.fromkeys(COUNTERS, 0)
+        stats.update(self.stats)
+        elapsed = (self.ended if self.ended is not None else time.time()) - self.started
+        stats.update(elapsed=elapsed, goodput=stats['delivered_bytes'] / elapsed if elapsed > 0 else 0.0,
+                     next_seqno=self.current_seqno, buffered=len(self.seqnums),
+                     window=self.window() if self.receive_window is not None else None,
+                     items=self.sink.items if self.session else None, finished=self.finished)
+        return stats
 
     def end(self):
-        self.outfile.close()
+        self.ended = time.time()
+        if self.checkpoint is not None and not self.finished:
+            self.save_checkpoint()
+        self.sink.close()
+        if self.finished:
+            self.complete()
 
 class Receiver():
-    def __init__(self,listenport=33122,debug=False,timeout=10):
+    def __init__(self,listenport=33122,debug=False,timeout=10,writer_thread=False,
+                 sndbuf=DatagramIO.DEFAULT_BUFFER,rcvbuf=DatagramIO.DEFAULT_BUFFER,reuse_port=False,
+                 max_payload=MAX_PAYLOAD, trace=None, window=RECEIVE_WINDOW, consumer=None):
         self.debug = debug
+        self.writer_thread = writer_thread # write output files from background threads
         self.timeout = timeout
         self.last_cleanup = time.time()
         self.port = listenport
         self.host = ''
         self.s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.s.settimeout(timeout)
+        if reuse_port:
+            # several receiver processes share the port; the kernel keeps each sender on one of them
+            self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.s.bind((self.host,self.port))
+        self.max_payload = max_payload
+        self.window = window # receive window for senders that ask for one
+        self.consumer = consumer # gets the items of sessions, which are written to files without one
+        # structured event trace of every connection (see Trace.py), None unless a path is given
+        self.trace = Trace.open_trace(trace, 'Receiver', 'server')
+        self.io = DatagramIO.DatagramIO(self.s, sndbuf, rcvbuf, bufsize=RECEIVE_BUFFER)
+        self.outbox = [] # (ack, address) pairs waiting for the end of the current batch
+        self.waiting = False # poll_connections() wants to run again soon
         self.connections = {} # schema is {(address, port) : Connection}
+        self.stats = collections.Counter() # packets, invalid, payload_bytes, decompressed_bytes, acks, connections,
+                                           # probes, parity
         self.MESSAGE_HANDLER = {
             'start' : self._handle_start,
             'data' : self._handle_data,
             'end' : self._handle_end,
-            'ack' : self._handle_ack
+            'ack' : self._handle_ack,
+            'probe' : self._handle_probe,
+            'parity' : self._handle_parity
         }
 
     def start(self):
         while True:
             try:
-                # Receive the message and where it came from
-                message, address = self.receive()
-                # Split the message up into it's appropriate parts
-                msg_type, seqno, data, checksum = self._split_message(message)
-                if debug:
-                    print('Received message: {0} {1} {2} {3} {4}'.format(msg_type, seqno, data, sys.getsizeof(data), checksum))
-                if Checksum.validate_checksum(message):
-                    # If the checksum checks out, handle the message using one of the following methods defined by the
-                    # MESSAGE_HANDLER dictionary.
-                    self.MESSAGE_HANDLER.get(msg_type,self._handle_other)(seqno, data, address)
-                elif self.debug:
-                    print("checksum failed: %s" % message)
+                # Receive every message that is waiting and where each came from
+                for message, address in self.receive_many():
+                    self._handle_message(message, address)
+                # tell senders whose window has opened up again, then send all of the acks at once
+                self.waiting = self.poll_connections()
+                self.flush()
 
                 # If the timeout happens, do a cleanup.
                 if time.time() - self.last_cleanup > self.timeout:
@@ -95,75 +353,313 @@ class Receiver():
             except socket.timeout:
                 self._cleanup()
             except (KeyboardInterrupt, SystemExit):
+                for address, conn in self.connections.items():
+                    conn.end()
+                    self._closed(address, conn)
+                if self.trace is not None:
+                    self.trace.close()
                 exit()
-            except ValueError as e:
+
+    def _handle_message(self, message, address):
+        try:
+            # Split the message up into it's appropriate parts
+            msg_type, seqno, data, flags, valid = self._split_message(message, self._checksum_for(message, address))
+            fmt = Packet.BINARY if Packet.is_binary(message) else Packet.LEGACY
+            self.stats['packets'] += 1
+            if self.debug:
+                print('Received message: {0} {1} {2} bytes'.format(msg_type, seqno, len(data)))
+            if valid:
+                if self.trace is not None:
+                    self.trace.event('transport:packet_received', connection='%s:%d' % address, type=msg_type,
+                                     seqno=seqno, length=len(data))
+                # If the checksum checks out, handle the message using one of the following methods defined by the
+                # MESSAGE_HANDLER dictionary.
+                self.MESSAGE_HANDLER.get(msg_type,self._handle_other)(seqno, data, address, fmt, flags)
+            else:
+                self.stats['invalid'] += 1
+                conn = self.connections.get(address)
+                if conn is not None:
+                    conn.stats['checksum_failures'] += 1
+                if self.trace is not None:
+                    self.trace.event('transport:packet_dropped', connection='%s:%d' % address, trigger='checksum',
+                                     length=len(message))
                 if self.debug:
-                    print(e)
-                pass # ignore
+                    print("checksum failed (%d bytes)" % len(message))
+        except ValueError as e:
+            if self.debug:
+                print(e)
+            pass # ignore
+        except (OSError, OverflowError) as e:
+            # the connection's file couldn't be written: that's the end of the connection, not of the receiver
+            self._fail(address, e)
 
     # waits until packet is received to return
     def receive(self):
-        return self.s.recvfrom(4096)
+        received = self.io.receive(self.timeout)
+        if received is None:
+            raise socket.timeout()
+        return received
+
+    # waits until a packet is received, then returns it with every other packet that has already arrived; while
+    # poll_connections() has something to look after again soon, it only waits POLL_INTERVAL and may return nothing
+    def receive_many(self):
+        if self.waiting:
+            return self.io.receive_many(POLL_INTERVAL)
+        received = self.io.receive_many(self.timeout)
+        if not received:
+            raise socket.timeout()
+        return received
 
-    # sends a message to the specified address. Addresses are in the format:
+    # queues a message for the specified address; flush() sends the queue. Addresses are in the format:
     #   (IP address, port number)
     def send(self, message, address):
-        self.s.sendto(message, address)
+        self.outbox.append((message, address))
+
+    # sends every queued message, as few system calls as possible
+    def flush(self):
+        if self.outbox:
+            self.io.send_many(self.outbox)
+            self.outbox = []
+
+    # this sends an ack message to address with specified seqno, in the sender's wire format
+    def _send_ack(self, seqno, address, fmt=Packet.LEGACY, data=b'', flags=0, checksum=Checksum.crc32):
+        self.stats['acks'] += 1
+        self.send(Packet.make(fmt, 'ack', seqno, data, flags, checksum), address)
 
-    # this sends an ack message to address with specified seqno
-    def _send_ack(self, seqno, address):
-        m = b"".join([b'ack|', bytes(str(seqno).encode()), b'|'])
-        checksum = Checksum.generate_checksum(m)
-        #message = "%s%s" % (m, checksum)
-        message = m + checksum
-        self.send(message, address)
+    # acks a packet of an established connection, with SACK blocks and our receive window if the sender asked for them
+    def _ack_connection(self, conn, ackno, address):
+        conn.stats['acks_sent'] += 1
+        window = conn.window() if conn.receive_window is not None else None
+        conn.advertised = window
+        if window == 0:
+            conn.stats['zero_windows'] += 1
+        if self.trace is not None:
+            self.trace.event('transport:packet_sent', connection='%s:%d' % address, type='ack', seqno=ackno,
+                             sack_blocks=len(conn.sack_ranges), window=window)
+        if conn.sack:
+            data = Packet.encode_sack(conn.sack_blocks())
+            flags = Packet.FLAG_SACK
+            if window is not None:
+                data = Packet.WINDOW.pack(window) + data
+                flags |= Packet.FLAG_WINDOW
+            self._send_ack(ackno, address, conn.format, data, flags, conn.checksum)
+        else:
+            self._send_ack(ackno, address, conn.format, checksum=conn.checksum)
+
+    # Whatever held the connection's data back (the disk, or a consumer, see AsyncReceiver.items()) may have caught
+    # up: once the window has grown by half since we last advertised it, tell the sender with a repeat of our last
+    # ack, so it doesn't have to wait for its next window probe.
+    def window_update(self, address):
+        conn = self.connections.get(address)
+        if (conn is not None and conn.advertised is not None and
+                conn.window() - conn.advertised >= conn.receive_window // 2):
+            self._ack_connection(conn, conn.current_seqno, address)
+
+    # Between batches: write in-order data that has waited long enough for more to come along (see
+    # Sink.FileSink.flush_if_due()), and send window updates to the senders whose window we narrowed while their data
+    # waited for the disk (-w) or a consumer, once it has caught up. Returns whether any data or sender is still
+    # waiting.
+    def poll_connections(self):
+        waiting = False
+        failed = []
+        for address, conn in self.connections.items():
+            try:
+                if conn.sink.flush_if_due():
+                    waiting = True
+            except (OSError, OverflowError) as e:
+                failed.append((address, e))
+                continue
+            if conn.advertised is not None and conn.advertised < conn.receive_window // 2:
+                self.window_update(address)
+                waiting = waiting or conn.advertised < conn.receive_window // 2
+        for address, error in failed:
+            self._fail(address, error)
+        return waiting
 
-    def _handle_start(self, seqno, data, address):
+    def _handle_start(self, seqno, data, address, fmt, flags):
+        options = {}
+        if fmt == Packet.BINARY:
+            # binary starts carry options after the filename; only the filename takes up sequence space
+            filename, options = Packet.decode_start(data)
+            data = filename.encode('utf-8')
+        else:
+            filename = bytes(data).decode()
         if not address in self.connections:
-            self.connections[address] = Connection(address[0],address[1],seqno,data.decode(),self.debug)
+            self.connections[address] = self.new_connection(address, seqno, filename, fmt, options)
+            self.stats['connections'] += 1
         conn = self.connections[address]
         ackno, res_data = conn.ack(seqno,data)
-        for l in res_data:
-            if self.debug:
-                print(data)
-        self._send_ack(ackno, address)
+        # tell a binary sender which of its options we accepted
+        accepted = {}
+        if conn.sack:
+            accepted['sack'] = 1
+        if 'stripe' in options:
+            accepted['stripe'] = options['stripe']
+        if 'checksum' in options:
+            accepted['checksum'] = conn.checksum_name
+        if conn.codec:
+            accepted['compress'] = conn.codec
+        if conn.checkpoint is not None:
+            accepted['resume'] = conn.file_offset
+        if 'mss' in options and fmt == Packet.BINARY:
+            conn.mss = max(1, min(int(options['mss']), self.max_payload))
+            self.expect_payload(conn.mss)
+            accepted['mss'] = conn.mss
+        if conn.receive_window is not None:
+            accepted['window'] = conn.window()
+        if conn.fec is not None:
+            accepted['fec'] = 1
+        if conn.session:
+            accepted['session'] = 1
+        self._send_ack(ackno, address, conn.format, Packet.encode_options(accepted) if accepted else b'')
+
+    def new_connection(self, address, seqno, filename, fmt, options):
+        return Connection(address[0],address[1],seqno,filename,self.debug,fmt,
+                          sack=options.get('sack') == '1',
+                          size=self.file_size(options),
+                          writer_thread=self.writer_thread,
+                          stripe_offset=self.stripe_offset(address, filename, options),
+                          checksum=Checksum.negotiate(options.get('checksum')) or Checksum.DEFAULT,
+                          codec=self.codec_for(options),
+                          checkpoint=self.checkpoint_for(filename, options),
+                          window=self.window_for(options),
+                          fec=self.fec_for(options),
+                          session=options.get('session') == '1',
+                          consumer=self.consumer)
+
+    # The file size the sender announced (0 if it didn't). It comes straight from the peer, so anything a file can't
+    # be rejects the start (ValueError) before it gets near the file system.
+    def file_size(self, options):
+        size = int(options.get('size', 0))
+        if not 0 <= size <= MAX_FILE_SIZE:
+            raise ValueError("bad file size %d in start" % size)
+        return size
+
+    # A receive window is only advertised along with SACK, whose acks it rides on.
+    def window_for(self, options):
+        if options.get('window') == '1' and options.get('sack') == '1':
+            return self.window
+        return None
+
+    # Parity packets only help a connection that can hold packets beyond a hole, i.e. one with SACK.
+    def fec_for(self, options):
+        return options.get('fec') == '1' and options.get('sack') == '1'
+
+    # Resuming needs the file's size and version, and doesn't mix with striping or sessions.
+    def checkpoint_for(self, filename, options):
+        if options.get('resume') != '1' or 'stripe' in options or 'session' in options or not options.get('size'):
+            return None
+        checkpoint = Checkpoint.open_checkpoint(output_path(filename), int(options['size']), options.get('mtime'))
+        if self.debug and checkpoint.offset():
+            print("resuming %s at %d" % (filename, checkpoint.offset()))
+        return checkpoint
+
+    # Compression is only accepted along with SACK, which the sender's compressed segments rely on.
+    def codec_for(self, options):
+        codec = options.get('compress')
+        if codec in Compression.CODECS and options.get('sack') == '1':
+            return codec
+        return None
+
+    # The file offset a stripe of a striped transfer starts at, or None for an ordinary transfer (or a session).
+    def stripe_offset(self, address, filename, options):
+        if 'stripe' not in options or 'session' in options:
+            return None
+        if self.debug:
+            print("%s: stripe %s of %s of transfer %s of %s, offset %s" % (address, options['stripe'],
+                  options.get('stripes'), options.get('transfer'), filename, options.get('offset')))
+        # a stripe starts inside the file (or right at its end, for an empty last stripe)
+        offset = int(options.get('offset', 0))
+        if not 0 <= offset <= (self.file_size(options) or MAX_FILE_SIZE):
+            raise ValueError("bad stripe offset %d in start" % offset)
+        return offset
 
     # ignore packets from uninitiated connections
-    def _handle_data(self, seqno, data, address):
+    def _handle_data(self, seqno, data, address, fmt, flags):
         if address in self.connections:
             conn = self.connections[address]
+            if fmt == Packet.BINARY:
+                seqno = Packet.unwrap_seqno(seqno, conn.current_seqno)
+            self.stats['payload_bytes'] += len(data)
+            payload = data
+            if flags & Packet.FLAG_COMPRESSED:
+                if not conn.codec:
+                    return
+                # decompress on the way to the file; the packet stands for all of the raw data
+                data = Compression.decompress(conn.codec, data)
+                self.stats['decompressed_bytes'] += len(data)
+            if conn.fec is not None:
+                conn.fec.remember(seqno, seqno + len(data), flags, payload)
             ackno,res_data = conn.ack(seqno,data)
             for l in res_data:
-                if self.debug:
-                    print(l)
                 conn.record(l)
-            self._send_ack(ackno, address)
+            self._ack_connection(conn, ackno, address)
 
     # handle end packets
-    def _handle_end(self, seqno, data, address):
+    def _handle_end(self, seqno, data, address, fmt, flags):
         if address in self.connections:
             conn = self.connections[address]
-            ackno, res_data = conn.ack(seqno,data)
+            if fmt == Packet.BINARY:
+                seqno = Packet.unwrap_seqno(seqno, conn.current_seqno)
+            ackno, res_data = conn.ack(seqno,data,end=True)
             for l in res_data:
-                if self.debug:
-                    print(l)
                 conn.record(l)
-            self._send_ack(ackno, address)
+            # make sure the whole file is on disk before the sender is told it is done
+            conn.sink.flush(wait=True)
+            if conn.finished:
+                conn.complete()
+            self._ack_connection(conn, ackno, address)
+
+    # make room in the receive buffer for packets with this much payload
+    def expect_payload(self, size):
+        self.io.expect(Packet.HEADER_SIZE + size)
+
+    # answer a path MTU probe; the padding is just thrown away
+    def _handle_probe(self, seqno, data, address, fmt, flags):
+        conn = self.connections.get(address)
+        if conn is not None and conn.mss is not None:
+            self.stats['probes'] += 1
+            self.send(Packet.make(fmt, 'probe', seqno, b'', 0, conn.checksum), address)
+
+    # rebuild the one packet of the parity's block we're missing, if that's all we're missing
+    def _handle_parity(self, seqno, data, address, fmt, flags):
+        conn = self.connections.get(address)
+        if conn is None or conn.fec is None:
+            return
+        self.stats['parity'] += 1
+        rebuilt = conn.fec.recover(Packet.unwrap_seqno(seqno, conn.current_seqno), data, conn.current_seqno)
+        if rebuilt is None:
+            return
+        lost, end, flags, payload = rebuilt
+        if flags & Packet.FLAG_COMPRESSED and (not conn.codec or
+                                               len(Compression.decompress(conn.codec, payload)) != end - lost):
+            return
+        conn.stats['fec_recovered'] += 1
+        if self.trace is not None:
+            self.trace.event('recovery:packet_recovered', connection='%s:%d' % address, seqno=lost,
+                             length=len(payload))
+        if self.debug:
+            print("rebuilt %d from parity" % lost)
+        self._handle_data(lost % Packet.SEQ_MODULO, payload, address, fmt, flags)
 
     # I'll do the ack-ing here, buddy
-    def _handle_ack(self, seqno, data, address):
+    def _handle_ack(self, seqno, data, address, fmt, flags):
         pass
 
     # handler for packets with unrecognized type
-    def _handle_other(self, seqno, data, address):
+    def _handle_other(self, seqno, data, address, fmt, flags):
         pass
 
-    def _split_message(self, message):
-        pieces = message.split(b'|')
-        msg_type, seqno = pieces[0:2]  # first two elements always treated as msg type and seqno
-        checksum = pieces[-1]  # last is always treated as checksum
-        data = b'|'.join(pieces[2:-1])  # everything in between is considered data
-        return msg_type.decode(), int(seqno), data, checksum
+    # Returns (msg_type, seqno, data, flags, valid) for either wire format without copying the data
+    def _split_message(self, message, checksum=Checksum.crc32):
+        return Packet.parse(message, checksum)
+
+    # The checksum algorithm a packet from this address was made with: the connection's, except for 'start' packets.
+    def _checksum_for(self, message, address):
+        conn = self.connections.get(address)
+        if conn is None or Packet.is_start(message):
+            return Checksum.crc32
+        return conn.checksum
 
     def _cleanup(self):
         if self.debug:
@@ -174,21 +670,54 @@ class Receiver():
             if now - conn.updated > self.timeout:
                 if self.debug:
                     print("killed connection to %s (%.2f old)" % (address, now - conn.updated))
-                conn.end()
-                del self.connections[address]
+                self._drop(address)
         self.last_cleanup = now
 
+    def _drop(self, address):
+        conn = self.connections.pop(address)
+        conn.end()
+        self._closed(address, conn)
+
+    # A connection ran into an error it can't go on from (or a start couldn't open one): forget it, keeping whatever
+    # it already wrote.
+    def _fail(self, address, error):
+        if self.debug:
+            print("%s: connection failed: %s" % (address, error))
+        if address in self.connections:
+            try:
+                self._drop(address)
+            except (OSError, OverflowError):
+                pass # it failed writing, it may well fail flushing too
+
+    # A connection is gone for good: report what it did.
+    def _closed(self, address, conn):
+        if self.debug or self.trace is not None:
+            stats = conn.get_stats()
+            if self.trace is not None:
+                self.trace.event('transport:connection_closed', connection='%s:%d' % address, **stats)
+                self.trace.flush()
+            if self.debug:
+                print("%s: %d packets, %d duplicates, %d out of order, %d bytes in %.3fs, %.2f MB/s" %
+                      (address, stats['packets'], stats['duplicates'], stats['out_of_order'],
+                       stats['delivered_bytes'], stats['elapsed'], stats['goodput'] / 1e6))
+
 if __name__ == "__main__":
     def usage():
         print("BEARS-TP Receiver")
         print("-p PORT | --port=PORT The listen port, defaults to 33122")
         print("-t TIMEOUT | --timeout=TIMEOUT Receiver timeout in seconds")
+        print("-w | --writer-thread Write output files from background threads")
+        print("-b BYTES | --buffer=BYTES Socket send and receive buffer size, defaults to %d" % DatagramIO.DEFAULT_BUFFER)
+        print("-s BYTES | --segment-size=BYTES Largest payload per packet to accept, defaults to %d" % MAX_PAYLOAD)
+        print("-T FILE | --trace=FILE Write a JSON lines event trace of every connection to FILE")
+        print("-W BYTES | --window=BYTES Receive window advertised to senders, defaults to %d" % RECEIVE_WINDOW)
         print("-d | --debug Print debug messages")
         print("-h | --help Print this usage message")
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                               "p:dt:", ["port=", "debug=", "timeout="])
+                               "p:dt:wb:s:T:W:", ["port=", "debug=", "timeout=", "writer-thread", "buffer=",
+                                                  "segment-size=", "trace=", "window="])
     except:
         usage()
         exit()
@@ -196,16 +725,32 @@ if __name__ == "__main__":
     port = 33122
     debug = False
     timeout = 10
+    writer_thread = False
+    buffer_size = DatagramIO.DEFAULT_BUFFER
+    max_payload = MAX_PAYLOAD
+    trace = None
+    window = RECEIVE_WINDOW
 
     for o,a in opts:
         if o in ("-p", "--port="):
             port = int(a)
         elif o in ("-t", "--timeout="):
             timeout = int(a)
+        elif o in ("-w", "--writer-thread"):
+            writer_thread = True
+        elif o in ("-b", "--buffer"):
+            buffer_size = int(a)
+        elif o in ("-s", "--segment-size"):
+            max_payload = int(a)
+        elif o in ("-T", "--trace"):
+            trace = a
+        elif o in ("-W", "--window"):
+            window = int(a)
         elif o in ("-d", "--debug="):
             debug = True
         else:
             print(usage())
             exit()
-    r = Receiver(port, debug, timeout)
+    r = Receiver(port, debug, timeout, writer_thread, buffer_size, buffer_size, max_payload=max_payload, trace=trace,
+                 window=window)
     r.start()
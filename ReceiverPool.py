@@ -0,0 +1,181 @@
+'''
+Multi-core receiver
+Runs N receiver worker processes that all bind the same port with SO_REUSEPORT (Linux 3.9+, the BSDs). The kernel
+picks a worker by hashing the sender's address and port, so every packet of a connection lands on the same worker and
+each worker owns its own Connection objects: nothing is shared and nothing is locked.
+
+The supervisor only looks after the workers:
+    - starts them, restarts any that die, and stops them all on SIGINT/SIGTERM
+    - collects the statistics each worker reports every few seconds and prints their sum
+
+    python ReceiverPool.py -p PORT -n WORKERS [-a]
+'''
+
+import collections
+import getopt
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+import AsyncReceiver
+import Receiver
+
+REPORT_INTERVAL = 5.0
+
+
+# A copy of a receiver's statistics taken from another thread. The receive loop goes on counting meanwhile, and the
+# first time it counts something new the Counter grows under the copy (RuntimeError): just copy it again.
+def _snapshot(stats):
+    while True:
+        try:
+            return dict(stats)
+        except RuntimeError:
+            pass
+
+
+def _worker(slot, port, timeout, use_async, reports, interval):
+    # the supervisor stops workers with SIGTERM; turn it into the receivers' normal KeyboardInterrupt shutdown
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    if use_async:
+        receiver = AsyncReceiver.AsyncReceiver(port, timeout=timeout, reuse_port=True)
+    else:
+        receiver = Receiver.Receiver(port, timeout=timeout, reuse_port=True)
+
+    def report():
+        while True:
+            time.sleep(interval)
+            reports.put((slot, _snapshot(receiver.stats)))
+    threading.Thread(target=report, daemon=True).start()
+    try:
+        receiver.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        # already stopping: a SIGTERM now would only lose the last report
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        reports.put((slot, _snapshot(receiver.stats)))
+
+
+class ReceiverPool(object):
+    def __init__(self, listenport=33122, workers=None, timeout=10, use_async=False, interval=REPORT_INTERVAL,
+                 debug=False):
+        self.port = listenport
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.use_async = use_async
+        self.interval = interval
+        self.debug = debug
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self.reports = self.context.Queue()
+        self.processes = [None] * self.workers
+        self.latest = [collections.Counter() for n in range(self.workers)] # last report of each running worker
+        self.retired = collections.Counter() # totals of workers that have exited
+        self.stopping = False
+
+    def _spawn(self, slot):
+        process = self.context.Process(target=_worker, name="receiver-%d" % slot,
+                                       args=(slot, self.port, self.timeout, self.use_async, self.reports,
+                                             self.interval))
+        process.start()
+        self.processes[slot] = process
+
+    # Combined statistics of every worker, past and present.
+    def stats(self):
+        total = collections.Counter(self.retired)
+        for counts in self.latest:
+            total.update(counts)
+        return total
+
+    def start(self):
+        def stop(signum, frame):
+            self.stopping = True
+        signal.signal(signal.SIGTERM, stop)
+        for slot in range(self.workers):
+            self._spawn(slot)
+        last_print = time.monotonic()
+        try:
+            while not self.stopping:
+                self._collect(0.5)
+                for slot, process in enumerate(self.processes):
+                    if not process.is_alive() and not self.stopping:
+                        print("worker %d exited with %s, restarting" % (slot, process.exitcode))
+                        self._retire(slot)
+                        self._spawn(slot)
+                if self.debug and time.monotonic() - last_print >= self.interval:
+                    print(self._format(self.stats()))
+                    last_print = time.monotonic()
+        except KeyboardInterrupt:
+            pass
+        self.shutdown()
+
+    def shutdown(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join()
+        self._collect(0)
+        print(self._format(self.stats()))
+
+    def _collect(self, timeout):
+        while True:
+            try:
+                slot, counts = self.reports.get(timeout=timeout)
+            except queue.Empty:
+                return
+            self.latest[slot] = collections.Counter(counts)
+            timeout = 0
+
+    def _retire(self, slot):
+        self._collect(0)
+        self.retired.update(self.latest[slot])
+        self.latest[slot] = collections.Counter()
+
+    def _format(self, stats):
+        return "%d workers: " % self.workers + ", ".join("%s %d" % (key, stats[key]) for key in sorted(stats))
+
+
+if __name__ == "__main__":
+    def usage():
+        print("BEARS-TP multi-core Receiver")
+        print("-p PORT | --port=PORT The listen port, defaults to 33122")
+        print("-n WORKERS | --workers=WORKERS Worker processes, defaults to the number of CPUs")
+        print("-t TIMEOUT | --timeout=TIMEOUT Receiver timeout in seconds")
+        print("-a | --async Run asyncio receivers (AsyncReceiver.py) in the workers")
+        print("-d | --debug Print combined statistics every %d seconds" % REPORT_INTERVAL)
+        print("-h | --help Print this usage message")
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "p:n:t:ad", ["port=", "workers=", "timeout=", "async", "debug"])
+    except:
+        usage()
+        exit()
+
+    port = 33122
+    workers = None
+    timeout = 10
+    use_async = False
+    debug = False
+
+    for o,a in opts:
+        if o in ("-p", "--port"):
+            port = int(a)
+        elif o in ("-n", "--workers"):
+            workers = int(a)
+        elif o in ("-t", "--timeout"):
+            timeout = int(a)
+        elif o in ("-a", "--async"):
+            use_async = True
+        elif o in ("-d", "--debug"):
+            debug = True
+        else:
+            usage()
+            exit()
+    ReceiverPool(port, workers, timeout, use_async, debug=debug).start()
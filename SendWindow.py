@@ -0,0 +1,176 @@
+'''
+Send window
+The sender's sliding window: a fixed capacity ring of Segment records in seqno order plus a
+seqno index, so that every per-packet operation is O(1) (or O(log n) for timers) no matter how
+large the congestion window grows:
+    - append()/release(): add at the tail, slide the head forward
+    - find()/index_of(): look a packet up by seqno
+    - next_unsent()/take_unsent(): only ever look at packets waiting to go out (lost ones first)
+    - expired()/next_deadline(): retransmission timers kept in a heap, stale entries skipped lazily
+The window also keeps count of the packets in flight.
+'''
+
+import collections
+import heapq
+
+class Segment(object):
+    __slots__ = ('seqno', 'data', 'payload', 'msg_type', 'ordinal', 'in_flight', 'sent_at', 'deadline',
+                 'transmissions', 'sacked', 'queued')
+
+    def __init__(self, msg_type, seqno, data, payload=None):
+        self.seqno = seqno
+        self.data = data
+        self.payload = payload # compressed form of data to send instead, if any
+        self.msg_type = msg_type
+        self.ordinal = 0 # position in the stream of appended segments
+        self.in_flight = False # sent and neither acknowledged nor declared lost
+        self.sent_at = 0.0 # when it was last put on the wire
+        self.deadline = 0.0 # when its retransmission timer expires
+        self.transmissions = 0
+        self.sacked = False # receiver holds it beyond a hole; never resent
+        self.queued = False # waiting in one of the unsent queues
+
+    # Karn's rule: acks for packets sent more than once are ambiguous and can't be RTT samples
+    def retransmitted(self):
+        return self.transmissions > 1
+
+    def ever_sent(self):
+        return self.transmissions > 0
+
+
+class SendWindow(object):
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ring = [None] * capacity
+        self.head = 0 # ring slot of the oldest segment
+        self.count = 0
+        self.base = 0 # ordinal of the oldest segment
+        self.by_seqno = {}
+        self.in_flight = 0
+        self.newest_sent = None # the highest segment sent so far
+        self.unsent = collections.deque() # never sent yet, in seqno order
+        self.lost = collections.deque() # declared lost, resent before anything new
+        self.timers = [] # heap of (deadline, ordinal, segment)
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("send window index out of range")
+        return self.ring[(self.head + index) % self.capacity]
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.ring[(self.head + index) % self.capacity]
+
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, segment):
+        if self.full():
+            raise OverflowError("send window is full (%d segments)" % self.capacity)
+        segment.ordinal = self.base + self.count
+        self.ring[(self.head + self.count) % self.capacity] = segment
+        self.count += 1
+        self.by_seqno[segment.seqno] = segment
+        segment.queued = True
+        self.unsent.append(segment)
+
+    # Slide the window past its oldest segment and return it.
+    def release(self):
+        segment = self.ring[self.head]
+        self.ring[self.head] = None
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        self.base += 1
+        del self.by_seqno[segment.seqno]
+        if segment.in_flight:
+            segment.in_flight = False
+            self.in_flight -= 1
+        segment.queued = False
+        return segment
+
+    def find(self, seqno):
+        return self.by_seqno.get(seqno)
+
+    # Window index of the first segment whose seqno is not below the given one.
+    def index_of(self, seqno):
+        segment = self.by_seqno.get(seqno)
+        if segment is not None:
+            return segment.ordinal - self.base
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle].seqno < seqno:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def sent(self, segment, now, deadline):
+        if not segment.in_flight:
+            segment.in_flight = True
+            self.in_flight += 1
+        segment.transmissions += 1
+        if self.newest_sent is None or segment.ordinal > self.newest_sent.ordinal:
+            self.newest_sent = segment
+        segment.sent_at = now
+        segment.deadline = deadline
+        heapq.heappush(self.timers, (deadline, segment.ordinal, segment))
+
+    # The receiver reported holding the segment, so it is neither in flight nor ever to be resent.
+    def sack(self, segment):
+        segment.sacked = True
+        if segment.in_flight:
+            segment.in_flight = False
+            self.in_flight -= 1
+
+    # Take a segment out of flight and queue it for retransmission ahead of new data.
+    def lose(self, segment):
+        if segment.in_flight:
+            segment.in_flight = False
+            self.in_flight -= 1
+        if not segment.queued:
+            segment.queued = True
+            self.lost.append(segment)
+
+    def _live(self, segment):
+        return segment.ordinal >= self.base and not segment.sacked
+
+    # The next segment waiting to be sent (lost ones first), or None.
+    def next_unsent(self):
+        for queue in (self.lost, self.unsent):
+            while queue:
+                segment = queue[0]
+                if self._live(segment) and not segment.in_flight:
+                    return segment
+                queue.popleft().queued = False
+        return None
+
+    # Remove the segment returned by next_unsent() from its queue.
+    def take_unsent(self):
+        queue = self.lost if self.lost else self.unsent
+        queue.popleft().queued = False
+
+    # Segments in flight whose retransmission timer has expired by 'now'.
+    def expired(self, now):
+        expired = []
+        while self.timers and self.timers[0][0] <= now:
+            deadline, ordinal, segment = heapq.heappop(self.timers)
+            if self._live(segment) and segment.in_flight and segment.deadline == deadline:
+                expired.append(segment)
+        return expired
+
+    def next_deadline(self):
+        while self.timers:
+            deadline, ordinal, segment = self.timers[0]
+            if self._live(segment) and segment.in_flight and segment.deadline == deadline:
+                return deadline
+            heapq.heappop(self.timers)
+        return None
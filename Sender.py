@@ -1,24 +1,123 @@
+import collections
+import errno
 import getopt
+import multiprocessing
 import os
 import sys
-from random import randint
+import threading
+import time
+from random import randint, getrandbits
 
 import BasicSender
 import Checksum
+import ChunkSource
+import Compression
+import Congestion
+import DatagramIO
+import FEC
+import Pacing
+import Packet
+import PathMTU
+import RTT
+import SendWindow
+import Session
+import Trace
 
 '''
 Extended Sender
 Editors: Reuben Sonnenberg and Devon Olson
 '''
 
+# Unanswered binary 'start' packets before assuming an old receiver and falling back to the legacy format
+BINARY_START_TRIES = 3
+# Unanswered 'start' packets in all (binary and legacy ones) before giving up on the receiver
+START_TRIES = 8
+# Duplicate acks that trigger a fast retransmit
+DUPACK_THRESHOLD = 3
+# Data bytes per packet until path MTU discovery finds out more (see PathMTU.py)
+PAYLOAD_SIZE = PathMTU.BASE_SIZE
+# Retransmission timeouts in a row, without any progress, before packets larger than the base size count as black holed
+BLACK_HOLE_TIMEOUTS = 2
+# Retransmission timeouts in a row, with nothing at all heard from the receiver in between, before giving up on it
+# (once it has also been silent for at least the sender's timeout)
+MAX_TIMEOUTS = 8
+# Longest wait between probes of a closed receive window, well under the receiver's idle timeout (10s by default)
+# so it doesn't expire the connection between probes
+PERSIST_MAX = 2.0
+# What Sender.stats counts (see get_stats())
+COUNTERS = ('packets_sent', 'bytes_sent', 'retransmits', 'acks_received', 'dupacks', 'checksum_failures',
+            'bytes_acked', 'rtt_samples', 'timeouts', 'fast_retransmits', 'probes_sent', 'pacing_waits',
+            'zero_windows', 'window_probes', 'parity_sent', 'parity_bytes')
+
+# One byte range of a file sent as its own flow in a striped transfer (see send_striped())
+Stripe = collections.namedtuple('Stripe', 'transfer index count offset length')
+
 class Sender(BasicSender.BasicSender):
 
-    def __init__(self, dest, port, filename, listenport=33122, debug=False, timeout=10):
-        super().__init__(dest, port, filename, debug)
+    def __init__(self, dest, port, filename, listenport=33122, debug=False, timeout=10,
+                 congestion=Congestion.DEFAULT, sndbuf=DatagramIO.DEFAULT_BUFFER, rcvbuf=DatagramIO.DEFAULT_BUFFER,
+                 stripe=None, checksum=Checksum.DEFAULT, compression=None, compress_workers=None, resume=False,
+                 mss=PathMTU.MAX_SIZE, trace=None, pacing=True, rate=None, fec=None, session=None):
+        super().__init__(dest, port, filename, debug, sndbuf, rcvbuf, source=session)
+        # timeout is the ceiling for the adaptive retransmission timeout
         self.rtimeout = timeout
+        self.rtt = RTT.RTTEstimator(maximum=timeout)
+        # the congestion window decides how many packets may be in flight
+        self.cc = Congestion.create(congestion)
         self.filename = filename
+        # send the items queued in a Session.SessionSource instead of a file (see SessionSender)
+        self.session = session
+        # name the receiver stores the data under; stdin has none of its own, and a session's items have their own
+        if session is not None:
+            self.name = Session.NAME
+        else:
+            self.name = filename if filename is not None else 'stdin'
+        self.outbox = [] # packets built by transmit(), put on the wire together by flush_outbox()
+        # only send one byte range of the file (a Stripe), or all of it
+        self.stripe = stripe
+        self.data_offset = stripe.offset if stripe else 0
+        self.data_end = stripe.offset + stripe.length if stripe else None
+        self.failed = None # why the transfer was given up, if it was
+        # checksum algorithm to ask the receiver for (if it is usable here); CRC32 is always offered as well
+        self.checksum_offer = Checksum.offer(checksum)
+        # (codec, level) to ask the receiver for, see Compression.py
+        self.compression = compression
+        self.compress_workers = compress_workers
+        self.compressor = None
+        # ask the receiver to keep a checkpoint and to skip whatever an earlier attempt already delivered
+        self.resume = resume and stripe is None and filename is not None
+        # largest payload per packet to offer the receiver and probe the path for
+        self.max_payload = mss
+        self.payload_size = min(PAYLOAD_SIZE, mss)
+        self.pmtu = None # path MTU discovery, once the receiver has agreed to larger packets
+        # spread packets out at a rate derived from the window and RTT (pacing) and/or at most 'rate' bits per second
+        self.pacing = pacing
+        self.pacer = Pacing.Pacer(rate / 8 if rate else None)
+        self.paced = False # the last send_next_data() stopped because the pacer had no tokens left
+        # flow control: the receive window the receiver advertised, in bytes, and the seqno it ends at (None until
+        # the receiver advertises one)
+        self.peer_window = None
+        self.window_ackno = None # the ack the window came with
+        self.send_limit = None
+        self.persist_at = None # when to probe a closed window with nothing in flight
+        self.persist_backoff = 0
+        self.silent_timeouts = 0 # retransmission timeouts in a row since the receiver was last heard from
+        self.silent_timeout_at = 0.0 # when the last of them was counted
+        self.heard_at = time.monotonic() # when the last valid packet from the receiver arrived
+        # forward error correction (see FEC.py): a parity packet after every 'fec' data packets, or 'auto' to adapt
+        # the block size to the loss rate; the encoder is set up once the receiver agrees
+        self.fec_spec = fec
+        self.fec = None
+        self.stats = collections.Counter() # see COUNTERS
+        self.min_rtt = None
+        self.started_at = None
+        self.finished_at = None
+        # structured event trace (see Trace.py), None unless a path is given
+        self.trace = Trace.open_trace(trace, 'Sender %s' % self.name, 'client')
+        self.traced_cwnd = None
         self.MESSAGE_HANDLER = {
-            'ack': self._handle_ack
+            'ack': self._handle_ack,
+            'probe': self._handle_probe
         }
 
     '''
@@ -27,211 +126,917 @@ class Sender(BasicSender.BasicSender):
         msgtype='start' seqno=N data='' chksum=CHECKSUM
         where N = random initial integer within given range and CHECKSUM is the calculated checksum for the entire
         message packet (minus the checksum itself).
-    2. Wait for an 'ack' message to return and verify that the host received the 'start'.
+    2. Wait for an 'ack' message to return and verify that the host received the 'start'. An unanswered 'start' is
+        resent with the retransmission timeout backing off, and after START_TRIES of them we give up.
     3. Continue sending data using the 'data' message types; mark each as successfully sent  when the ack is returned.
         The above could be implemented as a 2D array: x=data y=acknowledged flag
         The 2D array could also have a list that pulls from the 2D array that acts as the sliding window.
     4. When all data is sent and acknowledged, send an 'end' packet and close the connection.
 
-    Message format:
-    The message is 1472 bytes divided up into the following:
-    5 bytes: msgtype (to accomodate 'start' flag)
-    4 bytes: seqno
-    1458 bytes: message/data
-    2 bytes: checksum
-    3 bytes: packet delimiters '|'
+    Message format (see Packet.py):
+    The binary message is divided up into the following:
+    12 bytes: header (msgtype, flags, length, seqno, checksum)
+    payload_size bytes: message/data; 1458 at first, then whatever path MTU discovery finds, up to the 'mss' the
+    receiver accepted
+    Receivers that never answer the binary 'start' are spoken to in the legacy 'msgtype|seqno|data|checksum'
+    text format instead.
     '''
     def start(self):
+        self.connect()
+        self.run()
+
+    # Set up a new transfer with its 'start' packet in the window; run() then carries it out.
+    def connect(self):
         # The initial seqno is set to a random a 16-bit int (2 bytes).
         self.initial_sn = randint(0, 65535)
         self.current_sn = self.initial_sn
-        self.msg_window = []
-        self.filesize = 0
+        # room for the largest congestion window plus the 'start' and 'end' packets
+        self.msg_window = SendWindow.SendWindow(Congestion.MAX_WINDOW + 2)
+        self.start_attempts = 0
+        self.end_queued = False
+        self.sack = False # receiver buffers out-of-order packets and sends cumulative acks with SACK blocks
+        # Fast retransmit / fast recovery state
+        self.last_ackno = None
+        self.dupacks = 0
+        self.recovery_point = None # seqno of the highest packet sent when recovery started, None when not recovering
+        self.recovery_start = 0.0
+        self.recovery_next = 0 # holes below this seqno were already retransmitted in this recovery
+        self.highest_sacked = 0
+        self.started_at = time.monotonic()
         self.load_file()
 
         # State tracking variable:
         # 0: Transfer has not started
         # 1: Transfer is in progress
-        # 2: Transfer is ending
+        # 2: Transfer is ending (only the 'end' packet is left)
         # 3: Transfer has ended
         self.current_state = 0
 
-        # Main loop.
-        while True:
-            # state_options[self.current_state]()
+    # Main loop, until the transfer has ended, or until until() returns True after a round of sending (see
+    # SessionSender, which runs it while it has items to hand over).
+    def run(self, until=None):
+        while self.current_state < 3:
             try:
-                if self.current_state == 0:
-                    # Send initial start message
-                    # msgtype|seqno|data|checksum
-                    self.send(self.make_packet('start', self.msg_window[0][0], self.msg_window[0][1]),
-                              (self.dest, self.dport))
-                    self.msg_window[0][2] = True
-                elif self.current_state == 1:
-                    # Send unacknowledged packets
-                    self.send_next_data()
-                elif self.current_state == 2:
-                    # Send the end packet last
-                    self.send(self.make_packet('end', self.msg_window[0][0], self.msg_window[0][1]),
-                              (self.dest, self.dport))
-                    self.msg_window[0][2] = True
-                else:
-                    # Exit the program
-                    exit()
-
-                # Receive the message and where it came from
-                message = self.receive(self.rtimeout)
-
-                # if a message is received
-                if message:
-                    # Split the received packet up into it's individual parts
-                    msg_type, seqno, data, checksum = self.split_packet(message)
-                    # If the message contains no errors
-                    if Checksum.validate_checksum(message):
-                        # Handle the message using one of the methods defined by the MESSAGE_HANDLER dictionary.
-                        self.MESSAGE_HANDLER.get(msg_type, self._handle_other)(seqno, data)
-                    elif self.debug:
-                        print("checksum failed: %s" % message)
-                else:
-                    pass
+                # Requeue packets whose retransmission timer expired, then send whatever the window allows
+                self.resend_data()
+                self.send_next_data()
+                self.flush_outbox()
+                self.probe_path()
+                if until is not None and until():
+                    return
+
+                # Wait for an ack, but no longer than until the next retransmission timer fires, then handle every
+                # ack that has arrived in the meantime before sending again
+                for message in self.receive_many(self.next_timeout()):
+                    self.handle_message(message)
             except (KeyboardInterrupt, SystemExit):
                 exit()
-            except ValueError as e:
-                if self.debug:
-                    print(e)
-                pass
             except:
                 pass
 
+    def handle_message(self, message):
+        try:
+            # Split the received packet up into it's individual parts
+            msg_type, seqno, data, flags, valid = self.split_packet(message)
+            # If the message contains no errors
+            if valid:
+                self.silent_timeouts = 0
+                self.heard_at = time.monotonic()
+                # probes carry their own numbering, not a seqno
+                if Packet.is_binary(message) and self.msg_window and msg_type != 'probe':
+                    seqno = Packet.unwrap_seqno(seqno, self.msg_window[0].seqno)
+                # Handle the message using one of the methods defined by the MESSAGE_HANDLER dictionary.
+                self.MESSAGE_HANDLER.get(msg_type, self._handle_other)(seqno, data, flags)
+            else:
+                self.stats['checksum_failures'] += 1
+                if self.trace is not None:
+                    self.trace.event('transport:packet_dropped', trigger='checksum', length=len(message))
+                if self.debug:
+                    print("checksum failed (%d bytes)" % len(message))
+        except ValueError as e:
+            if self.debug:
+                print(e)
+
+    # The 'start' payload: just the filename for legacy receivers, filename plus options for binary ones.
+    # Either way only the filename takes up sequence space.
+    def start_payload(self):
+        if self.format == Packet.BINARY:
+            options = {'sack': 1, 'checksum': self.checksum_offer, 'mss': self.max_payload, 'window': 1}
+            if self.compression:
+                options['compress'] = self.compression[0]
+            if self.fec_spec:
+                options['fec'] = 1
+            if self.session is not None:
+                options['session'] = 1
+            if self.resume:
+                # the size and modification time tell the receiver whether its checkpoint is for this file
+                options.update(resume=1, mtime=os.stat(self.filename).st_mtime_ns)
+            if self.infile.size is not None:
+                # lets the receiver preallocate the output file
+                options['size'] = self.infile.size
+            if self.stripe:
+                options.update(transfer=self.stripe.transfer, stripe=self.stripe.index, stripes=self.stripe.count,
+                               offset=self.stripe.offset)
+            return Packet.encode_start(self.name, options)
+        return self.msg_window[0].data
+
     def increment_state(self):
         self.current_state += 1
+        if self.trace is not None:
+            self.trace.event('transport:state_updated', state=self.current_state)
+
+    # Give up on the transfer; start() returns with the reason in self.failed.
+    def fail(self, reason):
+        if self.debug:
+            print(reason)
+        self.failed = reason
+        self.current_state = 3
+        self.close()
+
+    def close(self):
+        self.finished_at = time.monotonic()
+        if self.compressor is not None:
+            self.compressor.close()
+            if self.debug:
+                print("compressed %d bytes to %d" % (self.compressor.raw_bytes, self.compressor.wire_bytes))
+        self.infile.close()
+        if self.debug:
+            stats = self.get_stats()
+            print("%d packets sent, %d retransmitted, %d acks, %.3fs, %.2f MB/s" %
+                  (stats['packets_sent'], stats['retransmits'], stats['acks_received'], stats['elapsed'],
+                   stats['goodput'] / 1e6))
+        if self.trace is not None:
+            self.trace.event('transport:connection_closed', failed=self.failed, **self.get_stats())
+            self.trace.close()
+            self.trace = None # acks still in the last batch aren't traced
+
+    '''
+    Counters and current measurements of the transfer as a dict: the counters in self.stats, plus
+        elapsed:    seconds since start() (until the transfer ended, once it has)
+        goodput:    file bytes acknowledged per second
+        srtt, rttvar, min_rtt, latest_rtt, rto: RTT estimates in seconds (None before the first sample)
+        cwnd, in_flight: congestion window and packets in flight
+        peer_window: the receive window the receiver last advertised, in bytes (None if it doesn't)
+        fec_block: data packets per parity packet (None without FEC)
+        pacing_rate: bytes per second the pacer lets out (None while not pacing)
+        payload_size: the current payload bytes per packet
+    '''
+    def get_stats(self):
+        stats = dict.fromkeys(COUNTERS, 0)
+        stats.update(self.stats)
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        elapsed = end - self.started_at if self.started_at is not None else 0.0
+        stats.update(elapsed=elapsed, goodput=stats['bytes_acked'] / elapsed if elapsed > 0 else 0.0,
+                     srtt=self.rtt.srtt, rttvar=self.rtt.rttvar, min_rtt=self.min_rtt, latest_rtt=self.rtt.latest,
+                     rto=self.rtt.rto, cwnd=self.cc.window(), payload_size=self.payload_size,
+                     in_flight=self.msg_window.in_flight if self.started_at is not None else 0,
+                     pacing_rate=self.pacer.rate, peer_window=self.peer_window,
+                     fec_block=self.fec.block if self.fec is not None else None)
+        return stats
+
+    '''
+    The sliding window (SendWindow.py) holds Segment records in seqno order. Each one knows whether it is in flight,
+    when it was last sent and when its retransmission timer expires, how often it was sent (only packets sent once
+    can be RTT samples, Karn's rule) and whether the receiver reported holding it beyond a hole (sacked, never resent).
+    '''
+    def new_segment(self, msg_type, seqno, data, payload=None):
+        return SendWindow.Segment(msg_type, seqno, data, payload)
+
+    # The seqno just past a packet. With SACK the 'end' packet takes up one seqno so it can be acked cumulatively.
+    def segment_end(self, segment):
+        if segment.msg_type == 'end' and self.sack:
+            return segment.seqno + 1
+        return segment.seqno + len(segment.data)
 
     def load_file(self):
-        # Read in a file and split the input file into data chunks and return data chunks.
-        # The file is converted to a bytestream that reads in the file, either reading in only what is necessary and
-        # putting that into the msg_window, or reading in the entire file into a 2D list where each element represents
-        # a (data (bytearray), seqno (int), sent (bool)) data pair. The seqno is set here to the initial value
-        # and incremented by the number of bytes in the current packet.
+        # Split the input into data chunks as the window needs them. Chunks come from the chunk source opened in
+        # BasicSender (a memory mapped file or a read-ahead stream), so nothing is copied or reopened per packet.
+        # The seqno is set here to the initial value and incremented by the number of bytes in the current packet.
 
         # create the first packet, reset the initial sn so that things are in order from now on
-        self.msg_window.append([self.current_sn, self.filename.encode('utf-8'), False])
-        self.initial_sn += len(self.filename.encode('utf-8'))
+        self.msg_window.append(self.new_segment('start', self.current_sn, self.name.encode('utf-8')))
+        self.initial_sn += len(self.name.encode('utf-8'))
         self.current_sn = self.initial_sn
+        # the data follows once the receiver has answered the start, which may change where it begins
 
-        with open(self.filename, 'rb') as sending_file:
-            self.filesize = os.stat(self.filename).st_size
-
-            # if the window is not full, and there is still more data in the file to retrieve
-            while ((self.msg_window.__len__() < 5) and (self.filesize > (self.current_sn - self.initial_sn))):
-                sending_file.seek(self.current_sn - self.initial_sn)
-                next_packet = sending_file.read(1458)
-                self.msg_window.append([self.current_sn, next_packet, False])
+    # Top the window up with the next chunks of the input; once it is exhausted the 'end' packet is queued. A
+    # session's input may also have nothing for us yet (see Session.py), the window is topped up again when it has.
+    def fill_window(self):
+        # if the window is not full, and there is still more data to retrieve
+        while (self.msg_window.__len__() < self.cc.window()) and not self.end_queued:
+            if self.compressor is not None:
+                chunk = self.compressor.next()
+                if chunk is not None:
+                    data, payload = chunk
+                    self.msg_window.append(self.new_segment('data', self.current_sn, data, payload))
+                    self.current_sn += len(data)
+                elif self.input_done(self.compressor.offset):
+                    self.msg_window.append(self.new_segment('end', self.current_sn, b''))
+                    self.end_queued = True
+                else:
+                    break
+                continue
+            offset = self.data_offset + self.current_sn - self.initial_sn
+            if not self.input_done(offset):
+                size = self.payload_size if self.data_end is None else min(self.payload_size, self.data_end - offset)
+                next_packet = self.infile.read(offset, size)
+                if len(next_packet) == 0:
+                    break
+                self.msg_window.append(self.new_segment('data', self.current_sn, next_packet))
                 self.current_sn += len(next_packet)
-    
-            if self.msg_window.__len__() < 5:
-                # If the file is super small, may need to append an 'end' packet in this step
-                packet_size = len(self.msg_window[self.msg_window.__len__() - 1][1])
-                self.current_sn += packet_size
-                self.msg_window.append([self.current_sn, '',False]) # 'end' packet
+            else:
+                self.msg_window.append(self.new_segment('end', self.current_sn, b''))
+                self.end_queued = True
+
+    # Whether the input has nothing beyond 'offset', or the stripe we send ends there.
+    def input_done(self, offset):
+        return self.infile.at_end(offset) or (self.data_end is not None and offset >= self.data_end)
+
+    # Whether every packet in the window has gone out at least once (acks and retransmissions may still be due).
+    def all_sent(self):
+        return not self.msg_window or self.msg_window[-1].ever_sent()
 
     def update_sliding_window(self):
-        with open(self.filename, 'rb') as sending_file:
-            # check to see if the window is full
-            if self.msg_window.__len__() < 5:
-                # if the window is not full, and there is still more data in the file to retrieve
-                while ((self.msg_window.__len__() < 5) and
-                           (self.filesize > (self.current_sn - self.initial_sn))):
-                    sending_file.seek(self.current_sn - self.initial_sn)
-                    next_packet = sending_file.read(1458)
-                    self.msg_window.append([self.current_sn, next_packet, False])
-                    self.current_sn += len(next_packet)
-            else:
-                # If the window does not need updated, keep running...
-                pass
+        # check to see if the window is full
+        if self.msg_window.__len__() < self.cc.window() and not self.end_queued:
+            self.fill_window()
 
         # Check to see if this is the first packet (start)
         if self.current_state == 0:
             self.increment_state()
-        # Check to see if there is only one packet left in the window
-        if self.msg_window.__len__() <= 1:
+        # Check to see if only the 'end' packet is left in the window
+        if self.current_state == 1 and self.msg_window.__len__() == 1 and self.msg_window[0].msg_type == 'end':
             self.increment_state()
-        pass
+        # Everything, including the 'end' packet, has been acknowledged
+        if not self.msg_window and self.end_queued:
+            self.current_state = 3
+            self.close()
+
+    # Queues a single window entry for the wire and (re)arms its retransmission timer.
+    def transmit(self, segment):
+        retransmission = segment.ever_sent()
+        if retransmission:
+            self.stats['retransmits'] += 1
+        if segment.msg_type == 'start':
+            self.start_attempts += 1
+            payload = self.start_payload()
+            flags = 0
+        elif segment.payload is not None:
+            payload = segment.payload
+            flags = Packet.FLAG_COMPRESSED
+        else:
+            payload = segment.data
+            flags = 0
+        if segment.msg_type == 'data' and len(payload) > self.payload_size:
+            # built before the path MTU went down: send its raw data in pieces that fit. The receiver takes them as
+            # ordinary packets and the segment is released once the last one is acked
+            data = segment.data
+            for start in range(0, len(data), self.payload_size):
+                piece = data[start:start + self.payload_size]
+                packet = self.make_packet('data', segment.seqno + start, piece)
+                self.outbox.append(packet)
+                self.pacer.consume(len(packet))
+                self.stats['packets_sent'] += 1
+                if self.fec is not None and not retransmission:
+                    self.protect(segment.seqno + start, segment.seqno + start + len(piece), 0, piece)
+            self.stats['bytes_sent'] += len(data)
+        else:
+            packet = self.make_packet(segment.msg_type, segment.seqno, payload, flags=flags)
+            self.outbox.append(packet)
+            self.pacer.consume(len(packet))
+            self.stats['packets_sent'] += 1
+            self.stats['bytes_sent'] += len(payload)
+            if self.fec is not None and segment.msg_type == 'data' and not retransmission:
+                self.protect(segment.seqno, self.segment_end(segment), flags, payload)
+        if self.trace is not None:
+            self.trace.event('transport:packet_sent', type=segment.msg_type, seqno=segment.seqno,
+                             length=len(payload), retransmission=retransmission)
+        now = time.monotonic()
+        self.msg_window.sent(segment, now, now + self.rtt.rto)
+
+    # Adds a data packet going out for the first time to the FEC block; a full block's parity follows it right away.
+    def protect(self, seqno, end, flags, payload):
+        parity = self.fec.add(seqno, end, flags, payload, self.cc.window() // 2)
+        if parity is not None:
+            self.send_parity(*parity)
+
+    # Parity packets are outside the sequence space and the congestion window, like path MTU probes.
+    def send_parity(self, start, payload):
+        packet = self.make_packet('parity', start, payload)
+        self.outbox.append(packet)
+        self.pacer.consume(len(packet))
+        self.stats['parity_sent'] += 1
+        self.stats['parity_bytes'] += len(payload)
+        if self.trace is not None:
+            self.trace.event('transport:packet_sent', type='parity', seqno=start, length=len(payload))
+
+    # Sends everything transmit() queued as one burst (see DatagramIO.py).
+    def flush_outbox(self):
+        if self.outbox:
+            try:
+                self.send_many(self.outbox)
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE or self.pmtu is None:
+                    raise
+                # bigger than the interface allows (its MTU went down): whatever didn't go out is resent on timeout
+                self.black_hole()
+            finally:
+                self.outbox = []
 
     '''
-    Attempt to send the selected data packet from the sliding window and mark it as sent.
+    Path MTU discovery (see PathMTU.py): while data is flowing, keep one 'probe' packet of the size being tried in
+    flight. The receiver answers it with an empty 'probe' of the same number; if that comes back, packets of that
+    size make it through and new segments are built that large. Probes are outside the sequence space and the
+    congestion window, and losing one is no sign of congestion.
     '''
-    def resend_data(self):
+    def probe_path(self):
+        if self.pmtu is None or self.current_state != 1:
+            return
+        now = time.monotonic()
+        deadline = self.pmtu.next_deadline()
+        if deadline is not None and now >= deadline:
+            self.pmtu.on_probe_timeout(now)
+        size = self.pmtu.next_probe(now, self.rtt.rto)
+        if size is None:
+            return
+        self.stats['probes_sent'] += 1
+        if self.trace is not None:
+            self.trace.event('transport:packet_sent', type='probe', seqno=self.pmtu.probe_id, length=size)
         try:
-            i = 0
-            while (i < len(self.msg_window)):
-                # If there is a packet to send, send it
-                if self.msg_window[i]:
-                    self.send(self.make_packet('data', self.msg_window[i][0], self.msg_window[i][1]),
-                              (self.dest, self.dport))
-                    # Set the sent flag for that packet in the sliding window
-                    self.msg_window[i][2] = True
-                i += 1
-        except:
-            pass
+            self.send(self.make_packet('probe', self.pmtu.probe_id, bytes(size)))
+        except OSError:
+            # too big for the local interface, no need to wait for an answer
+            self.pmtu.on_probe_error()
+        if self.debug:
+            print("path MTU probe %d of %d bytes" % (self.pmtu.probe_id, size))
+
+    def _handle_probe(self, seqno, data, flags=0):
+        if self.pmtu is not None and self.pmtu.on_probe_ack(seqno, time.monotonic()):
+            self.set_payload_size(self.pmtu.size)
+            if self.trace is not None:
+                self.trace.event('connectivity:mtu_updated', payload_size=self.payload_size)
+            if self.debug:
+                print("path MTU probe %d answered, payload size %d" % (seqno, self.payload_size))
+
+    # Packets of the current size keep disappearing: go back to the base size until probing finds the path again.
+    def black_hole(self):
+        self.pmtu.black_hole(time.monotonic())
+        self.set_payload_size(self.pmtu.size)
+        # whatever is in flight at the old size is gone as well: resend it in pieces without waiting for its timer
+        for segment in self.msg_window:
+            if (segment.in_flight and segment.msg_type == 'data' and
+                    len(segment.payload if segment.payload is not None else segment.data) > self.payload_size):
+                self.msg_window.lose(segment)
+        if self.trace is not None:
+            self.trace.event('connectivity:mtu_updated', payload_size=self.payload_size, trigger='black_hole')
+        if self.debug:
+            print("packets lost at this size, payload size back to %d" % self.payload_size)
+
+    # 'size' is what a packet's payload may be; with FEC the data leaves room for the parity's extra bytes.
+    def set_payload_size(self, size):
+        if self.fec is not None:
+            size -= FEC.OVERHEAD
+        self.payload_size = size
+        if self.compressor is not None:
+            self.compressor.payload_size = size
+
+    '''
+    Declare every sent packet whose own retransmission timer has expired lost, so send_next_data() retransmits it
+    as the congestion window allows. Each round of expiries backs off the RTO and shrinks the congestion window once.
+    A binary 'start' that keeps going unanswered makes us fall back to the legacy format instead.
+    '''
+    def resend_data(self):
+        now = time.monotonic()
+        expired = self.msg_window.expired(now)
+        if not expired:
+            return
+        if self.current_state == 0:
+            if self.start_attempts >= START_TRIES:
+                return self.fail("no answer to start from the receiver (%d tries), giving up" % self.start_attempts)
+            self.rtt.backoff()
+            if self.format == Packet.BINARY and self.start_attempts >= BINARY_START_TRIES:
+                if self.stripe:
+                    # a legacy receiver would write every stripe to the start of the file
+                    return self.fail("no answer to binary start, the receiver can't take striped transfers")
+                if self.session is not None:
+                    return self.fail("no answer to binary start, the receiver can't take sessions")
+                if self.debug:
+                    print("no answer to binary start, falling back to the legacy format")
+                self.format = Packet.LEGACY
+                # the legacy start is a first try at another kind of receiver
+                self.rtt.reset_backoff()
+        else:
+            self.stats['timeouts'] += 1
+            # packets sent before the last timeout we counted expire one after the other; only once a packet sent
+            # since then goes unanswered as well is it another timeout in a row
+            if any(segment.sent_at >= self.silent_timeout_at for segment in expired):
+                self.silent_timeouts += 1
+                self.silent_timeout_at = now
+                if self.silent_timeouts > MAX_TIMEOUTS and now - self.heard_at >= self.rtimeout:
+                    return self.fail("no answer from the receiver for %.1fs (%d timeouts), giving up" %
+                                     (now - self.heard_at, self.silent_timeouts))
+            self.rtt.backoff()
+            if (self.pmtu is not None and self.rtt.backoffs >= BLACK_HOLE_TIMEOUTS and
+                    self.payload_size > self.pmtu.base):
+                self.black_hole()
+            self.cc.on_timeout(now, self.msg_window.in_flight)
+            # a timeout ends any fast recovery in progress
+            self.recovery_point = None
+            self.dupacks = 0
+        if self.debug:
+            print("timeout, retransmitting %d packet(s), rto %.3fs, cwnd %d" %
+                  (len(expired), self.rtt.rto, self.cc.window()))
+        for segment in expired:
+            self.msg_window.lose(segment)
+            if self.fec is not None and segment.msg_type == 'data':
+                self.fec.on_loss()
+            if self.trace is not None:
+                self.trace.event('recovery:packet_lost', type=segment.msg_type, seqno=segment.seqno, trigger='timeout')
 
     '''
-    Send the next unsent data packet from the sliding window and mark it as sent.
+    Send packets waiting in the sliding window (lost ones first, then new ones in order) while the congestion
+    window has room, new data fits in the receiver's advertised window and the pacer (see Pacing.py) has tokens left,
+    and mark them as sent.
     '''
     def send_next_data(self):
-        # If there is still data unsent
-        if len(self.msg_window) > 0:
-            # Check for unsent packets
-            packet_to_send = False
-            i = 0
-            while (not packet_to_send) and (i < len(self.msg_window)):
-                if not self.msg_window[i][2]:
-                    packet_to_send = True
-                else:
-                    i += 1
-
-            # If there are packets to send, start with the previous unsent packets and send them
-            if packet_to_send:
-                while (i < len(self.msg_window)):
-                    self.send(self.make_packet('data', self.msg_window[i][0], self.msg_window[i][1]),
-                              (self.dest, self.dport))
-                    # Set the sent flag for that packet in the sliding window
-                    self.msg_window[i][2] = True
-                    i += 1
-        pass
+        now = time.monotonic()
+        self.update_pacing(now)
+        self.paced = False
+        while self.msg_window.in_flight < self.cc.window():
+            segment = self.msg_window.next_unsent()
+            if segment is None:
+                break
+            # The 'end' packet only goes out once every data packet has been acknowledged
+            if segment.msg_type == 'end' and self.current_state != 2:
+                if self.fec is not None:
+                    # all the data has gone out once: the last block gets its parity even though it isn't full
+                    parity = self.fec.flush()
+                    if parity is not None:
+                        self.send_parity(*parity)
+                break
+            if self.window_closed(segment) and not self.window_probe_due(now):
+                break
+            if not self.pacer.ready(now):
+                # the rest goes out once the bucket has filled up again, see next_timeout()
+                self.paced = True
+                self.stats['pacing_waits'] += 1
+                break
+            self.msg_window.take_unsent()
+            self.transmit(segment)
+            # Nothing but the 'start' may go out until the receiver has acknowledged it
+            if self.current_state == 0:
+                break
+
+    '''
+    Flow control: new data may only go up to the seqno the receiver's last advertised window ends at (lost packets
+    were inside the window when they were first sent and are always resent). If the window is closed and nothing is
+    in flight, an ack telling us when it opens again may never come (a receiver only sends one when it notices the
+    window opening, see Receiver.window_update()), so, like TCP's persist timer, the next packet goes out anyway
+    after an RTO (doubling every time the window is still closed, up to PERSIST_MAX) to get a fresh window back.
+    As long as the receiver answers the probes we keep probing; a probe nobody answers times out like any other
+    packet, and enough of those in a row give up on the receiver (see MAX_TIMEOUTS).
+    '''
+    def window_closed(self, segment):
+        return (self.send_limit is not None and segment.msg_type == 'data' and not segment.ever_sent() and
+                self.segment_end(segment) > self.send_limit)
+
+    def window_probe_due(self, now):
+        if self.msg_window.in_flight > 0:
+            self.persist_at = None # their acks bring the window
+            return False
+        if self.persist_at is None:
+            self.persist_at = now + min(self.rtt.rto * (1 << self.persist_backoff), PERSIST_MAX)
+            return False
+        if now < self.persist_at:
+            return False
+        self.persist_at = None
+        self.persist_backoff += 1
+        self.stats['window_probes'] += 1
+        if self.debug:
+            print("receive window closed, probing it")
+        return True
+
+    # A window advertised with the cumulative ack 'ackno'; windows from acks older than the last one are stale.
+    # Returns whether it lets us send further than before.
+    def update_window(self, ackno, window):
+        if self.window_ackno is not None and ackno < self.window_ackno:
+            return False
+        opened = self.send_limit is None or ackno + window > self.send_limit
+        if window == 0:
+            self.stats['zero_windows'] += 1
+        else:
+            self.persist_at = None
+            self.persist_backoff = 0
+        if self.trace is not None and (window == 0) != (self.peer_window == 0):
+            self.trace.event('transport:flow_control_updated', window=window, ackno=ackno)
+        self.peer_window = window
+        self.window_ackno = ackno
+        self.send_limit = ackno + window
+        return opened
+
+    # The pacing rate: the congestion controller's own if it has one (in packets per second), else the window over
+    # the RTT. Without pacing only the --rate cap is left.
+    def update_pacing(self, now):
+        packet_size = self.payload_size + Packet.HEADER_SIZE
+        rate = None
+        if self.pacing:
+            rate = self.cc.pacing_rate()
+            if rate is not None:
+                rate *= packet_size
+            else:
+                rate = Pacing.window_rate(self.cc.window(), packet_size, self.rtt.srtt, self.cc.in_slow_start())
+        self.pacer.set_rate(rate, packet_size, now)
+
+    # How long we can block waiting for acks before the earliest retransmission, path MTU probe or persist timer
+    # fires, or the pacer lets the next packets go.
+    def next_timeout(self):
+        now = time.monotonic()
+        deadline = self.msg_window.next_deadline()
+        probe = self.pmtu.next_deadline() if self.pmtu is not None else None
+        if probe is not None and (deadline is None or probe < deadline):
+            deadline = probe
+        if self.persist_at is not None and (deadline is None or self.persist_at < deadline):
+            deadline = self.persist_at
+        timeout = self.rtt.rto if deadline is None else max(0.0, deadline - now)
+        if self.paced:
+            timeout = min(timeout, self.pacer.delay(now))
+        return timeout
 
     '''
     If an acknowledgement packet is received:
-        If the sequence number matches a sent packet in the sliding window:
-            Remove the packet from the sliding window and refresh the sliding window with another packet.
+        Without SACK the receiver only ever accepts packets in order, so an ack for a seqno covers that packet and
+        every packet before it. With SACK the ack is cumulative (the next seqno the receiver expects) and its payload
+        lists blocks the receiver holds beyond a hole; those packets are marked so only the holes get retransmitted.
+        Take an RTT sample from the newest newly acknowledged packet (unless it was retransmitted), remove every
+        covered packet from the sliding window and refresh the sliding window with more packets.
+        This also recovers from lost acks: the ack for a later packet releases the earlier one.
+        A receiver that advertises a receive window puts it in front of the SACK blocks (see update_window()).
     '''
     # Handle an 'ack' reply from the server
-    def _handle_ack(self, seqno, data):
-        # If the seqno matches one of the packets in the sliding window
-        temp_packet = []
-        temp_index = 0
-
-        for index in list(range(self.msg_window.__len__())):
-            if seqno == self.msg_window[index][0]:
-                temp_packet = self.msg_window[index]
-                temp_index = index
+    def _handle_ack(self, seqno, data, flags=0):
+        self.stats['acks_received'] += 1
+        if self.trace is not None:
+            self.trace.event('transport:packet_received', type='ack', seqno=seqno, length=len(data))
+        window, data = Packet.split_window(data, flags)
+        if self.current_state == 0 and self.format == Packet.BINARY and not flags & Packet.FLAG_SACK:
+            # the ack for our binary start says which options the receiver accepted
+            options = Packet.decode_options(data)
+            self.sack = options.get('sack') == '1'
+            self.checksum = Checksum.get(options.get('checksum', Checksum.DEFAULT))
+            if self.fec_spec and self.sack and options.get('fec') == '1':
+                auto = self.fec_spec == 'auto'
+                self.fec = FEC.Encoder(FEC.BLOCK if auto else self.fec_spec, adaptive=auto)
+                self.set_payload_size(min(PAYLOAD_SIZE, self.max_payload))
+            if 'mss' in options and self.sack:
+                # the receiver takes packets up to this size: find out how much of that the path allows
+                maximum = min(int(options['mss']), self.max_payload)
+                self.pmtu = PathMTU.PathMTU(PAYLOAD_SIZE, maximum)
+                self.set_payload_size(self.pmtu.size)
+                if self.pmtu.maximum > self.pmtu.base and not DatagramIO.set_dont_fragment(self.sock):
+                    self.pmtu.high = self.pmtu.size # probes would just be fragmented
+            if 'window' in options and self.sack:
+                self.update_window(seqno, int(options['window']))
+            if self.resume and 'resume' in options:
+                # the window holds nothing but the start yet, so the data can simply begin further in
+                self.data_offset = int(options['resume'])
+                if self.debug and self.data_offset:
+                    print("resuming at offset %d" % self.data_offset)
+            if self.compression and self.sack and options.get('compress') == self.compression[0]:
+                # everything not in the window yet gets compressed from here on
+                self.compressor = Compression.SegmentCompressor(
+                    self.compression[0], self.compression[1], self.infile,
+                    self.data_offset + self.current_sn - self.initial_sn, self.data_end, self.payload_size,
+                    self.compress_workers)
+            if self.stripe and options.get('stripe') != str(self.stripe.index):
+                return self.fail("the receiver didn't accept stripe %d of the transfer" % self.stripe.index)
+            if self.session is not None and options.get('session') != '1':
+                # it would store the items, framing and all, as one file called 'session'
+                return self.fail("the receiver can't take sessions")
+
+        opened = False
+        if window is not None and self.sack:
+            opened = self.update_window(seqno, window)
+
+        now = time.monotonic()
+        newest = None
+        acked = 0
+        newly_acked = 0
+        acked_bytes = 0
+        window = self.msg_window
+        while window:
+            segment = window[0]
+            # Only packets that were actually sent at some point can be acknowledged
+            if not segment.ever_sent():
+                break
+            if self.sack:
+                if self.segment_end(segment) > seqno:
+                    break
+            elif segment.seqno > seqno:
                 break
+            if not segment.sacked:
+                newly_acked += 1
+                newest = self._newer_sample(newest, segment)
+                if segment.msg_type == 'data':
+                    acked_bytes += len(segment.data)
+            # Slide the window past the packet
+            window.release()
+            acked += 1
 
-        if len(temp_packet) > 0:
-            # If the packet has been sent previously, accept it
-            if self.msg_window[temp_index][2]:
-                # Remove the packet from the sliding window list
-                del self.msg_window[temp_index]
-                # Refresh the sliding window
-                self.update_sliding_window()
+        if self.sack and flags & Packet.FLAG_SACK:
+            for start, end in Packet.decode_sack(data, seqno):
+                index = window.index_of(start)
+                while index < len(window):
+                    segment = window[index]
+                    if self.segment_end(segment) > end:
+                        break
+                    if not segment.sacked and segment.ever_sent():
+                        self.highest_sacked = max(self.highest_sacked, segment.seqno)
+                        newest = self._newer_sample(newest, segment)
+                        window.sack(segment)
+                        newly_acked += 1
+                        if segment.msg_type == 'data':
+                            acked_bytes += len(segment.data)
+                    index += 1
+
+        rtt = None
+        if newest is not None:
+            rtt = now - newest.sent_at
+            self.rtt.sample(rtt)
+            self.stats['rtt_samples'] += 1
+            if self.min_rtt is None or rtt < self.min_rtt:
+                self.min_rtt = rtt
+        self.stats['bytes_acked'] += acked_bytes
+        if newly_acked > 0:
+            self.rtt.reset_backoff()
+            if self.current_state > 0:
+                self.cc.on_ack(newly_acked, rtt, now, window.in_flight)
+            if self.trace is not None and (rtt is not None or self.cc.window() != self.traced_cwnd):
+                self.traced_cwnd = self.cc.window()
+                self.trace.event('recovery:metrics_updated', cwnd=self.traced_cwnd, in_flight=window.in_flight,
+                                 latest_rtt=rtt, srtt=self.rtt.srtt, rttvar=self.rtt.rttvar, rto=self.rtt.rto,
+                                 pacing_rate=self.pacer.rate)
+        if acked > 0:
+            # Refresh the sliding window
+            self.update_sliding_window()
+        # an ack that only opens the receive window is a window update, not a duplicate (RFC 5681)
+        if self.current_state == 1 and not (opened and acked == 0 and newly_acked == 0):
+            self._detect_loss(seqno, acked, newly_acked, now)
+        self.last_ackno = seqno
         # if the seqno doesn't match anything in the sliding window, ignore it.
         pass
 
+    # Karn's rule: an ack for a retransmitted packet is ambiguous, so only packets sent once are RTT samples
+    def _newer_sample(self, newest, segment):
+        if segment.retransmitted() or not segment.in_flight:
+            return newest
+        if newest is None or segment.sent_at > newest.sent_at:
+            return segment
+        return newest
+
+    '''
+    Fast retransmit and fast recovery:
+        An ack that releases nothing and repeats the previous ack number is a duplicate: the receiver got a packet
+        beyond a hole. On the third one the first unacknowledged packet is retransmitted right away and the
+        congestion window is cut once (not collapsed as on a timeout) until everything that was in flight at that
+        point has been acknowledged. During recovery a partial ack means the next hole was lost as well, and with
+        SACK every duplicate ack that reports more data beyond a hole lets us repair the next hole.
+    '''
+    def _detect_loss(self, seqno, acked, newly_acked, now):
+        if acked > 0:
+            self.dupacks = 0
+            if self.recovery_point is not None:
+                if not self.msg_window or self.msg_window[0].seqno > self.recovery_point:
+                    # everything outstanding at the loss is acknowledged: recovery is over
+                    self.recovery_point = None
+                else:
+                    self.retransmit_hole(self.recovery_point)
+        elif seqno == self.last_ackno and self.msg_window:
+            self.dupacks += 1
+            self.stats['dupacks'] += 1
+            if self.recovery_point is None:
+                if self.dupacks >= self.dupack_threshold():
+                    self.enter_recovery(now)
+            elif self.sack and newly_acked > 0:
+                self.retransmit_hole(self.highest_sacked)
+
+    # With FEC the parity of a hole's block is still on its way when the first dupacks arrive: give it the rest of
+    # the block to repair the hole before retransmitting.
+    def dupack_threshold(self):
+        return DUPACK_THRESHOLD + (self.fec.block if self.fec is not None else 0)
+
+    def enter_recovery(self, now):
+        window = self.msg_window
+        self.recovery_point = window.newest_sent.seqno
+        self.recovery_start = now
+        self.recovery_next = window[0].seqno
+        self.cc.on_loss(now, window.in_flight)
+        self.stats['fast_retransmits'] += 1
+        if self.trace is not None:
+            self.trace.event('recovery:packet_lost', type=window[0].msg_type, seqno=window[0].seqno,
+                             trigger='dupacks', cwnd=self.cc.window())
+        if self.debug:
+            print("%d duplicate acks, fast retransmit of %d, cwnd %d" %
+                  (self.dupacks, window[0].seqno, self.cc.window()))
+        self.retransmit_hole(self.recovery_point)
+
+    # Retransmit the lowest packet below 'limit' that is neither acknowledged nor already resent in this recovery.
+    def retransmit_hole(self, limit):
+        window = self.msg_window
+        if self.fec is not None:
+            # the parity of holes less than a block below 'limit' may not have arrived yet: leave those to it
+            index = window.index_of(limit) - self.fec.block
+            if index < 0:
+                return
+            limit = window[index].seqno
+        index = window.index_of(self.recovery_next)
+        while index < len(window):
+            segment = window[index]
+            if segment.seqno > limit or segment.msg_type == 'end':
+                return
+            if not segment.sacked and segment.ever_sent() and segment.sent_at < self.recovery_start:
+                window.lose(segment)
+                if self.fec is not None:
+                    self.fec.on_loss()
+                self.transmit(segment)
+                self.recovery_next = segment.seqno + 1
+                return
+            index += 1
+
 
     # handler for packets with unrecognized type
-    def _handle_other(self, seqno, data):
+    def _handle_other(self, seqno, data, flags=0):
         # Not sure if anything should go here... Just ignore them... it'll be fine... I think...
         pass
 
 
+'''
+Session transfer (see Session.py): any number of items over one connection, one 'start' handshake and one congestion
+window for all of them.
+
+    with SessionSender('receiver.example.com', 33122) as session:
+        session.send(b'some bytes', 'greeting')
+        session.send(generate_chunks(), 'stream')  # any iterable of bytes-like objects
+        session.send_path('photos')                 # a file, or a directory and everything in it
+
+The session has no thread of its own: send() runs the connection itself until all of its item has gone out once, so
+items are pipelined one after the other and only the first pays for the handshake. Data is not copied, so it must
+not change until close(), which waits until everything has been acknowledged. An iterator is pulled from as the
+window takes its data, never more than Session.WATERMARK bytes ahead. Between calls nothing runs, so a session that
+sits idle for longer than the receiver's timeout is dropped by the receiver; close it and open a new one instead.
+The keyword arguments are Sender's (congestion control, compression, FEC, ...). A failed session raises
+ConnectionError with the reason; so does anything after it.
+'''
+class SessionSender(object):
+    def __init__(self, dest, port, listenport=33122, **kwargs):
+        self.source = Session.SessionSource()
+        self.sender = Sender(dest, port, None, listenport, session=self.source, **kwargs)
+        self.sender.connect()
+        self.items = 0 # items handed over so far
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        # don't hide the error that broke the session with another one
+        if kind is None or not self.sender.failed:
+            self.close()
+
+    # Send one item: a bytes-like object or an iterable of them. Named 'item<N>' if it has no name of its own.
+    def send(self, data, name=None):
+        if self.closed:
+            raise ValueError("session is closed")
+        self._check()
+        try:
+            pieces = None
+            view = memoryview(data)
+        except TypeError:
+            pieces = iter(data)
+        if name is None:
+            name = 'item%d' % self.items
+        self.source.begin(name)
+        try:
+            if pieces is None:
+                self.source.write(view)
+            else:
+                self.source.corked = True
+                for piece in pieces:
+                    self.source.write(piece)
+                    if self.source.buffered >= Session.WATERMARK:
+                        self._run(lambda: self.source.buffered < Session.WATERMARK)
+                self.source.corked = False
+            self.source.end()
+            self.items += 1
+            self._run(lambda: self.source.buffered == 0 and self.sender.all_sent())
+        except BaseException as e:
+            if not self.sender.failed:
+                # the item can't be finished, so nothing after it could be told apart from it either
+                self.sender.fail("item %s not sent: %r" % (name, e))
+            raise
+
+    # Send a file (memory mapped, see ChunkSource.py), named after the file if it has no name of its own.
+    def send_file(self, path, name=None):
+        source = ChunkSource.open_source(path)
+        try:
+            self.send(ChunkSource.blocks(source), name if name is not None else os.path.basename(path))
+        finally:
+            source.close()
+
+    # Send a file, or every file in a directory tree as 'name/path/in/it' (empty directories aren't sent), where name
+    # is the last part of the path unless another one is given.
+    def send_path(self, path, name=None):
+        if name is None:
+            name = os.path.basename(os.path.normpath(path))
+        if not os.path.isdir(path):
+            return self.send_file(path, name)
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for filename in sorted(files):
+                full = os.path.join(root, filename)
+                self.send_file(full, name + '/' + os.path.relpath(full, path).replace(os.sep, '/'))
+
+    # Wait until everything sent has been acknowledged, then end the connection.
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.source.finish()
+            self._run(None)
+        self._check()
+
+    def get_stats(self):
+        stats = self.sender.get_stats()
+        stats['items'] = self.items
+        return stats
+
+    def _run(self, until):
+        # anything new for the window gets in right away, even if no ack is coming to make room for it
+        if self.sender.current_state > 0:
+            self.sender.update_sliding_window()
+        self.sender.run(until)
+        self._check()
+
+    def _check(self):
+        if self.sender.failed:
+            raise ConnectionError(self.sender.failed)
+
+
+# Byte ranges (offset, length) of the stripes of a file, cut at packet boundaries.
+def stripe_layout(size, count):
+    packets = -(-size // PAYLOAD_SIZE)
+    count = max(1, min(count, packets))
+    layout = []
+    for index in range(count):
+        first = packets * index // count * PAYLOAD_SIZE
+        last = min(packets * (index + 1) // count * PAYLOAD_SIZE, size)
+        layout.append((first, last - first))
+    return layout
+
+
+def _send_stripe(dest, port, filename, stripe, kwargs):
+    sender = Sender(dest, port, filename, stripe=stripe, **_stripe_kwargs(stripe, kwargs))
+    sender.start()
+    if sender.failed:
+        print(sender.failed)
+        sys.exit(1)
+
+
+# Every stripe gets its own trace file, the given path plus '.' and the stripe number, and its share of the rate cap.
+def _stripe_kwargs(stripe, kwargs):
+    if kwargs.get('trace'):
+        kwargs = dict(kwargs, trace='%s.%d' % (kwargs['trace'], stripe.index))
+    if kwargs.get('rate'):
+        kwargs = dict(kwargs, rate=kwargs['rate'] / stripe.count)
+    return kwargs
+
+
+'''
+Striped transfer: send one file as 'count' flows at once, each with its own socket, window and congestion control,
+carrying one byte range of the file. With processes=True (the default) every flow runs in its own process, so the
+flows use separate cores; otherwise they run as threads. All stripes announce the same random transfer ID in their
+start packets. Returns True if every stripe was delivered.
+'''
+def send_striped(dest, port, filename, count, processes=True, **kwargs):
+    transfer = '%016x' % getrandbits(64)
+    layout = stripe_layout(os.path.getsize(filename), count)
+    stripes = [Stripe(transfer, index, len(layout), offset, length) for index, (offset, length) in enumerate(layout)]
+    if processes:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        flows = [context.Process(target=_send_stripe, args=(dest, port, filename, stripe, kwargs))
+                 for stripe in stripes]
+    else:
+        senders = [Sender(dest, port, filename, stripe=stripe, **_stripe_kwargs(stripe, kwargs))
+                   for stripe in stripes]
+        flows = [threading.Thread(target=sender.start) for sender in senders]
+    for flow in flows:
+        flow.start()
+    for flow in flows:
+        flow.join()
+    if processes:
+        return all(flow.exitcode == 0 for flow in flows)
+    return not any(sender.failed for sender in senders)
+
+
 '''
 This will be run if you run this script from the command line. You should not
 change any of this; the grader may rely on the behavior here to test your
@@ -240,35 +1045,143 @@ submission.
 if __name__ == "__main__":
     def usage():
         print ("Sender")
-        print ("-f FILE | --file=FILE The file to transfer; if empty reads from STDIN")
+        print ("-f FILE | --file=FILE The file to transfer; if empty reads from STDIN. Give it more than once, or a "
+               "directory, to send them all over one connection (a session)")
         print ("-p PORT | --port=PORT The destination port, defaults to 33122")
         print ("-a ADDRESS | --address=ADDRESS The receiver address or hostname, defaults to localhost")
+        print ("-c ALGORITHM | --congestion=ALGORITHM Congestion control: %s, defaults to %s" %
+               (", ".join(sorted(Congestion.ALGORITHMS)), Congestion.DEFAULT))
+        print ("-b BYTES | --buffer=BYTES Socket send and receive buffer size, defaults to %d" %
+               DatagramIO.DEFAULT_BUFFER)
+        print ("-k ALGORITHM | --checksum=ALGORITHM Checksum to ask the receiver for: %s, defaults to %s "
+               "(crc32c needs the crc32c or google-crc32c package)" %
+               (", ".join(sorted(Checksum.ALGORITHMS)), Checksum.DEFAULT))
+        print ("-z CODEC[:LEVEL] | --compress=CODEC[:LEVEL] Compress data if the receiver agrees: %s" %
+               ", ".join(sorted(Compression.CODECS)))
+        print ("-j WORKERS | --compress-workers=WORKERS Compression threads, defaults to the number of CPUs")
+        print ("-r | --resume Resume an interrupted transfer of the same file where it stopped")
+        print ("-m BYTES | --mss=BYTES Largest payload per packet to probe the path for, defaults to %d" %
+               PathMTU.MAX_SIZE)
+        print ("-R BITS | --rate=BITS Send at most this many bits per second, k/M/G suffixes allowed")
+        print ("-n | --no-pacing Send the window in bursts instead of spreading it over the round trip")
+        print ("-F BLOCK | --fec=BLOCK Send an XOR parity packet after every BLOCK data packets so the receiver can "
+               "rebuild a lost one; 'auto' adapts BLOCK to the loss rate")
+        print ("-s STRIPES | --stripes=STRIPES Send the file as this many parallel flows, one process each")
+        print ("-T FILE | --trace=FILE Write a JSON lines event trace of the transfer to FILE")
         print ("-d | --debug Print debug messages")
         print ("-h | --help Print this usage message")
 
     try:
         opts, args = getopt.getopt(sys.argv[1:],
-                               "f:p:a:d", ["file=", "port=", "address=", "debug="])
+                               "f:p:a:c:b:s:k:z:j:rm:T:R:nF:d", ["file=", "port=", "address=", "congestion=", "buffer=",
+                                                              "stripes=", "checksum=", "compress=", "compress-workers=",
+                                                              "resume", "mss=", "trace=", "rate=", "no-pacing",
+                                                              "fec=", "debug="])
     except:
         usage()
         exit()
 
     port = 33122
     dest = "localhost"
-    filename = None
+    filenames = []
     debug = False
+    congestion = Congestion.DEFAULT
+    buffer_size = DatagramIO.DEFAULT_BUFFER
+    stripes = 1
+    checksum = Checksum.DEFAULT
+    compression = None
+    compress_workers = None
+    resume = False
+    mss = PathMTU.MAX_SIZE
+    trace = None
+    pacing = True
+    rate = None
+    fec = None
 
     for o,a in opts:
         if o in ("-f", "--file="):
-            filename = a
+            filenames.append(a)
         elif o in ("-p", "--port="):
             port = int(a)
         elif o in ("-a", "--address="):
             dest = a
+        elif o in ("-c", "--congestion"):
+            congestion = a
+        elif o in ("-b", "--buffer"):
+            buffer_size = int(a)
+        elif o in ("-s", "--stripes"):
+            stripes = int(a)
+        elif o in ("-k", "--checksum"):
+            checksum = a
+        elif o in ("-z", "--compress"):
+            try:
+                compression = Compression.parse_spec(a)
+            except ValueError:
+                usage()
+                exit()
+        elif o in ("-j", "--compress-workers"):
+            compress_workers = int(a)
+        elif o in ("-r", "--resume"):
+            resume = True
+        elif o in ("-m", "--mss"):
+            mss = int(a)
+        elif o in ("-T", "--trace"):
+            trace = a
+        elif o in ("-R", "--rate"):
+            try:
+                rate = Pacing.parse_rate(a)
+            except ValueError:
+                usage()
+                exit()
+        elif o in ("-n", "--no-pacing"):
+            pacing = False
+        elif o in ("-F", "--fec"):
+            if a == 'auto':
+                fec = a
+            elif a.isdigit() and 0 < int(a) <= 255:
+                fec = int(a)
+            else:
+                usage()
+                exit()
         elif o in ("-d", "--debug="):
             debug = True
 
-    s = Sender(dest,port,filename,debug)
+    filename = filenames[0] if filenames else None
+    session = len(filenames) > 1 or (filename is not None and os.path.isdir(filename))
+    if (congestion not in Congestion.ALGORITHMS or checksum not in Checksum.ALGORITHMS or
+            (stripes > 1 and (filename is None or session))):
+        usage()
+        exit()
+
+    if session:
+        try:
+            with SessionSender(dest, port, debug=debug, congestion=congestion, sndbuf=buffer_size,
+                               rcvbuf=buffer_size, checksum=checksum, compression=compression,
+                               compress_workers=compress_workers, mss=mss, trace=trace, pacing=pacing, rate=rate,
+                               fec=fec) as s:
+                for path in filenames:
+                    s.send_path(path)
+        except OSError as e:
+            # the session failed (ConnectionError) or a file couldn't be read
+            print(e)
+            sys.exit(1)
+        except (KeyboardInterrupt, SystemExit):
+            exit()
+        sys.exit(0)
+
+    if stripes > 1:
+        try:
+            ok = send_striped(dest, port, filename, stripes, debug=debug, congestion=congestion,
+                              sndbuf=buffer_size, rcvbuf=buffer_size, checksum=checksum, compression=compression,
+                              compress_workers=compress_workers, mss=mss, trace=trace, pacing=pacing, rate=rate,
+                              fec=fec)
+        except (KeyboardInterrupt, SystemExit):
+            exit()
+        sys.exit(0 if ok else 1)
+
+    s = Sender(dest,port,filename,debug=debug,congestion=congestion,sndbuf=buffer_size,rcvbuf=buffer_size,
+               checksum=checksum, compression=compression, compress_workers=compress_workers, resume=resume, mss=mss,
+               trace=trace, pacing=pacing, rate=rate, fec=fec)
     try:
         s.start()
     except (KeyboardInterrupt, SystemExit):
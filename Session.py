@@ -0,0 +1,244 @@
+'''
+Sessions
+A session sends any number of items (files, or data straight from memory) over one connection, so they share one
+'start' handshake and one congestion window instead of each paying for its own handshake and slow start. The sender
+asks for it with the 'session' start option and names the connection NAME; the data that follows is the items one
+after the other, each framed as
+
+    2 bytes: length of the item's name, then the name (UTF-8, '/' separated for files in a directory)
+    any number of chunks: 4 bytes length, then that much of the item's data
+    a chunk of length 0 to end the item
+
+so an item's size doesn't have to be known when it starts. The items go through the same sequence space, acks, SACK,
+compression and FEC as a single file does; only the two ends of the byte stream differ.
+
+On the sender a SessionSource queues the framed items and hands them out like a ChunkSource (see ChunkSource.py);
+see Sender.SessionSender for the API. On the receiver a SessionSink takes the in-order data apart again and hands
+every item to the receiver's consumer, or writes it to out_<name> without one ('dir/file' goes to out_dir/file).
+Unlike a FileSink it can't write data beyond a hole to its place straight away, since it doesn't know which item
+that data belongs to yet: it holds it in memory until the hole is filled (the receive window and the SACK buffer
+limit how much that can be).
+
+A consumer is called as consumer(address, name, data, last) with every piece of an item in order, and with
+last=True and empty data once the item is complete. If the connection ends in the middle of an item, the consumer
+gets one more call with data None instead. A consumer may also have a queued(address) method returning how many
+bytes from that sender it is still holding on to: they count against the sender's receive window, so a consumer
+that falls behind slows its senders down instead of piling their data up.
+'''
+
+import collections
+import os
+import struct
+
+import Checkpoint
+import Sink
+
+NAME = 'session' # what a session's start packet carries instead of a filename
+HEADER = struct.Struct('!H') # length of the item's name
+CHUNK = struct.Struct('!I') # length of the chunk, 0 ends the item
+MAX_NAME = 0xffff
+MAX_CHUNK = 1 << 30
+WATERMARK = 1 << 20 # bytes the sender queues ahead when it pulls an item from an iterator
+
+# what SessionSink expects next
+NAME_LENGTH = 0
+ITEM_NAME = 1
+CHUNK_LENGTH = 2
+
+
+# Where an item named 'dir/file' is written without a consumer: output_path('dir') + '/file'. None for names that
+# would end up anywhere else (absolute paths, '..', empty parts).
+def item_path(name, output_path):
+    parts = name.split('/')
+    for part in parts:
+        if part in ('', '.', '..') or os.sep in part or (os.altsep and os.altsep in part) or '\0' in part:
+            return None
+    return os.path.join(output_path(parts[0]), *parts[1:])
+
+
+class SessionSource(object):
+    def __init__(self):
+        self.size = None # never known in advance
+        self.parts = collections.deque() # queued bytes-like objects in stream order
+        self.offset = 0 # stream offset of the first queued byte
+        self.buffered = 0 # bytes queued
+        self.corked = False # more of the current item is on its way: only hand out full reads
+        self.finished = False # no more items are coming
+
+    def _add(self, data):
+        if len(data) > 0:
+            self.parts.append(data)
+            self.buffered += len(data)
+
+    def begin(self, name):
+        name = name.encode('utf-8')
+        if len(name) > MAX_NAME:
+            raise ValueError("item name too long (%d bytes)" % len(name))
+        self._add(HEADER.pack(len(name)) + name)
+
+    # Queue more of the current item. The data isn't copied, so it must not change until it has been acknowledged.
+    def write(self, data):
+        view = memoryview(data).cast('B')
+        for start in range(0, len(view), MAX_CHUNK):
+            chunk = view[start:start + MAX_CHUNK]
+            self._add(CHUNK.pack(len(chunk)))
+            self._add(chunk)
+
+    def end(self):
+        self._add(CHUNK.pack(0))
+
+    def finish(self):
+        self.finished = True
+
+    # Up to 'size' queued bytes at 'offset', which must be where the last read stopped. Returns nothing at all while
+    # corked with less than 'size' bytes queued, so a packet isn't cut short just because the next piece of the item
+    # hasn't been queued yet.
+    def read(self, offset, size):
+        if offset != self.offset:
+            raise ValueError("session source can't go to offset %d, it is at %d" % (offset, self.offset))
+        if self.corked and self.buffered < size:
+            return b''
+        pieces = []
+        wanted = size
+        while wanted > 0 and self.parts:
+            part = self.parts[0]
+            if len(part) <= wanted:
+                self.parts.popleft()
+            else:
+                self.parts[0] = part[wanted:]
+                part = part[:wanted]
+            pieces.append(part)
+            wanted -= len(part)
+        self.offset += size - wanted
+        self.buffered -= size - wanted
+        if len(pieces) == 1:
+            return pieces[0]
+        return b''.join(pieces)
+
+    # Only the end of the session is the end of the source; an empty queue may just be waiting for the next item.
+    def at_end(self, offset):
+        return self.finished and offset >= self.offset + self.buffered
+
+    def close(self):
+        self.parts.clear()
+
+
+class SessionSink(object):
+    def __init__(self, address, consumer=None, output_path=None, debug=False, background=False, pool=None):
+        self.address = address
+        self.consumer = consumer
+        self.output_path = output_path # for items written to files, see item_path()
+        self.debug = debug
+        self.background = background # FileSink options for those files
+        self.pool = pool
+        self.position = 0 # stream offset of the next in-order byte
+        self.held = {} # stream offset -> data beyond a hole
+        self.expect = NAME_LENGTH
+        self.field = bytearray() # the part of the length or name we expect that has arrived
+        self.need = HEADER.size # bytes of it we need
+        self.remaining = 0 # bytes left of the chunk being received
+        self.name = None # name of the item being received, None between items
+        self.file = None # its FileSink, when it's written to a file
+        self.items = 0 # items received completely
+
+    # Append in-order data to the stream.
+    def write(self, data):
+        self.position += len(data)
+        view = memoryview(data)
+        while True:
+            if not self.remaining and len(self.field) == self.need:
+                self._field()
+                continue
+            if len(view) == 0:
+                return
+            if self.remaining:
+                piece = view[:self.remaining]
+                self.remaining -= len(piece)
+                self._data(piece, False)
+            else:
+                piece = view[:self.need - len(self.field)]
+                self.field += piece
+            view = view[len(piece):]
+
+    # Data beyond a hole is held until skip_to() reaches it.
+    def write_at(self, offset, data):
+        self.held[offset] = data
+
+    # The in-order position moves past data that was held with write_at(): take it apart now.
+    def skip_to(self, offset):
+        while self.position < offset:
+            self.write(self.held.pop(self.position))
+
+    def flush(self, wait=False):
+        if self.file is not None:
+            self.file.flush(wait)
+
+    def flush_if_due(self):
+        return self.file is not None and self.file.flush_if_due()
+
+    # Bytes received but not written yet (by the current item's writer thread) or still held by the consumer.
+    def queued(self):
+        queued = self.file.queued() if self.file is not None else 0
+        if hasattr(self.consumer, 'queued'):
+            queued += self.consumer.queued(self.address)
+        return queued
+
+    def close(self):
+        self.held.clear()
+        if self.name is None:
+            return
+        # the connection ended in the middle of an item
+        if self.debug:
+            print("%s: item %s cut short" % (self.address, self.name))
+        if self.consumer is not None:
+            self.consumer(self.address, self.name, None, True)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.name = None
+
+    # A length or name is complete.
+    def _field(self):
+        field = bytes(self.field)
+        self.field.clear()
+        if self.expect == NAME_LENGTH:
+            self.expect = ITEM_NAME
+            self.need = HEADER.unpack(field)[0]
+        elif self.expect == ITEM_NAME:
+            self._begin(field.decode('utf-8', 'replace'))
+            self.expect = CHUNK_LENGTH
+            self.need = CHUNK.size
+        else:
+            self.remaining = CHUNK.unpack(field)[0]
+            if not self.remaining:
+                self._data(b'', True)
+                self.expect = NAME_LENGTH
+                self.need = HEADER.size
+
+    def _begin(self, name):
+        self.name = name
+        if self.consumer is not None:
+            return
+        path = item_path(name, self.output_path)
+        if path is None:
+            # its data is just dropped
+            if self.debug:
+                print("%s: not writing item %r anywhere" % (self.address, name))
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = Sink.FileSink(path, background=self.background, pool=self.pool)
+        Checkpoint.discard(path) # an interrupted single-file transfer to the same path can't resume over it now
+
+    def _data(self, data, last):
+        if self.consumer is not None:
+            self.consumer(self.address, self.name, data, last)
+        elif self.file is not None:
+            if last:
+                self.file.close()
+                self.file = None
+            else:
+                self.file.write(data)
+        if last:
+            self.items += 1
+            self.name = None
@@ -0,0 +1,220 @@
+'''
+File sinks
+Where the receiver's data goes. Instead of one write() and flush() per packet, a FileSink:
+    - coalesces in-order data and writes it with one vectored, positioned write once flush_bytes
+      have accumulated or flush_interval seconds have passed (checked on every write, and by the
+      receive loop through flush_if_due() when no more writes come)
+    - writes out-of-order data straight to its file offset (write_at) so it doesn't have to be
+      held in memory until the hole before it is filled
+    - preallocates the file when the sender announced its size
+    - optionally hands every write to a background thread so a slow disk doesn't stall the receive
+      loop; backlog() reports how much data is waiting for the disk
+    - can be one of several sinks writing disjoint ranges of the same file (striped transfers):
+      with truncate=False the file is not cut short when it is opened, and offset is where this
+      sink's in-order data starts
+    - optionally shares a FilePool with other sinks, which keeps at most a fixed number of their files open
+      and transparently closes and reopens the least recently used ones
+'''
+
+import collections
+import os
+import queue
+import threading
+import time
+
+FLUSH_BYTES = 1 << 20
+FLUSH_INTERVAL = 0.2
+WRITER_QUEUE = 64 # pending writes before the receive loop has to wait for the writer thread
+IOV_MAX = 1024
+OPEN_FILES = 256 # default FilePool limit
+_OPEN_FLAGS = os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+
+
+class FilePool(object):
+    def __init__(self, limit=OPEN_FILES):
+        self.limit = max(limit, 1)
+        self.open = collections.OrderedDict() # sinks with an open file, least recently used first
+
+    # The sink is about to use its file: keep it open, closing the least recently used ones over the limit.
+    def use(self, sink):
+        if sink in self.open:
+            self.open.move_to_end(sink)
+            return
+        while len(self.open) >= self.limit:
+            old, _ = self.open.popitem(last=False)
+            old._close_file()
+        self.open[sink] = None
+
+    def discard(self, sink):
+        self.open.pop(sink, None)
+
+
+class FileSink(object):
+    def __init__(self, path, flush_bytes=FLUSH_BYTES, flush_interval=FLUSH_INTERVAL, background=False, pool=None,
+                 offset=0, truncate=True):
+        if pool is not None and background:
+            raise ValueError("a FilePool can't be used with a background writer")
+        self.path = path
+        self.pool = pool
+        self.fd = None
+        if pool is not None:
+            pool.use(self)
+        self.fd = os.open(path, _OPEN_FLAGS | os.O_CREAT | (os.O_TRUNC if truncate else 0), 0o644)
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.position = offset # file offset of the next in-order byte
+        self.pending = [] # in-order chunks not written yet, starting at self.pending_offset
+        self.pending_offset = offset
+        self.pending_bytes = 0
+        self.last_flush = time.monotonic()
+        self.queued_bytes = 0
+        self.queued_lock = threading.Lock()
+        self.error = None
+        self.writer = None
+        if background:
+            self.jobs = queue.Queue(WRITER_QUEUE)
+            self.writer = threading.Thread(target=self._write_loop, name="sink-%s" % path, daemon=True)
+            self.writer.start()
+
+    # Best effort only: the file just grows as it is written if this doesn't work.
+    def preallocate(self, size):
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(self._file(), 0, size)
+            else:
+                os.ftruncate(self._file(), size)
+        except (OSError, OverflowError):
+            pass # not supported by this filesystem, no room for it, or a size no file can have
+
+    # Set the file's length. Data already written below 'size' is kept, so sinks sharing a file can all call this.
+    def resize(self, size):
+        os.ftruncate(self._file(), size)
+
+    # Make sure everything written so far survives a crash.
+    def sync(self):
+        self.flush(wait=True)
+        os.fsync(self._file())
+
+    # Append in-order data at the current position.
+    def write(self, data):
+        if not self.pending:
+            self.pending_offset = self.position
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        self.position += len(data)
+        if self.pending_bytes >= self.flush_bytes or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    # Write buffered in-order data once flush_interval has passed, even if no more data comes along to trigger it
+    # (the receive loop calls this while a connection waits for a hole to be filled or goes quiet). Returns whether
+    # data is still waiting for the interval to pass.
+    def flush_if_due(self):
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+        return bool(self.pending)
+
+    # Write out-of-order data straight to its offset.
+    def write_at(self, offset, data):
+        self._submit(offset, [data], len(data))
+
+    # The in-order position moves past data that was already written with write_at().
+    def skip_to(self, offset):
+        self.flush()
+        self.position = offset
+
+    # Hand buffered data to the disk; with wait=True also wait until the writer thread has written everything.
+    def flush(self, wait=False):
+        if self.pending:
+            self._submit(self.pending_offset, self.pending, self.pending_bytes)
+            self.pending = []
+            self.pending_bytes = 0
+        self.last_flush = time.monotonic()
+        if wait and self.writer is not None:
+            self.jobs.join()
+            self._check()
+
+    # Bytes accepted but not on disk yet.
+    def backlog(self):
+        return self.pending_bytes + self.queued_bytes
+
+    # Bytes handed to the writer thread that it hasn't written yet: how far behind the disk is.
+    def queued(self):
+        return self.queued_bytes
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.jobs.put(None)
+            self.writer.join()
+        self._close_file()
+        if self.pool is not None:
+            self.pool.discard(self)
+        self._check()
+
+    # The open file descriptor, reopened if the pool closed it.
+    def _file(self):
+        if self.pool is not None:
+            self.pool.use(self)
+        if self.fd is None:
+            self.fd = os.open(self.path, _OPEN_FLAGS)
+        return self.fd
+
+    def _close_file(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _submit(self, offset, chunks, size):
+        self._check()
+        if self.writer is None:
+            self._write(offset, chunks)
+        else:
+            with self.queued_lock:
+                self.queued_bytes += size
+            self.jobs.put((offset, chunks, size))
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _write_loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            offset, chunks, size = job
+            try:
+                self._write(offset, chunks)
+            except OSError as e:
+                self.error = e
+            with self.queued_lock:
+                self.queued_bytes -= size
+            self.jobs.task_done()
+
+    # One positioned, vectored write per IOV_MAX chunks, falling back to a joined pwrite or seek + write.
+    def _write(self, offset, chunks):
+        fd = self._file()
+        for first in range(0, len(chunks), IOV_MAX):
+            batch = chunks[first:first + IOV_MAX]
+            if hasattr(os, 'pwritev'):
+                written = os.pwritev(fd, batch, offset)
+                size = sum(len(chunk) for chunk in batch)
+                if written < size:
+                    self._pwrite(fd, offset + written, memoryview(b''.join(batch))[written:])
+                offset += size
+            else:
+                data = b''.join(batch)
+                self._pwrite(fd, offset, data)
+                offset += len(data)
+
+    def _pwrite(self, fd, offset, data):
+        if hasattr(os, 'pwrite'):
+            while len(data) > 0:
+                written = os.pwrite(fd, data, offset)
+                data = memoryview(data)[written:]
+                offset += written
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, data)
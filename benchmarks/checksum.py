@@ -0,0 +1,71 @@
+import binascii
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import Checksum
+import Packet
+
+'''
+Checksum microbenchmark
+Cost per GB of payload of every checksum algorithm, hashing an 8 byte header prefix and a 1458 byte payload
+memoryview as separate pieces (as Packet.py does), plus the full parse of a binary data packet with each one and the
+legacy text packet validation before and after it stopped copying the packet.
+
+    python benchmarks/checksum.py [payload size]
+'''
+
+DURATION = 0.5 # seconds each measurement runs for
+
+
+# Seconds per GB of payload for calling fn() once per packet of 'payload' bytes.
+def per_gb(fn, payload):
+    count = 0
+    batch = 16
+    start = time.perf_counter()
+    while True:
+        for n in range(batch):
+            fn()
+        count += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= DURATION:
+            break
+        batch = min(batch * 2, 4096)
+    return elapsed / count / payload * 1e9
+
+
+def old_validate_checksum(message):
+    try:
+        msg, reported_checksum = message.rsplit(b'|', 1)
+        msg += b'|'
+        return Checksum.generate_checksum(msg) == reported_checksum
+    except:
+        return False
+
+
+def main(size):
+    payload = memoryview(os.urandom(size))
+    prefix = os.urandom(8)
+    print("%-28s %12s" % ("checksum of %d bytes" % size, "s per GB"))
+    for name in sorted(Checksum.ALGORITHMS):
+        fn = Checksum.ALGORITHMS[name]
+        print("%-28s %12.3f" % (name, per_gb(lambda: fn(prefix, payload), size)))
+    print("%-28s %12.3f" % ("crc32 on a joined copy", per_gb(lambda: binascii.crc32(prefix + bytes(payload)), size)))
+
+    print()
+    print("%-28s %12s" % ("full packet parse", "s per GB"))
+    for name in sorted(Checksum.ALGORITHMS):
+        fn = Checksum.ALGORITHMS[name]
+        packet = Packet.make_binary('data', 12345, payload, 0, fn)
+        assert Packet.parse_binary(packet, fn)[4]
+        print("%-28s %12.3f" % ("binary, " + name, per_gb(lambda: Packet.parse_binary(packet, fn), size)))
+    legacy = Packet.make_legacy('data', 12345, payload)
+    assert Checksum.validate_checksum(legacy) and old_validate_checksum(legacy)
+    print("%-28s %12.3f" % ("legacy validate, before", per_gb(lambda: old_validate_checksum(legacy), size)))
+    print("%-28s %12.3f" % ("legacy validate, now", per_gb(lambda: Checksum.validate_checksum(legacy), size)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1458)
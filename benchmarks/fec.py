@@ -0,0 +1,112 @@
+import getopt
+import json
+import os
+import shlex
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import ImpairmentProxy
+import throughput
+
+'''
+FEC benchmark
+Sends files through ImpairmentProxy.py, by default with the 'satellite' profile (300 ms each way, 1% loss), with
+forward error correction off and with each of the given block sizes (Sender.py -F), and reports the completion time
+against the overhead it cost: the parity packets and everything else the sender put on the wire beyond the file
+itself (headers, retransmissions, path MTU probes), both as a fraction of the file size, and the retransmission ratio.
+Runs go through throughput.run(), so the numbers mean the same as there.
+
+    python benchmarks/fec.py [-s SIZES] [-i PROFILES] [-f SETTINGS] [-a SENDER_ARGS] [-n REPEAT] [-t TIMEOUT] [-j]
+
+    python benchmarks/fec.py -s 4M -f off,4,8,16,auto
+    python benchmarks/fec.py -s 4M -i satellite,lossy -f off,8 -n 3
+'''
+
+SETTINGS = 'off,4,8,16,auto'
+PROFILES = 'satellite'
+
+
+def run(size, profile, setting, sender_args, timeout):
+    args = sender_args + ([] if setting == 'off' else ['-F', setting])
+    result = throughput.run(size, profile, 'sync', args, timeout)
+    proxy = result['proxy']
+    result.update(fec=setting,
+                  overhead=round(proxy.get('forward_bytes', 0) / size - 1, 4) if size else 0.0,
+                  parity_overhead=round(proxy.get('parity_bytes', 0) / size, 4) if size else 0.0)
+    return result
+
+
+def print_row(result):
+    print("%-10s %10d %-6s %6s %9.3f %12.2f %9.1f%% %9.1f%% %10.4f" % (
+        result['profile'], result['size'], result['fec'], 'ok' if result['intact'] else 'FAIL', result['seconds'],
+        result['goodput_mbps'], result['overhead'] * 100, result['parity_overhead'] * 100,
+        result['retransmit_ratio']))
+
+
+if __name__ == "__main__":
+    def usage():
+        print("FEC benchmark")
+        print("-s SIZES | --sizes=SIZES Comma separated file sizes, k/M/G suffixes allowed, defaults to 4M")
+        print("-i PROFILES | --profiles=PROFILES Comma separated impairment profiles, defaults to %s" % PROFILES)
+        print("-f SETTINGS | --fec=SETTINGS Comma separated FEC settings: off, a block size or auto, defaults to %s" %
+              SETTINGS)
+        print("-a ARGS | --sender-args=ARGS Extra arguments for Sender.py, e.g. '-c bbr'")
+        print("-n COUNT | --repeat=COUNT Runs of every combination, defaults to 1")
+        print("-t SECONDS | --timeout=SECONDS Give up on a transfer after this long, defaults to 300")
+        print("-j | --json Print JSON lines instead of a table")
+        print("-h | --help Print this usage message")
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "s:i:f:a:n:t:jh",
+                                   ["sizes=", "profiles=", "fec=", "sender-args=", "repeat=", "timeout=", "json",
+                                    "help"])
+    except getopt.GetoptError:
+        usage()
+        exit()
+
+    sizes = [4 << 20]
+    profiles = PROFILES.split(',')
+    settings = SETTINGS.split(',')
+    sender_args = []
+    repeat = 1
+    timeout = 300
+    as_json = False
+
+    for o, a in opts:
+        if o in ("-s", "--sizes"):
+            sizes = [throughput.parse_size(s) for s in a.split(',')]
+        elif o in ("-i", "--profiles"):
+            profiles = a.split(',')
+        elif o in ("-f", "--fec"):
+            settings = a.split(',')
+        elif o in ("-a", "--sender-args"):
+            sender_args = shlex.split(a)
+        elif o in ("-n", "--repeat"):
+            repeat = int(a)
+        elif o in ("-t", "--timeout"):
+            timeout = int(a)
+        elif o in ("-j", "--json"):
+            as_json = True
+        else:
+            usage()
+            exit()
+
+    if any(p not in ImpairmentProxy.PROFILES for p in profiles) or \
+            any(s not in ('off', 'auto') and not s.isdigit() for s in settings):
+        usage()
+        exit()
+
+    if not as_json:
+        print("%-10s %10s %-6s %6s %9s %12s %10s %10s %10s" % ("profile", "bytes", "fec", "result", "seconds",
+                                                              "Mbit/s", "overhead", "parity", "retransmit"))
+    for size in sizes:
+        for profile in profiles:
+            for setting in settings:
+                for n in range(repeat):
+                    result = run(size, profile, setting, sender_args, timeout)
+                    if as_json:
+                        print(json.dumps(result), flush=True)
+                    else:
+                        print_row(result)
@@ -0,0 +1,140 @@
+import getopt
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import Sender
+
+'''
+Receiver load test
+Starts one receiver (AsyncReceiver.py by default, the blocking Receiver.py, or a ReceiverPool.py of async workers,
+one per CPU) and drives thousands of simultaneous
+Sender flows at its port, one thread per Sender, all released at the same moment. Checks every output file and
+reports the time taken, the number of flows that completed and the most files the receiver had open at once (not
+counted for the pool, whose files are open in its workers).
+
+    python benchmarks/receiver_load.py [-n SENDERS] [-s BYTES] [-r async|sync|pool] [-m MAX_OPEN_FILES] [-p PORT]
+'''
+
+RECEIVERS = {
+    'async': 'AsyncReceiver.py',
+    'sync': 'Receiver.py',
+    'pool': 'ReceiverPool.py'
+}
+
+
+# Number of open file descriptors of a process that are regular files (not sockets, pipes or epoll instances).
+def open_files(pid):
+    count = 0
+    try:
+        for fd in os.listdir('/proc/%d/fd' % pid):
+            target = os.readlink('/proc/%d/fd/%s' % (pid, fd))
+            if target.startswith('/') and not target.startswith('/dev/'):
+                count += 1
+    except OSError:
+        pass
+    return count
+
+
+def run(senders, size, receiver, max_open_files, port):
+    workdir = tempfile.mkdtemp(prefix='receiver_load_')
+    os.chdir(workdir)
+    names = ['in_%d.bin' % n for n in range(senders)]
+    for name in names:
+        with open(name, 'wb') as f:
+            f.write(os.urandom(size))
+
+    command = [sys.executable, os.path.join(ROOT, RECEIVERS[receiver]), '-p', str(port), '-t', '30']
+    if receiver == 'async':
+        command += ['-m', str(max_open_files)]
+    elif receiver == 'pool':
+        command += ['-a']
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    time.sleep(1.0)
+
+    peak = [0]
+    done = threading.Event()
+
+    def watch():
+        while not done.is_set():
+            peak[0] = max(peak[0], open_files(process.pid))
+            time.sleep(0.05)
+
+    results = [None] * senders
+    barrier = threading.Barrier(senders + 1)
+
+    def flow(n):
+        sender = Sender.Sender('localhost', port, names[n], timeout=30)
+        barrier.wait()
+        started = time.perf_counter()
+        sender.start()
+        results[n] = time.perf_counter() - started
+
+    threading.stack_size(256 * 1024)
+    threads = [threading.Thread(target=flow, args=(n,), daemon=True) for n in range(senders)]
+    for thread in threads:
+        thread.start()
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    # every sender is waiting on the barrier, so the clock starts when this thread releases them
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    time.sleep(0.5)
+    done.set()
+    process.terminate()
+    process.wait()
+    if receiver == 'pool':
+        time.sleep(0.5) # the workers may still be closing files
+
+    intact = 0
+    for name in names:
+        try:
+            with open(name, 'rb') as a, open('out_' + name, 'rb') as b:
+                intact += a.read() == b.read()
+        except OSError:
+            pass
+    finished = [t for t in results if t is not None]
+    finished.sort()
+    print("%s receiver, %d senders x %d bytes" % (receiver, senders, size))
+    print("  total time       %8.2f s" % elapsed)
+    print("  throughput       %8.2f MB/s" % (senders * size / elapsed / 1e6))
+    print("  completed        %8d / %d (%d files intact)" % (len(finished), senders, intact))
+    if finished:
+        print("  flow time p50    %8.2f s" % finished[len(finished) // 2])
+        print("  flow time max    %8.2f s" % finished[-1])
+    print("  peak open files  %8d" % peak[0])
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "n:s:r:m:p:", ["senders=", "size=", "receiver=", "max-open-files=",
+                                                            "port="])
+    senders = 2000
+    size = 16384
+    receiver = 'async'
+    max_open_files = 256
+    port = random.randint(41000, 49000)
+    for o, a in opts:
+        if o in ("-n", "--senders"):
+            senders = int(a)
+        elif o in ("-s", "--size"):
+            size = int(a)
+        elif o in ("-r", "--receiver"):
+            receiver = a
+        elif o in ("-m", "--max-open-files"):
+            max_open_files = int(a)
+        elif o in ("-p", "--port"):
+            port = int(a)
+    run(senders, size, receiver, max_open_files, port)
@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import SendWindow
+
+'''
+Send window microbenchmark
+Steady state cost per acknowledged packet for windows of growing size: look a packet up by seqno
+(as a SACK block does), ack and release the oldest packet, append a new one and find the next
+packet to send. Compares the old list-of-lists window with SendWindow.
+
+    python benchmarks/send_window.py [window sizes...]
+'''
+
+PAYLOAD = 1458
+STEPS = 20000
+
+
+def bench_list(size):
+    window = [[n * PAYLOAD, b'', True] for n in range(size)]
+    next_seqno = size * PAYLOAD
+    start = time.perf_counter()
+    for step in range(STEPS):
+        # SACK lookup: linear scan for the seqno
+        target = window[random.randrange(size)][0]
+        for entry in window:
+            if entry[0] == target:
+                break
+        # cumulative ack of the oldest packet
+        del window[0]
+        window.append([next_seqno, b'', False])
+        next_seqno += PAYLOAD
+        # find the first unsent packet, scanning from the start
+        for entry in window:
+            if not entry[2]:
+                entry[2] = True
+                break
+    return (time.perf_counter() - start) / STEPS
+
+
+def bench_ring(size):
+    window = SendWindow.SendWindow(size + 1)
+    for n in range(size):
+        segment = SendWindow.Segment('data', n * PAYLOAD, b'')
+        window.append(segment)
+        window.take_unsent()
+        window.sent(segment, 0.0, 1e9)
+    next_seqno = size * PAYLOAD
+    start = time.perf_counter()
+    for step in range(STEPS):
+        target = window[random.randrange(size)].seqno
+        window.find(target)
+        window.release()
+        window.append(SendWindow.Segment('data', next_seqno, b''))
+        next_seqno += PAYLOAD
+        segment = window.next_unsent()
+        window.take_unsent()
+        window.sent(segment, 0.0, 1e9)
+    return (time.perf_counter() - start) / STEPS
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5, 100, 1000, 10000, 50000]
+    print("%10s %14s %14s %8s" % ("window", "list us/ack", "ring us/ack", "speedup"))
+    for size in sizes:
+        old = bench_list(size)
+        new = bench_ring(size)
+        print("%10d %14.2f %14.2f %7.1fx" % (size, old * 1e6, new * 1e6, old / new))
@@ -0,0 +1,168 @@
+import getopt
+import json
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import ImpairmentProxy
+import throughput
+
+'''
+Session benchmark
+Sends a directory of equally sized files through ImpairmentProxy.py twice: once with one Sender.py run per file, each
+paying for its own handshake and slow start, and once as a single session (Sender.py -f DIRECTORY, see Session.py),
+and reports for both whether every file arrived intact, the completion time, the files per second and the goodput.
+
+    python benchmarks/session.py [-c COUNT] [-s SIZE] [-i PROFILES] [-a SENDER_ARGS] [-n REPEAT] [-t TIMEOUT] [-j]
+
+    python benchmarks/session.py -c 200 -s 16k -i clean,wan
+'''
+
+PROFILES = 'clean,wan'
+MODES = ('separate', 'session')
+
+
+def run(count, size, profile_name, mode, sender_args, timeout):
+    workdir = tempfile.mkdtemp(prefix='session_')
+    try:
+        items = os.path.join(workdir, 'items')
+        os.mkdir(items)
+        names = ['f%05d' % n for n in range(count)]
+        for name in names:
+            with open(os.path.join(items, name), 'wb') as f:
+                f.write(os.urandom(size))
+
+        port = throughput.free_port()
+        receiver = subprocess.Popen([sys.executable, os.path.join(ROOT, 'Receiver.py'), '-p', str(port),
+                                     '-t', str(timeout)],
+                                    cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        proxy = ImpairmentProxy.ImpairmentProxy(0, ('127.0.0.1', port), ImpairmentProxy.PROFILES[profile_name],
+                                                seed=count)
+        proxy_thread = threading.Thread(target=proxy.serve, daemon=True)
+        proxy_thread.start()
+        time.sleep(0.5) # let the receiver bind its port
+
+        sender = [sys.executable, os.path.join(ROOT, 'Sender.py'), '-p', str(proxy.port)] + sender_args
+        if mode == 'session':
+            # a session writes the directory's files to out_items/
+            runs = [(sender + ['-f', 'items'], workdir)]
+            outputs = [os.path.join(workdir, 'out_items', name) for name in names]
+        else:
+            runs = [(sender + ['-f', name], items) for name in names]
+            outputs = [os.path.join(workdir, 'out_' + name) for name in names]
+        started = time.perf_counter()
+        completed = True
+        for args, cwd in runs:
+            try:
+                completed = subprocess.run(args, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                           timeout=max(timeout - (time.perf_counter() - started), 1)).returncode == 0
+            except subprocess.TimeoutExpired:
+                completed = False
+            if not completed:
+                break
+        elapsed = time.perf_counter() - started
+
+        proxy.stop()
+        proxy_thread.join()
+        receiver.send_signal(signal.SIGINT)
+        try:
+            receiver.wait(5.0)
+        except subprocess.TimeoutExpired:
+            receiver.kill()
+            receiver.wait()
+
+        intact = completed and all(throughput.same_contents(os.path.join(items, name), output)
+                                   for name, output in zip(names, outputs))
+        return {
+            'profile': profile_name,
+            'files': count,
+            'size': size,
+            'mode': mode,
+            'sender_args': ' '.join(sender_args),
+            'intact': intact,
+            'seconds': round(elapsed, 4),
+            'files_per_second': round(count / elapsed, 2) if intact else 0.0,
+            'goodput_mbps': round(count * size * 8 / elapsed / 1e6, 3) if intact else 0.0,
+            'proxy': dict(proxy.stats)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_row(result):
+    print("%-10s %7d %10d %-9s %6s %9.3f %10.2f %12.2f" % (
+        result['profile'], result['files'], result['size'], result['mode'], 'ok' if result['intact'] else 'FAIL',
+        result['seconds'], result['files_per_second'], result['goodput_mbps']))
+
+
+if __name__ == "__main__":
+    def usage():
+        print("Session benchmark")
+        print("-c COUNT | --count=COUNT Files to send, defaults to 100")
+        print("-s SIZE | --size=SIZE Size of every file, k/M/G suffixes allowed, defaults to 64k")
+        print("-i PROFILES | --profiles=PROFILES Comma separated impairment profiles, defaults to %s" % PROFILES)
+        print("-a ARGS | --sender-args=ARGS Extra arguments for Sender.py, e.g. '-c bbr'")
+        print("-n COUNT | --repeat=COUNT Runs of every combination, defaults to 1")
+        print("-t SECONDS | --timeout=SECONDS Give up on a run after this long, defaults to 300")
+        print("-j | --json Print JSON lines instead of a table")
+        print("-h | --help Print this usage message")
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "c:s:i:a:n:t:jh",
+                                   ["count=", "size=", "profiles=", "sender-args=", "repeat=", "timeout=", "json",
+                                    "help"])
+    except getopt.GetoptError:
+        usage()
+        exit()
+
+    count = 100
+    size = 64 << 10
+    profiles = PROFILES.split(',')
+    sender_args = []
+    repeat = 1
+    timeout = 300
+    as_json = False
+
+    for o, a in opts:
+        if o in ("-c", "--count"):
+            count = int(a)
+        elif o in ("-s", "--size"):
+            size = throughput.parse_size(a)
+        elif o in ("-i", "--profiles"):
+            profiles = a.split(',')
+        elif o in ("-a", "--sender-args"):
+            sender_args = shlex.split(a)
+        elif o in ("-n", "--repeat"):
+            repeat = int(a)
+        elif o in ("-t", "--timeout"):
+            timeout = int(a)
+        elif o in ("-j", "--json"):
+            as_json = True
+        else:
+            usage()
+            exit()
+
+    if count < 1 or any(p not in ImpairmentProxy.PROFILES for p in profiles):
+        usage()
+        exit()
+
+    if not as_json:
+        print("%-10s %7s %10s %-9s %6s %9s %10s %12s" % ("profile", "files", "bytes", "mode", "result", "seconds",
+                                                        "files/s", "Mbit/s"))
+    for profile in profiles:
+        for mode in MODES:
+            for n in range(repeat):
+                result = run(count, size, profile, mode, sender_args, timeout)
+                if as_json:
+                    print(json.dumps(result), flush=True)
+                else:
+                    print_row(result)
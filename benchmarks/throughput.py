@@ -0,0 +1,273 @@
+import getopt
+import json
+import os
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import ImpairmentProxy
+
+'''
+Throughput benchmark
+Sends files of every size through ImpairmentProxy.py with every impairment profile, Sender.py and the receiver running
+as their own processes on loopback, and reports for every run whether it completed with the file intact, the
+completion time, the goodput, the retransmission ratio (data packets the sender sent again, as seen by the proxy,
+over all data packets) and the CPU time of the sender and the receiver.
+
+With -j every run is printed as one JSON object per line instead of a table. -o writes the same JSON lines to a file,
+which can later be given to -c as a baseline: the benchmark then exits with status 1 if a run fails or its goodput
+falls more than the tolerance (-x, a fraction) below the baseline's for the same size, profile, receiver and sender
+arguments (runs with no such baseline aren't compared).
+
+    python benchmarks/throughput.py [-s SIZES] [-i PROFILES] [-r sync|async] [-a SENDER_ARGS] [-n REPEAT]
+                                    [-t TIMEOUT] [-j] [-o FILE] [-c BASELINE] [-x TOLERANCE]
+
+    python benchmarks/throughput.py -s 1M,16M -i clean,lossy -o baseline.json
+    python benchmarks/throughput.py -s 1M,16M -i clean,lossy -c baseline.json
+'''
+
+RECEIVERS = {
+    'sync': 'Receiver.py',
+    'async': 'AsyncReceiver.py'
+}
+SIZES = '1M,16M'
+SIZE_SUFFIXES = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+
+def parse_size(text):
+    scale = SIZE_SUFFIXES.get(text[-1:].lower())
+    return int(text[:-1]) * scale if scale else int(text)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Waits for a child process and returns the CPU seconds (user + system) it used.
+def cpu_time(process, timeout=None):
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return usage.ru_utime + usage.ru_stime
+        if deadline is not None and time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(0.005)
+
+
+def same_contents(a, b):
+    try:
+        with open(a, 'rb') as x, open(b, 'rb') as y:
+            while True:
+                one = x.read(1 << 20)
+                if one != y.read(1 << 20):
+                    return False
+                if not one:
+                    return True
+    except OSError:
+        return False
+
+
+def run(size, profile_name, receiver, sender_args, timeout):
+    workdir = tempfile.mkdtemp(prefix='throughput_')
+    try:
+        name = 'in.bin'
+        with open(os.path.join(workdir, name), 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                chunk = os.urandom(min(remaining, 1 << 20))
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        port = free_port()
+        receiver_process = subprocess.Popen([sys.executable, os.path.join(ROOT, RECEIVERS[receiver]),
+                                             '-p', str(port), '-t', str(timeout)],
+                                            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        profile = ImpairmentProxy.PROFILES[profile_name]
+        proxy = ImpairmentProxy.ImpairmentProxy(0, ('127.0.0.1', port), profile, seed=size)
+        proxy_thread = threading.Thread(target=proxy.serve, daemon=True)
+        proxy_thread.start()
+        time.sleep(0.5) # let the receiver bind its port
+
+        started = time.perf_counter()
+        sender_process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'Sender.py'), '-f', name,
+                                           '-p', str(proxy.port)] + sender_args,
+                                          cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            sender_cpu = cpu_time(sender_process, timeout)
+            completed = sender_process.returncode == 0
+        except subprocess.TimeoutExpired:
+            sender_process.kill()
+            sender_cpu = cpu_time(sender_process)
+            completed = False
+        elapsed = time.perf_counter() - started
+
+        proxy.stop()
+        proxy_thread.join()
+        # the receiver finishes its connections on SIGINT
+        receiver_process.send_signal(signal.SIGINT)
+        try:
+            receiver_cpu = cpu_time(receiver_process, 5.0)
+        except subprocess.TimeoutExpired:
+            receiver_process.kill()
+            receiver_cpu = cpu_time(receiver_process)
+
+        intact = same_contents(os.path.join(workdir, name), os.path.join(workdir, 'out_' + name))
+        stats = proxy.stats
+        data_packets = stats['data_packets']
+        return {
+            'size': size,
+            'profile': profile_name,
+            'receiver': receiver,
+            'sender_args': ' '.join(sender_args),
+            'completed': completed,
+            'intact': intact,
+            'seconds': round(elapsed, 4),
+            'goodput_mbps': round(size * 8 / elapsed / 1e6, 3) if intact else 0.0,
+            'retransmit_ratio': round(stats['data_retransmits'] / data_packets, 5) if data_packets else 0.0,
+            'sender_cpu': round(sender_cpu, 4),
+            'receiver_cpu': round(receiver_cpu, 4),
+            'proxy': dict(stats)
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_row(result):
+    print("%-8s %10d %-10s %6s %9.3f %12.2f %10.4f %9.3f %9.3f" % (
+        result['profile'], result['size'], result['receiver'], 'ok' if result['intact'] else 'FAIL',
+        result['seconds'], result['goodput_mbps'], result['retransmit_ratio'], result['sender_cpu'],
+        result['receiver_cpu']))
+
+
+# What a run is compared on: only runs of the same setup are comparable.
+def baseline_key(run):
+    return (run['size'], run['profile'], run['receiver'], run['sender_args'])
+
+
+def describe(key):
+    size, profile, receiver, sender_args = key
+    return "%s %d %s%s" % (profile, size, receiver, " (%s)" % sender_args if sender_args else "")
+
+
+# Failures and goodput regressions of 'results' against the runs in a JSON lines baseline file.
+def regressions(results, baseline_path, tolerance):
+    baseline = {}
+    with open(baseline_path) as f:
+        for line in f:
+            if line.strip():
+                run = json.loads(line)
+                baseline.setdefault(baseline_key(run), []).append(run['goodput_mbps'])
+    problems = []
+    for result in results:
+        key = baseline_key(result)
+        if not result['intact']:
+            problems.append("%s: transfer failed" % describe(key))
+        elif key in baseline:
+            expected = sum(baseline[key]) / len(baseline[key])
+            if result['goodput_mbps'] < expected * (1 - tolerance):
+                problems.append("%s: %.2f Mbit/s, baseline %.2f" % (describe(key), result['goodput_mbps'], expected))
+    return problems
+
+
+if __name__ == "__main__":
+    def usage():
+        print("Throughput benchmark")
+        print("-s SIZES | --sizes=SIZES Comma separated file sizes, k/M/G suffixes allowed, defaults to %s" % SIZES)
+        print("-i PROFILES | --profiles=PROFILES Comma separated impairment profiles, defaults to all: %s" %
+              ", ".join(sorted(ImpairmentProxy.PROFILES)))
+        print("-r RECEIVER | --receiver=RECEIVER sync (Receiver.py) or async (AsyncReceiver.py), defaults to sync")
+        print("-a ARGS | --sender-args=ARGS Extra arguments for Sender.py, e.g. '-c bbr'")
+        print("-n COUNT | --repeat=COUNT Runs of every combination, defaults to 1")
+        print("-t SECONDS | --timeout=SECONDS Give up on a transfer after this long, defaults to 120")
+        print("-j | --json Print JSON lines instead of a table")
+        print("-o FILE | --output=FILE Also write the results to FILE as JSON lines")
+        print("-c FILE | --compare=FILE Fail on regressions against a baseline written with -o")
+        print("-x FRACTION | --tolerance=FRACTION Allowed goodput drop against the baseline, defaults to 0.2")
+        print("-h | --help Print this usage message")
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "s:i:r:a:n:t:jo:c:x:h",
+                                   ["sizes=", "profiles=", "receiver=", "sender-args=", "repeat=", "timeout=",
+                                    "json", "output=", "compare=", "tolerance=", "help"])
+    except getopt.GetoptError:
+        usage()
+        exit()
+
+    sizes = [parse_size(s) for s in SIZES.split(',')]
+    profiles = sorted(ImpairmentProxy.PROFILES)
+    receiver = 'sync'
+    sender_args = []
+    repeat = 1
+    timeout = 120
+    as_json = False
+    output = None
+    compare = None
+    tolerance = 0.2
+
+    for o, a in opts:
+        if o in ("-s", "--sizes"):
+            sizes = [parse_size(s) for s in a.split(',')]
+        elif o in ("-i", "--profiles"):
+            profiles = a.split(',')
+        elif o in ("-r", "--receiver"):
+            receiver = a
+        elif o in ("-a", "--sender-args"):
+            sender_args = shlex.split(a)
+        elif o in ("-n", "--repeat"):
+            repeat = int(a)
+        elif o in ("-t", "--timeout"):
+            timeout = int(a)
+        elif o in ("-j", "--json"):
+            as_json = True
+        elif o in ("-o", "--output"):
+            output = a
+        elif o in ("-c", "--compare"):
+            compare = a
+        elif o in ("-x", "--tolerance"):
+            tolerance = float(a)
+        else:
+            usage()
+            exit()
+
+    if receiver not in RECEIVERS or any(p not in ImpairmentProxy.PROFILES for p in profiles):
+        usage()
+        exit()
+
+    if not as_json:
+        print("%-8s %10s %-10s %6s %9s %12s %10s %9s %9s" % ("profile", "bytes", "receiver", "result", "seconds",
+                                                            "Mbit/s", "retransmit", "cpu send", "cpu recv"))
+    results = []
+    out = open(output, 'w') if output else None
+    for size in sizes:
+        for profile in profiles:
+            for n in range(repeat):
+                result = run(size, profile, receiver, sender_args, timeout)
+                results.append(result)
+                if as_json:
+                    print(json.dumps(result), flush=True)
+                else:
+                    print_row(result)
+                if out is not None:
+                    out.write(json.dumps(result) + '\n')
+                    out.flush()
+    if out is not None:
+        out.close()
+
+    if compare:
+        problems = regressions(results, compare, tolerance)
+        for problem in problems:
+            print("regression: %s" % problem)
+        sys.exit(1 if problems else 0)
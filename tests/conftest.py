@@ -0,0 +1,10 @@
+'''
+Test setup shared by every test module: the modules under test live at the top of the repository, next to this
+directory, and are imported as they are there (python -m pytest tests).
+'''
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import Checkpoint
+import Receiver
+
+SIZE = 1 << 20
+MTIME = 1792300000000000000
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix='checkpoint_')
+        os.chdir(self.workdir) # connections write out_<filename> to the current directory
+        self.data = os.urandom(SIZE)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # A SACK connection for 'f', resuming if a checkpoint is given; its data starts at seqno 1.
+    def connection(self, checkpoint=None):
+        return Receiver.Connection('127.0.0.1', 1, 0, 'f', sack=True, size=SIZE, checkpoint=checkpoint)
+
+    def resume(self):
+        return Checkpoint.open_checkpoint(Receiver.output_path('f'), SIZE, MTIME)
+
+    # Receives the file from where the connection starts up to 'end' and then loses the sender.
+    def interrupt(self, conn, end):
+        conn.record(self.data[conn.file_offset:end])
+        conn.end()
+
+    def test_resumes_where_it_stopped(self):
+        self.interrupt(self.connection(self.resume()), 600000)
+        checkpoint = self.resume()
+        self.assertEqual(checkpoint.offset(), 600000)
+        conn = self.connection(checkpoint)
+        conn.record(self.data[600000:])
+        conn.finished = True
+        conn.end()
+        with open('out_f', 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists('out_f' + Checkpoint.SUFFIX))
+
+    def test_other_version_starts_over(self):
+        self.interrupt(self.connection(self.resume()), 600000)
+        self.assertEqual(Checkpoint.open_checkpoint('out_f', SIZE, MTIME + 1).offset(), 0)
+        self.assertEqual(Checkpoint.open_checkpoint('out_f', SIZE + 1, MTIME).offset(), 0)
+
+    def test_plain_transfer_discards_checkpoint(self):
+        # a resumable transfer stops, a plain one rewrites the (preallocated) output and stops earlier: resuming
+        # at the first one's offset would keep whatever the second one never got to
+        self.interrupt(self.connection(self.resume()), 600000)
+        self.interrupt(self.connection(), 200000)
+        self.assertFalse(os.path.exists('out_f' + Checkpoint.SUFFIX))
+        self.assertEqual(self.resume().offset(), 0)
+
+    def test_replaced_output_starts_over(self):
+        self.interrupt(self.connection(self.resume()), 600000)
+        with open('out_g', 'wb') as f:
+            f.write(self.data)
+        os.replace('out_g', 'out_f')
+        self.assertEqual(self.resume().offset(), 0)
+
+    def test_taken_over_checkpoint_is_not_saved(self):
+        first = self.connection(self.resume())
+        first.record(self.data[:600000])
+        first.save_checkpoint()
+        # a plain transfer of the same file starts while the first connection is still around
+        self.interrupt(self.connection(), 100000)
+        self.interrupt(first, 700000)
+        self.assertIsNone(first.checkpoint)
+        self.assertEqual(self.resume().offset(), 0)
+
+    def test_newer_resume_owns_checkpoint(self):
+        first = self.connection(self.resume())
+        first.record(self.data[:600000])
+        first.save_checkpoint()
+        second = self.connection(self.resume())
+        self.assertEqual(second.file_offset, 600000)
+        self.assertFalse(first.checkpoint.save([[0, 700000]]))
+        self.interrupt(second, 800000)
+        self.assertEqual(self.resume().offset(), 800000)
@@ -0,0 +1,68 @@
+import os
+import unittest
+
+import Checksum
+
+
+# RFC 1071 word by word: the ones' complement of the ones' complement sum of big endian 16 bit words.
+def reference_internet(data):
+    if len(data) & 1:
+        data += b'\0'
+    total = 0
+    for i in range(0, len(data), 2):
+        total += (data[i] << 8) | data[i + 1]
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+class InternetChecksumTest(unittest.TestCase):
+    def test_rfc1071_example(self):
+        self.assertEqual(Checksum.internet(bytes.fromhex('0001f203f4f5f6f7')), 0x220d)
+
+    def test_matches_reference(self):
+        for size in (0, 1, 2, 3, 17, 1000, 1473):
+            data = os.urandom(size)
+            self.assertEqual(Checksum.internet(data), reference_internet(data), size)
+        for data in (b'\0' * 10, b'\xff' * 10, b'\xff\xff\0\0'):
+            self.assertEqual(Checksum.internet(data), reference_internet(data), data)
+
+    def test_pieces(self):
+        data = os.urandom(301)
+        for cut in (0, 1, 2, 7, 150, 300, 301):
+            self.assertEqual(Checksum.internet(data[:cut], memoryview(data)[cut:]), Checksum.internet(data), cut)
+
+
+class AlgorithmTest(unittest.TestCase):
+    def test_crc32c_check_value(self):
+        self.assertEqual(Checksum.crc32c(b'123456789'), 0xe3069283)
+        self.assertEqual(Checksum.crc32c(b'1234', b'56789'), 0xe3069283)
+
+    def test_crc32_pieces(self):
+        self.assertEqual(Checksum.crc32(b'1234', memoryview(b'56789')), Checksum.crc32(b'123456789'))
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            Checksum.get('md5')
+
+
+class NegotiationTest(unittest.TestCase):
+    def setUp(self):
+        self.native = Checksum.CRC32C_NATIVE
+        self.addCleanup(setattr, Checksum, 'CRC32C_NATIVE', self.native)
+
+    def test_first_known(self):
+        self.assertEqual(Checksum.negotiate('md5,internet,crc32'), 'internet')
+        self.assertIsNone(Checksum.negotiate('md5'))
+        self.assertIsNone(Checksum.negotiate(None))
+
+    def test_crc32c_needs_native(self):
+        Checksum.CRC32C_NATIVE = False
+        self.assertEqual(Checksum.offer('crc32c'), 'crc32')
+        self.assertEqual(Checksum.negotiate('crc32c,crc32'), 'crc32')
+        Checksum.CRC32C_NATIVE = True
+        self.assertEqual(Checksum.offer('crc32c'), 'crc32c,crc32')
+        self.assertEqual(Checksum.negotiate('crc32c,crc32'), 'crc32c')
+
+    def test_offer(self):
+        self.assertEqual(Checksum.offer('crc32'), 'crc32')
+        self.assertEqual(Checksum.offer('internet'), 'internet,crc32')
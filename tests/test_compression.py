@@ -0,0 +1,67 @@
+import os
+import unittest
+
+import Compression
+
+PAYLOAD = 1458
+
+
+# The part of ChunkSource's interface a SegmentCompressor reads from.
+class BytesSource(object):
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, offset, size):
+        return self.data[offset:offset + size]
+
+
+class SegmentCompressorTest(unittest.TestCase):
+    # Every chunk the compressor hands out for 'data', as (raw, payload or None); checks they add up to the data and
+    # that every payload fits into a packet and decompresses to its chunk.
+    def chunks(self, data, name='zlib'):
+        compressor = Compression.SegmentCompressor(name, Compression.get(name).default_level, BytesSource(data), 0,
+                                                   payload_size=PAYLOAD, workers=2)
+        self.addCleanup(compressor.close)
+        chunks = []
+        while True:
+            chunk = compressor.next()
+            if chunk is None:
+                break
+            raw, payload = chunk
+            self.assertLessEqual(len(payload if payload is not None else raw), PAYLOAD)
+            if payload is not None:
+                self.assertEqual(Compression.decompress(name, payload), raw)
+            chunks.append(chunk)
+        self.assertEqual(b''.join(raw for raw, payload in chunks), data)
+        self.compressor = compressor
+        return chunks
+
+    def test_compresses(self):
+        data = b''.join(b'line %d of a very compressible file\n' % n for n in range(20000))
+        for name in Compression.CODECS:
+            chunks = self.chunks(data, name)
+            self.assertTrue(all(payload is not None for raw, payload in chunks))
+            self.assertLess(self.compressor.wire_bytes, len(data) / 4)
+
+    def test_incompressible_data_is_bypassed(self):
+        data = os.urandom(3 << 20)
+        chunks = self.chunks(data)
+        self.assertTrue(all(payload is None for raw, payload in chunks))
+        self.assertEqual(self.compressor.wire_bytes, len(data))
+        # one 1 MiB bypass after the first misses, then a 2 MiB one after the next
+        self.assertEqual(self.compressor.bypass_bytes, 4 * Compression.BYPASS_BYTES)
+
+    def test_compression_resumes_after_bypass(self):
+        data = os.urandom(64 << 10) + bytes(2 << 20)
+        chunks = self.chunks(data)
+        self.assertIsNone(chunks[0][1])
+        self.assertIsNotNone(chunks[-1][1])
+        self.assertEqual(self.compressor.bypass_bytes, Compression.BYPASS_BYTES)
+        self.assertLess(self.compressor.wire_bytes, (64 << 10) + Compression.BYPASS_BYTES)
+
+    def test_bad_payload(self):
+        with self.assertRaises(ValueError):
+            Compression.decompress('zlib', os.urandom(100))
+        payload = Compression.get('zlib').compress(bytes(Compression.MAX_RAW + 1), 6)
+        with self.assertRaises(ValueError):
+            Compression.decompress('zlib', payload)
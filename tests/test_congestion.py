@@ -0,0 +1,92 @@
+import unittest
+
+import Congestion
+
+
+class RenoTest(unittest.TestCase):
+    def test_slow_start_then_additive_increase(self):
+        cc = Congestion.Reno()
+        cc.on_ack(10, 0.1, 0.0, 10)
+        self.assertEqual(cc.window(), 20)
+        cc.on_loss(0.1, 20)
+        self.assertEqual((cc.cwnd, cc.ssthresh), (10.0, 10.0))
+        cc.on_ack(10, 0.1, 0.2, 10) # one round trip's worth
+        self.assertEqual(cc.window(), 11)
+
+    def test_loss_halves(self):
+        cc = Congestion.Reno()
+        cc.on_loss(0.0, 10)
+        self.assertEqual((cc.cwnd, cc.ssthresh), (5.0, 5.0))
+        cc.cwnd = 3.0
+        cc.on_loss(0.0, 3)
+        self.assertEqual(cc.cwnd, Congestion.MIN_WINDOW)
+
+    def test_timeout_collapses(self):
+        cc = Congestion.Reno()
+        cc.on_timeout(0.0, 10)
+        self.assertEqual((cc.cwnd, cc.ssthresh), (1.0, 5.0))
+        cc.on_ack(1, None, 0.1, 1)
+        self.assertTrue(cc.in_slow_start())
+
+
+class CubicTest(unittest.TestCase):
+    def test_loss_reduces_by_beta(self):
+        cc = Congestion.Cubic()
+        cc.on_loss(0.0, 10)
+        self.assertAlmostEqual(cc.cwnd, 7.0)
+        self.assertEqual(cc.w_max, 10.0)
+        # a second loss below the old maximum gives bandwidth up faster (fast convergence)
+        cc.on_loss(0.1, 7)
+        self.assertAlmostEqual(cc.w_max, 7.0 * 1.7 / 2)
+        self.assertAlmostEqual(cc.cwnd, 4.9)
+
+    def test_timeout_collapses(self):
+        cc = Congestion.Cubic()
+        cc.on_timeout(0.0, 10)
+        self.assertEqual(cc.cwnd, 1.0)
+        self.assertAlmostEqual(cc.ssthresh, 7.0)
+
+    def test_grows_back_to_old_maximum(self):
+        cc = Congestion.Cubic()
+        cc.on_ack(90, 0.1, 0.0, 10)
+        cc.on_loss(0.0, 100)
+        self.assertAlmostEqual(cc.cwnd, 70.0)
+        # concave growth: back at w_max after K seconds, not before
+        now = 0.0
+        while now < cc.k - 0.5:
+            now += 0.1
+            cc.on_ack(int(cc.cwnd), 0.1, now, int(cc.cwnd))
+        self.assertLess(cc.cwnd, 100.0)
+        while now < cc.k + 1.0:
+            now += 0.1
+            cc.on_ack(int(cc.cwnd), 0.1, now, int(cc.cwnd))
+        self.assertGreater(cc.cwnd, 100.0)
+
+
+class BBRTest(unittest.TestCase):
+    def test_ignores_isolated_loss(self):
+        cc = Congestion.BBR()
+        cc.on_loss(0.0, 10)
+        self.assertEqual(cc.cwnd, 10.0)
+
+    def test_timeout(self):
+        cc = Congestion.BBR()
+        cc.on_timeout(0.0, 10)
+        self.assertEqual(cc.cwnd, 4.0)
+
+    def test_window_follows_model(self):
+        cc = Congestion.BBR()
+        # 100 packets per 0.1s round: a bandwidth-delay product of 100 packets
+        for n in range(1, 30):
+            cc.on_ack(100, 0.1, n * 0.1, 100)
+        self.assertNotEqual(cc.mode, 'startup')
+        self.assertAlmostEqual(cc.bdp(), 100.0)
+        self.assertAlmostEqual(cc.cwnd, 200.0)
+
+
+class CreateTest(unittest.TestCase):
+    def test_by_name(self):
+        for name, algorithm in Congestion.ALGORITHMS.items():
+            self.assertIsInstance(Congestion.create(name), algorithm)
+        with self.assertRaises(ValueError):
+            Congestion.create('vegas')
@@ -0,0 +1,48 @@
+import errno
+import os
+import socket
+import unittest
+
+import DatagramIO
+
+
+# A UDP socket whose sendmsg() fails with a given errno, and which counts its sendto() calls.
+class FailingSocket(socket.socket):
+    def __init__(self, error):
+        super().__init__(socket.AF_INET, socket.SOCK_DGRAM)
+        self.error = error
+        self.sent = 0
+
+    def sendmsg(self, *args):
+        raise OSError(self.error, os.strerror(self.error))
+
+    def sendto(self, message, address):
+        self.sent += 1
+        return len(message)
+
+
+class SegmentedSendTest(unittest.TestCase):
+    def datagram_io(self, error):
+        sock = FailingSocket(error)
+        self.addCleanup(sock.close)
+        io = DatagramIO.DatagramIO(sock)
+        io.gso = True # as if the platform had UDP GSO
+        return io, sock
+
+    def send_burst(self, io):
+        io.send_many([(b'x' * 100, ('127.0.0.1', 9))] * 4)
+
+    def test_unsupported_disables_gso(self):
+        for error in DatagramIO.GSO_UNSUPPORTED:
+            io, sock = self.datagram_io(error)
+            self.send_burst(io)
+            self.assertFalse(io.gso)
+            self.assertEqual(sock.sent, 4)
+
+    def test_other_errors_keep_gso(self):
+        for error in (errno.EMSGSIZE, errno.ENOBUFS, errno.ECONNREFUSED):
+            io, sock = self.datagram_io(error)
+            with self.assertRaises(OSError) as raised:
+                self.send_burst(io)
+            self.assertEqual(raised.exception.errno, error)
+            self.assertTrue(io.gso)
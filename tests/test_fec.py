@@ -0,0 +1,92 @@
+import os
+import random
+import unittest
+
+import FEC
+import Packet
+
+
+class FECTest(unittest.TestCase):
+    # A block of data packets as (seqno, end, flags, payload); the seqno space counts payload bytes.
+    def block(self, sizes, start=1000, flags=0):
+        packets = []
+        seqno = start
+        for size in sizes:
+            packets.append((seqno, seqno + size, flags, os.urandom(size)))
+            seqno += size
+        return packets
+
+    # The parity the encoder makes for the packets, as (block start, payload).
+    def encode(self, packets):
+        encoder = FEC.Encoder(len(packets))
+        parity = None
+        for seqno, end, flags, payload in packets:
+            parity = encoder.add(seqno, end, flags, payload)
+        return parity
+
+    def decoder(self, packets, lost):
+        decoder = FEC.Decoder()
+        for index, packet in enumerate(packets):
+            if index not in lost:
+                decoder.remember(*packet)
+        return decoder
+
+    def test_recovers_any_single_loss(self):
+        packets = self.block([100, 100, 100, 37])
+        start, parity = self.encode(packets)
+        self.assertEqual(start, packets[0][0])
+        for lost in range(len(packets)):
+            recovered = self.decoder(packets, {lost}).recover(start, parity, packets[0][0])
+            self.assertEqual(recovered, packets[lost], lost)
+
+    def test_compressed_payload(self):
+        # a compressed packet's payload is shorter than the seqnos it covers
+        packets = [(0, 100, Packet.FLAG_COMPRESSED, b'z' * 40), (100, 200, 0, b'y' * 100)]
+        start, parity = self.encode(packets)
+        self.assertEqual(self.decoder(packets, {0}).recover(start, parity, 0), packets[0])
+
+    def test_nothing_to_recover(self):
+        packets = self.block([50, 50, 50])
+        start, parity = self.encode(packets)
+        self.assertIsNone(self.decoder(packets, set()).recover(start, parity, 0))
+        self.assertIsNone(self.decoder(packets, {0, 2}).recover(start, parity, 0))
+        # the missing packet was delivered some other way already
+        self.assertIsNone(self.decoder(packets, {0}).recover(start, parity, packets[1][0]))
+        self.assertIsNone(self.decoder(packets, {0}).recover(start, parity[:2], 0))
+
+    def test_across_seqno_wrap(self):
+        packets = self.block([100, 100, 100], start=Packet.SEQ_MODULO - 150)
+        start, parity = self.encode(packets)
+        self.assertEqual(self.decoder(packets, {1}).recover(start, parity, start), packets[1])
+
+    def test_flush_partial_block(self):
+        packets = self.block([10, 20])
+        encoder = FEC.Encoder(8)
+        for packet in packets:
+            self.assertIsNone(encoder.add(*packet))
+        start, parity = encoder.flush()
+        self.assertIsNone(encoder.flush())
+        self.assertEqual(self.decoder(packets, {1}).recover(start, parity, start), packets[1])
+
+    def test_adaptive_block(self):
+        self.assertEqual(FEC.block_for(0), FEC.MAX_BLOCK)
+        self.assertEqual(FEC.block_for(1.0), FEC.MIN_BLOCK)
+        self.assertEqual(FEC.block_for(FEC.TARGET_LOSSES / 10), 10)
+        encoder = FEC.Encoder(adaptive=True)
+        encoder.add(0, 10, 0, b'x' * 10, limit=5)
+        self.assertEqual(encoder.block, 5) # never more than the limit
+
+    def test_history(self):
+        decoder = FEC.Decoder(history=2)
+        for seqno in range(0, 40, 10):
+            decoder.remember(seqno, seqno + 10, 0, b'x' * 10)
+        self.assertEqual(list(decoder.packets), [20, 30])
+        self.assertEqual(sorted(decoder.ends), [30, 40])
+
+    def test_random_blocks(self):
+        rng = random.Random(7)
+        for trial in range(50):
+            packets = self.block([rng.randint(1, 1400) for n in range(rng.randint(1, 12))])
+            start, parity = self.encode(packets)
+            lost = rng.randrange(len(packets))
+            self.assertEqual(self.decoder(packets, {lost}).recover(start, parity, start), packets[lost])
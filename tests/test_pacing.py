@@ -0,0 +1,73 @@
+import unittest
+
+import Pacing
+
+PACKET = 1000
+
+
+class PacerTest(unittest.TestCase):
+    # Sends a packet whenever the pacer lets one go, from 'start' for 'seconds' in 'step' second ticks; returns the
+    # bytes sent.
+    def send_for(self, pacer, start, seconds, step=0.0001):
+        sent = 0
+        for tick in range(int(seconds / step)):
+            now = start + tick * step
+            while pacer.ready(now):
+                pacer.consume(PACKET)
+                sent += PACKET
+        return sent
+
+    def test_not_pacing(self):
+        pacer = Pacing.Pacer()
+        pacer.set_rate(None, PACKET, 0.0)
+        self.assertTrue(pacer.ready(0.0))
+        pacer.consume(10 * PACKET)
+        self.assertTrue(pacer.ready(0.0))
+        self.assertEqual(pacer.delay(0.0), 0.0)
+
+    def test_burst_then_wait(self):
+        pacer = Pacing.Pacer()
+        pacer.set_rate(1e6, PACKET, 0.0) # 2ms at 1MB/s is less than MIN_BURST packets
+        for n in range(Pacing.MIN_BURST):
+            self.assertTrue(pacer.ready(0.0))
+            pacer.consume(PACKET)
+        self.assertFalse(pacer.ready(0.0))
+        self.assertAlmostEqual(pacer.delay(0.0), 1e-6)
+        # any tokens at all let the next packet go, and it has to be paid off before the one after it
+        self.assertTrue(pacer.ready(0.000002))
+        pacer.consume(PACKET)
+        self.assertFalse(pacer.ready(0.0009))
+        self.assertTrue(pacer.ready(0.0011))
+
+    def test_rate(self):
+        pacer = Pacing.Pacer()
+        pacer.set_rate(1e6, PACKET, 0.0)
+        sent = self.send_for(pacer, 0.0, 1.0)
+        # the first burst plus the rate
+        self.assertAlmostEqual(sent, 1e6 + Pacing.MIN_BURST * PACKET, delta=2 * PACKET)
+
+    def test_idle_time_is_not_saved_up(self):
+        pacer = Pacing.Pacer()
+        pacer.set_rate(1e6, PACKET, 0.0)
+        self.send_for(pacer, 0.0, 0.01)
+        # after a second of silence only one bucket's worth goes out at once
+        self.assertEqual(self.send_for(pacer, 1.01, 0.0001), Pacing.MIN_BURST * PACKET)
+
+    def test_cap(self):
+        pacer = Pacing.Pacer(cap=1e5)
+        pacer.set_rate(1e9, PACKET, 0.0)
+        self.assertEqual(pacer.rate, 1e5)
+        pacer.set_rate(None, PACKET, 0.0)
+        self.assertEqual(pacer.rate, 1e5) # no RTT yet, the cap still holds
+        pacer.set_rate(1e4, PACKET, 0.0)
+        self.assertEqual(pacer.rate, 1e4)
+
+    def test_window_rate(self):
+        self.assertIsNone(Pacing.window_rate(10, PACKET, None, True))
+        self.assertAlmostEqual(Pacing.window_rate(10, PACKET, 0.1, True), Pacing.SLOW_START_GAIN * 1e5)
+        self.assertAlmostEqual(Pacing.window_rate(10, PACKET, 0.1, False), Pacing.AVOIDANCE_GAIN * 1e5)
+
+    def test_parse_rate(self):
+        self.assertEqual(Pacing.parse_rate('100M'), 1e8)
+        self.assertEqual(Pacing.parse_rate('2k'), 2e3)
+        self.assertEqual(Pacing.parse_rate('1500'), 1500.0)
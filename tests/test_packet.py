@@ -0,0 +1,87 @@
+import unittest
+
+import Checksum
+import Packet
+
+
+class BinaryTest(unittest.TestCase):
+    def test_round_trip(self):
+        for checksum in (Checksum.crc32, Checksum.internet, Checksum.none):
+            message = Packet.make(Packet.BINARY, 'data', 7, b'payload', Packet.FLAG_COMPRESSED, checksum)
+            self.assertEqual(len(message), Packet.HEADER_SIZE + 7)
+            self.assertTrue(Packet.is_binary(message))
+            msg_type, seqno, data, flags, valid = Packet.parse(message, checksum)
+            self.assertEqual((msg_type, seqno, bytes(data), flags, valid),
+                             ('data', 7, b'payload', Packet.FLAG_COMPRESSED, True))
+
+    def test_seqno_is_modulo(self):
+        message = Packet.make_binary('ack', Packet.SEQ_MODULO + 5)
+        self.assertEqual(Packet.parse(message)[1], 5)
+
+    def test_corruption(self):
+        message = bytearray(Packet.make_binary('data', 1, b'payload'))
+        message[-1] ^= 1
+        self.assertFalse(Packet.parse(message)[4])
+        # a truncated payload doesn't match its length
+        self.assertFalse(Packet.parse(Packet.make_binary('data', 1, b'payload')[:-2])[4])
+
+    def test_unparseable(self):
+        with self.assertRaises(ValueError):
+            Packet.parse(b'\x82\x00')
+        with self.assertRaises(ValueError):
+            Packet.parse(b'\xff' + bytes(Packet.HEADER_SIZE))
+
+    def test_wrong_checksum_algorithm(self):
+        message = Packet.make_binary('data', 1, b'payload', checksum=Checksum.crc32)
+        self.assertFalse(Packet.parse(message, Checksum.internet)[4])
+
+
+class LegacyTest(unittest.TestCase):
+    def test_round_trip(self):
+        message = Packet.make(Packet.LEGACY, 'data', 3, b'a|b')
+        self.assertFalse(Packet.is_binary(message))
+        msg_type, seqno, data, flags, valid = Packet.parse(message)
+        self.assertEqual((msg_type, seqno, bytes(data), valid), ('data', 3, b'a|b', True))
+
+    def test_no_data(self):
+        msg_type, seqno, data, flags, valid = Packet.parse(Packet.make_legacy('ack', 12))
+        self.assertEqual((msg_type, seqno, valid), ('ack', 12, True))
+
+    def test_memoryview(self):
+        message = memoryview(b'xx' + Packet.make_legacy('data', 3, b'abc'))[2:]
+        self.assertEqual(bytes(Packet.parse(message)[2]), b'abc')
+
+
+class SeqnoTest(unittest.TestCase):
+    def test_unwrap(self):
+        modulo = Packet.SEQ_MODULO
+        self.assertEqual(Packet.unwrap_seqno(10, 5), 10)
+        self.assertEqual(Packet.unwrap_seqno(5, 10), 5)
+        # across the wrap, both ways
+        self.assertEqual(Packet.unwrap_seqno(3, modulo - 2), modulo + 3)
+        self.assertEqual(Packet.unwrap_seqno(modulo - 2, modulo + 3), modulo - 2)
+        for expected in (0, 12345, modulo - 1, 5 * modulo + 17):
+            for delta in (-(modulo // 2) + 1, -1, 0, 1, modulo // 2):
+                seqno = expected + delta
+                if seqno >= 0:
+                    self.assertEqual(Packet.unwrap_seqno(seqno % modulo, expected), seqno)
+
+    def test_sack_blocks(self):
+        ackno = Packet.SEQ_MODULO - 100
+        blocks = [(ackno + 50, ackno + 150), (ackno + 200, ackno + 300)]
+        self.assertEqual(Packet.decode_sack(Packet.encode_sack(blocks), ackno), blocks)
+
+    def test_window(self):
+        data = Packet.WINDOW.pack(4096) + Packet.encode_sack([(1, 2)])
+        window, rest = Packet.split_window(data, Packet.FLAG_SACK | Packet.FLAG_WINDOW)
+        self.assertEqual(window, 4096)
+        self.assertEqual(Packet.decode_sack(rest, 0), [(1, 2)])
+        self.assertEqual(Packet.split_window(data, Packet.FLAG_SACK), (None, data))
+
+
+class StartTest(unittest.TestCase):
+    def test_options(self):
+        payload = Packet.encode_start('dir/f', {'sack': 1, 'checksum': 'crc32c,crc32'})
+        self.assertEqual(Packet.decode_start(payload), ('dir/f', {'sack': '1', 'checksum': 'crc32c,crc32'}))
+        self.assertEqual(Packet.decode_start(Packet.encode_start('f')), ('f', {}))
+        self.assertEqual(Packet.decode_options(Packet.encode_options({'resume': 42})), {'resume': '42'})
@@ -0,0 +1,58 @@
+import unittest
+
+import PathMTU
+
+
+class PathMTUTest(unittest.TestCase):
+    def setUp(self):
+        self.pmtu = PathMTU.PathMTU(PathMTU.BASE_SIZE, PathMTU.MAX_SIZE)
+
+    # Sends the next probe and lets it go unanswered until the size counts as too big.
+    def lose_probe(self, now=0.0):
+        size = self.pmtu.next_probe(now, 1.0)
+        for attempt in range(1, PathMTU.MAX_PROBES):
+            self.pmtu.on_probe_timeout(now + attempt)
+            self.assertEqual(self.pmtu.next_probe(now + attempt, 1.0), size) # tried again
+        self.pmtu.on_probe_timeout(now + PathMTU.MAX_PROBES)
+        return size
+
+    def answer_probe(self, now=0.0):
+        size = self.pmtu.next_probe(now, 1.0)
+        self.assertTrue(self.pmtu.on_probe_ack(self.pmtu.probe_id, now))
+        return size
+
+    def test_first_probe_tries_maximum(self):
+        self.assertEqual(self.answer_probe(), PathMTU.MAX_SIZE)
+        self.assertEqual(self.pmtu.size, PathMTU.MAX_SIZE)
+        self.assertIsNone(self.pmtu.next_probe(0.0, 1.0)) # nothing left to find
+
+    def test_search_halves_range(self):
+        self.assertEqual(self.lose_probe(), PathMTU.MAX_SIZE)
+        self.assertEqual(self.pmtu.size, PathMTU.BASE_SIZE)
+        middle = (PathMTU.BASE_SIZE + PathMTU.MAX_SIZE) // 2
+        self.assertEqual(self.answer_probe(), middle)
+        self.assertEqual(self.lose_probe(), (middle + PathMTU.MAX_SIZE) // 2)
+        # converges on the largest size that got through, within SEARCH_GRANULARITY
+        while self.pmtu.next_deadline() is not None or self.pmtu.searching(0.0):
+            self.answer_probe()
+        self.assertLess(self.pmtu.high - self.pmtu.size, PathMTU.SEARCH_GRANULARITY)
+        self.assertIsNone(self.pmtu.next_probe(0.0, 1.0))
+        self.assertEqual(self.pmtu.search_at, PathMTU.RAISE_INTERVAL)
+
+    def test_stale_answer(self):
+        self.pmtu.next_probe(0.0, 1.0)
+        self.assertFalse(self.pmtu.on_probe_ack(self.pmtu.probe_id - 1, 0.5))
+        self.assertEqual(self.pmtu.size, PathMTU.BASE_SIZE)
+
+    def test_probe_too_big_to_send(self):
+        self.pmtu.next_probe(0.0, 1.0)
+        self.pmtu.on_probe_error()
+        self.assertEqual(self.pmtu.high, PathMTU.MAX_SIZE - 1)
+        self.assertLess(self.pmtu.next_probe(0.0, 1.0), PathMTU.MAX_SIZE)
+
+    def test_black_hole(self):
+        self.answer_probe()
+        self.pmtu.black_hole(10.0)
+        self.assertEqual(self.pmtu.size, PathMTU.BASE_SIZE)
+        self.assertIsNone(self.pmtu.next_probe(10.0, 1.0))
+        self.assertEqual(self.pmtu.next_probe(10.0 + PathMTU.BLACK_HOLE_DELAY, 1.0), PathMTU.MAX_SIZE)
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import Packet
+import Receiver
+
+SENDER = ('127.0.0.1', 40000)
+
+
+class ReceiverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix='receiver_')
+        os.chdir(self.workdir) # output files go to the current directory
+        self.receiver = Receiver.Receiver(0)
+        self.addCleanup(self.receiver.s.close)
+
+    def tearDown(self):
+        for conn in self.receiver.connections.values():
+            conn.end()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # Hands a packet to the receiver as if it had arrived from 'address', and returns the acks it sends back as
+    # (seqno, payload, flags).
+    def deliver(self, message, address=SENDER):
+        self.receiver._handle_message(message, address)
+        acks = []
+        for ack, to in self.receiver.outbox:
+            self.assertEqual(to, address)
+            msg_type, seqno, data, flags, valid = Packet.parse(ack)
+            acks.append((seqno, bytes(data), flags))
+        self.receiver.outbox = []
+        return acks
+
+    def start(self, filename, address=SENDER, **options):
+        return self.deliver(Packet.make_binary('start', 0, Packet.encode_start(filename, options)), address)
+
+
+class StartTest(ReceiverTestCase):
+    def test_bad_size_is_rejected(self):
+        for size in (-5, 10 ** 20):
+            self.assertEqual(self.start('f', sack=1, size=size), [])
+            self.assertEqual(self.receiver.connections, {})
+        self.assertEqual(len(self.start('f', sack=1, size=10)), 1)
+        self.assertIn(SENDER, self.receiver.connections)
+
+    def test_bad_stripe_offset_is_rejected(self):
+        for offset in (-3, 20, 10 ** 20):
+            self.assertEqual(self.start('f', sack=1, stripe=0, stripes=2, offset=offset, size=10), [])
+            self.assertEqual(self.receiver.connections, {})
+        self.assertEqual(len(self.start('f', sack=1, stripe=1, stripes=2, offset=10, size=10)), 1)
+
+
+class SackTest(ReceiverTestCase):
+    # Delivers a data packet and returns the ack as (ackno, SACK blocks).
+    def data(self, seqno, data):
+        acks = self.deliver(Packet.make_binary('data', seqno, data))
+        self.assertEqual(len(acks), 1)
+        ackno, payload, flags = acks[0]
+        self.assertTrue(flags & Packet.FLAG_SACK)
+        return ackno, Packet.decode_sack(payload, ackno)
+
+    def test_hole_closes(self):
+        chunks = [os.urandom(1000) for n in range(4)]
+        self.start('f', sack=1) # data starts at seqno 1
+        self.assertEqual(self.data(1, chunks[0]), (1001, []))
+        # the second packet is lost: the ones after it are buffered and reported beyond the hole
+        self.assertEqual(self.data(2001, chunks[2]), (1001, [(2001, 3001)]))
+        self.assertEqual(self.data(3001, chunks[3]), (1001, [(2001, 4001)]))
+        self.assertEqual(self.data(2001, chunks[2]), (1001, [(2001, 4001)])) # a duplicate changes nothing
+        # the retransmission fills the hole: everything is acked at once
+        self.assertEqual(self.data(1001, chunks[1]), (4001, []))
+        conn = self.receiver.connections[SENDER]
+        self.assertEqual((conn.stats['out_of_order'], conn.stats['duplicates']), (2, 1))
+        self.assertEqual(self.deliver(Packet.make_binary('end', 4001))[0][0], 4002)
+        self.assertTrue(conn.finished)
+        with open('out_f', 'rb') as f:
+            self.assertEqual(f.read(), b''.join(chunks))
+
+
+class FailedConnectionTest(ReceiverTestCase):
+    def test_write_error_drops_only_that_connection(self):
+        other = ('127.0.0.1', 40001)
+        self.start('f', sack=1)
+        self.start('g', other)
+        # the file goes away under the connection: its next write (out of order data goes straight to the file) fails
+        conn = self.receiver.connections[SENDER]
+        os.close(conn.sink._file())
+        self.assertEqual(self.deliver(Packet.make_binary('data', 1001, b'x' * 1000)), [])
+        self.assertNotIn(SENDER, self.receiver.connections)
+        # the other connection carries on
+        self.assertEqual([seqno for seqno, data, flags in self.deliver(Packet.make_binary('data', 1, b'y'), other)],
+                         [1])
@@ -0,0 +1,46 @@
+import unittest
+
+import RTT
+
+
+class RTTEstimatorTest(unittest.TestCase):
+    def test_first_sample(self):
+        rtt = RTT.RTTEstimator()
+        self.assertEqual(rtt.rto, 1.0)
+        rtt.sample(0.1)
+        self.assertEqual(rtt.srtt, 0.1)
+        self.assertEqual(rtt.rttvar, 0.05)
+        self.assertAlmostEqual(rtt.rto, 0.3) # srtt + 4 * rttvar
+
+    def test_later_samples(self):
+        rtt = RTT.RTTEstimator()
+        rtt.sample(0.1)
+        rtt.sample(0.3)
+        self.assertAlmostEqual(rtt.rttvar, 0.75 * 0.05 + 0.25 * 0.2)
+        self.assertAlmostEqual(rtt.srtt, 0.875 * 0.1 + 0.125 * 0.3)
+        self.assertAlmostEqual(rtt.rto, rtt.srtt + 4 * rtt.rttvar)
+
+    def test_backoff(self):
+        rtt = RTT.RTTEstimator(maximum=2.0)
+        rtt.sample(0.1)
+        rtt.backoff()
+        self.assertAlmostEqual(rtt.rto, 0.6)
+        rtt.backoff()
+        self.assertAlmostEqual(rtt.rto, 1.2)
+        rtt.backoff()
+        self.assertEqual(rtt.rto, 2.0) # capped
+        rtt.reset_backoff()
+        self.assertAlmostEqual(rtt.rto, 0.3)
+
+    def test_sample_ends_backoff(self):
+        rtt = RTT.RTTEstimator()
+        rtt.backoff()
+        self.assertEqual(rtt.rto, 2.0)
+        rtt.sample(0.1)
+        self.assertEqual(rtt.backoffs, 0)
+        self.assertAlmostEqual(rtt.rto, 0.3)
+
+    def test_minimum(self):
+        rtt = RTT.RTTEstimator()
+        rtt.sample(0.001)
+        self.assertEqual(rtt.rto, 0.2)
@@ -0,0 +1,65 @@
+import unittest
+
+import SendWindow
+
+
+class SendWindowTest(unittest.TestCase):
+    def setUp(self):
+        self.window = SendWindow.SendWindow(4)
+        self.segments = [SendWindow.Segment('data', seqno, b'x' * 10) for seqno in (0, 10, 20, 30)]
+        for segment in self.segments:
+            self.window.append(segment)
+
+    # Sends whatever next_unsent() offers, as the sender does.
+    def send_all(self, now, rto=1.0):
+        sent = []
+        while True:
+            segment = self.window.next_unsent()
+            if segment is None:
+                return sent
+            self.window.take_unsent()
+            self.window.sent(segment, now, now + rto)
+            sent.append(segment.seqno)
+
+    def test_ring(self):
+        self.assertTrue(self.window.full())
+        with self.assertRaises(OverflowError):
+            self.window.append(SendWindow.Segment('data', 40, b''))
+        self.assertEqual(self.window.release().seqno, 0)
+        self.window.append(SendWindow.Segment('data', 40, b''))
+        self.assertEqual([segment.seqno for segment in self.window], [10, 20, 30, 40])
+        self.assertEqual(self.window[0].seqno, 10)
+        self.assertEqual(self.window[-1].seqno, 40)
+        self.assertEqual(self.window.find(30).seqno, 30)
+        self.assertEqual(self.window.index_of(30), 2)
+        self.assertEqual(self.window.index_of(25), 2) # first one not below it
+        self.assertEqual(self.window.index_of(99), 4)
+
+    def test_in_flight(self):
+        self.assertEqual(self.send_all(0.0), [0, 10, 20, 30])
+        self.assertEqual(self.window.in_flight, 4)
+        self.window.sack(self.segments[2])
+        self.assertEqual(self.window.in_flight, 3)
+        self.window.release()
+        self.assertEqual(self.window.in_flight, 2)
+
+    def test_lost_go_first(self):
+        self.send_all(0.0)
+        self.window.release()
+        self.window.append(SendWindow.Segment('data', 40, b''))
+        self.window.lose(self.segments[2])
+        self.assertEqual(self.send_all(1.0), [20, 40])
+        self.assertTrue(self.segments[2].retransmitted())
+        self.assertFalse(self.segments[1].retransmitted())
+
+    def test_timers(self):
+        self.send_all(0.0)
+        self.window.sent(self.segments[1], 0.5, 2.0) # resent later: only its new deadline counts
+        self.window.sack(self.segments[3]) # held by the receiver: never expires
+        self.assertEqual(self.window.next_deadline(), 1.0)
+        self.assertEqual([segment.seqno for segment in self.window.expired(1.5)], [0, 20])
+        self.assertEqual(self.window.next_deadline(), 2.0)
+        self.window.release()
+        self.window.release()
+        self.assertIsNone(self.window.next_deadline())
+        self.assertEqual(self.window.expired(10.0), [])
@@ -0,0 +1,266 @@
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+import Congestion
+import Packet
+import Pacing
+import PathMTU
+import RTT
+import Sender
+
+
+class SenderTestCase(unittest.TestCase):
+    def setUp(self):
+        # a receiver that never answers
+        self.peer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.peer.bind(('127.0.0.1', 0))
+        self.addCleanup(self.peer.close)
+        fd, self.path = tempfile.mkstemp(prefix='sender_')
+        os.write(fd, os.urandom(100000))
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def sender(self, **kwargs):
+        sender = Sender.Sender('127.0.0.1', self.peer.getsockname()[1], self.path, **kwargs)
+        self.addCleanup(sender.sock.close)
+        sender.connect()
+        # millisecond timeouts, so waiting for a few of them doesn't take long
+        sender.rtt = RTT.RTTEstimator(initial=0.01, minimum=0.001, maximum=0.05)
+        return sender
+
+    # One round of the sender's main loop without waiting for acks; returns the packets it sent as
+    # (type, seqno, data).
+    def pump(self, sender):
+        sender.resend_data()
+        sender.send_next_data()
+        sender.flush_outbox()
+        sender.probe_path()
+        sent = []
+        self.peer.setblocking(False)
+        while True:
+            try:
+                message = self.peer.recv(65536)
+            except BlockingIOError:
+                return sent
+            msg_type, seqno, data, flags, valid = Packet.parse(message, sender.checksum)
+            sent.append((msg_type, seqno, bytes(data)))
+
+    # Hands the sender an ack from the receiver: cumulative up to 'ackno', with SACK blocks and a receive window
+    # if given, or the options a start ack carries.
+    def ack(self, sender, ackno, blocks=None, window=None, options=None):
+        flags = 0
+        data = b''
+        if options is not None:
+            data = Packet.encode_options(options)
+        elif sender.sack:
+            data = Packet.encode_sack(blocks or [])
+            flags = Packet.FLAG_SACK
+            if window is not None:
+                data = Packet.WINDOW.pack(window) + data
+                flags |= Packet.FLAG_WINDOW
+        sender.handle_message(Packet.make_binary('ack', ackno, data, flags))
+
+    # Sends the start and has the receiver accept it with 'options' (SACK by default); returns the first data seqno.
+    def establish(self, sender, **options):
+        options.setdefault('sack', 1)
+        start = self.pump(sender)[0]
+        self.assertEqual(start[0], 'start')
+        data_start = sender.segment_end(sender.msg_window[0])
+        self.ack(sender, data_start, options=options)
+        self.assertEqual(sender.current_state, 1)
+        return data_start
+
+
+class StartTest(SenderTestCase):
+    def test_start_backs_off(self):
+        sender = self.sender()
+        sender.run(until=lambda: sender.start_attempts == 2)
+        self.assertEqual(sender.rtt.backoffs, 1)
+        self.assertAlmostEqual(sender.rtt.rto, 0.02)
+
+    def test_gives_up_on_silent_receiver(self):
+        sender = self.sender()
+        sender.run()
+        self.assertEqual(sender.start_attempts, Sender.START_TRIES)
+        self.assertEqual(sender.format, Packet.LEGACY)
+        self.assertIn("no answer to start", sender.failed)
+
+
+class KarnTest(SenderTestCase):
+    def test_no_sample_from_retransmit(self):
+        sender = self.sender(pacing=False)
+        first = self.establish(sender)
+        self.assertEqual(sender.stats['rtt_samples'], 1) # the start's
+        sent = self.pump(sender)
+        self.assertTrue(sent)
+        time.sleep(sender.rtt.rto + 0.01)
+        # everything in flight timed out and went out again
+        self.assertEqual(self.pump(sender)[0][1], first)
+        self.assertGreater(sender.rtt.backoffs, 0)
+        self.ack(sender, first + len(sent[0][2]))
+        # the ack releases the first packet, but it was sent twice: no telling which one it acknowledges
+        self.assertEqual(sender.stats['rtt_samples'], 1)
+        self.assertEqual(sender.rtt.backoffs, 0) # progress all the same
+        # nor is anything else that timed out, whether it was resent yet or not
+        self.ack(sender, sent[-1][1] + len(sent[-1][2]))
+        self.assertEqual(sender.stats['rtt_samples'], 1)
+        # a packet that went out only once is a sample again
+        new = self.pump(sender)[-1]
+        self.ack(sender, new[1] + len(new[2]))
+        self.assertEqual(sender.stats['rtt_samples'], 2)
+
+
+class CongestionTest(SenderTestCase):
+    # The initial window's worth of data in flight; returns the packets as (type, seqno, data).
+    def fill_window(self, sender):
+        self.establish(sender)
+        sent = self.pump(sender)
+        self.assertEqual(len(sent), Congestion.INITIAL_WINDOW)
+        return sent
+
+    # The second packet arrives, the first doesn't: the receiver repeats its ack (and SACK block) for every packet
+    # that comes in after it.
+    def three_dupacks(self, sender, sent):
+        hole = (sent[1][1], sent[1][1] + len(sent[1][2]))
+        for n in range(3):
+            self.ack(sender, sent[0][1], [hole])
+
+    def test_three_dupacks(self):
+        # the SACKed packet grows the window by one first (slow start), then the loss cuts it
+        for name, cwnd in (('reno', 5.5), ('cubic', 7.7), ('bbr', 11.0)):
+            sender = self.sender(congestion=name, pacing=False)
+            sent = self.fill_window(sender)
+            self.three_dupacks(sender, sent)
+            self.assertAlmostEqual(sender.cc.cwnd, cwnd, msg=name)
+            self.assertEqual(sender.stats['fast_retransmits'], 1)
+
+    def test_timeout(self):
+        for name, cwnd in (('reno', 1.0), ('cubic', 1.0), ('bbr', 4.0)):
+            sender = self.sender(congestion=name, pacing=False)
+            self.fill_window(sender)
+            time.sleep(sender.rtt.rto + 0.01)
+            resent = self.pump(sender)
+            self.assertEqual(sender.cc.cwnd, cwnd, msg=name)
+            self.assertEqual(len(resent), sender.cc.window())
+            self.assertEqual(sender.stats['timeouts'], 1)
+
+
+class FastRecoveryTest(SenderTestCase):
+    def test_new_reno(self):
+        sender = self.sender(congestion='reno', pacing=False)
+        self.establish(sender)
+        sent = self.pump(sender)
+        seqnos = [seqno for msg_type, seqno, data in sent]
+        size = len(sent[0][2])
+        # packets 0 and 3 are lost; 1, 2 and 4 arrive and each brings a duplicate ack
+        self.ack(sender, seqnos[0], [(seqnos[1], seqnos[2])])
+        self.ack(sender, seqnos[0], [(seqnos[1], seqnos[3])])
+        self.assertEqual(sender.stats['fast_retransmits'], 0)
+        self.ack(sender, seqnos[0], [(seqnos[4], seqnos[5]), (seqnos[1], seqnos[3])])
+        self.assertEqual(sender.stats['fast_retransmits'], 1)
+        self.assertEqual(sender.cc.cwnd, 6.5) # 10 + 3 SACKed in slow start, halved once
+        self.assertEqual(sender.recovery_point, seqnos[-1])
+        resent = [seqno for msg_type, seqno, data in self.pump(sender) if seqno <= seqnos[-1]]
+        self.assertEqual(resent, [seqnos[0]]) # only the first hole so far
+        # the retransmission arrives: a partial ack, up to the second hole, which is resent right away
+        self.ack(sender, seqnos[3], [(seqnos[4], seqnos[5])])
+        resent = [seqno for msg_type, seqno, data in self.pump(sender) if seqno <= seqnos[-1]]
+        self.assertEqual(resent, [seqnos[3]])
+        self.assertIsNotNone(sender.recovery_point)
+        # everything that was in flight at the loss is acknowledged: recovery is over, without another cut
+        self.ack(sender, seqnos[-1] + size)
+        self.assertIsNone(sender.recovery_point)
+        self.assertEqual(sender.stats['fast_retransmits'], 1)
+        self.assertEqual(sender.stats['retransmits'], 2)
+
+
+class PathMTUTest(SenderTestCase):
+    def test_probe_then_black_hole(self):
+        sender = self.sender(pacing=False)
+        self.establish(sender, mss=PathMTU.MAX_SIZE)
+        sent = self.pump(sender)
+        probes = [packet for packet in sent if packet[0] == 'probe']
+        self.assertEqual([len(data) for msg_type, seqno, data in probes], [PathMTU.MAX_SIZE])
+        self.assertTrue(all(len(data) == PathMTU.BASE_SIZE for msg_type, seqno, data in sent if msg_type == 'data'))
+        # the receiver answers: new packets are as big as the probe
+        sender.handle_message(Packet.make_binary('probe', probes[0][1]))
+        self.assertEqual(sender.payload_size, PathMTU.MAX_SIZE)
+        last = [packet for packet in sent if packet[0] == 'data'][-1]
+        self.ack(sender, last[1] + len(last[2]))
+        sent = [packet for packet in self.pump(sender) if packet[0] == 'data']
+        self.assertEqual(len(sent[0][2]), PathMTU.MAX_SIZE)
+        # then the path stops taking them: after BLACK_HOLE_TIMEOUTS timeouts in a row the size drops back
+        for n in range(Sender.BLACK_HOLE_TIMEOUTS):
+            self.assertEqual(sender.payload_size, PathMTU.MAX_SIZE)
+            time.sleep(sender.rtt.rto + 0.01)
+            resent = self.pump(sender)
+        self.assertEqual(sender.payload_size, PathMTU.BASE_SIZE)
+        # and what was in flight goes out again in pieces that fit
+        self.assertIn(resent[0][1], [seqno for msg_type, seqno, data in sent])
+        self.assertEqual(resent[1][1], resent[0][1] + PathMTU.BASE_SIZE)
+        self.assertTrue(all(len(data) <= PathMTU.BASE_SIZE for msg_type, seqno, data in resent))
+
+
+class PacingTest(SenderTestCase):
+    def test_rate_cap(self):
+        sender = self.sender(rate=1e6) # bits per second
+        sender.rtt = RTT.RTTEstimator() # no retransmissions while we watch the pacer
+        self.establish(sender)
+        # the congestion window would let 10 packets go, the bucket only holds MIN_BURST of them
+        self.assertEqual(len(self.pump(sender)), Pacing.MIN_BURST)
+        self.assertEqual(sender.stats['pacing_waits'], 1)
+        # the bucket is empty, not overdrawn: the next packet goes as soon as there is a token, and then the one
+        # after it waits until that packet is paid for
+        time.sleep(0.001)
+        self.assertEqual(len(self.pump(sender)), 1)
+        self.assertEqual(self.pump(sender), [])
+        # at most one packet's worth of time at 125000 bytes per second (less the tokens that came in meanwhile)
+        wait = sender.next_timeout()
+        self.assertGreater(wait, 0.0)
+        self.assertLessEqual(wait, (sender.payload_size + Packet.HEADER_SIZE) / 125000.0)
+        time.sleep(wait)
+        self.assertEqual(len(self.pump(sender)), 1)
+
+
+class FlowControlTest(SenderTestCase):
+    def test_window_limits_sending(self):
+        sender = self.sender(pacing=False)
+        size = sender.payload_size
+        first = self.establish(sender, window=3 * size)
+        sent = self.pump(sender)
+        self.assertEqual([seqno for msg_type, seqno, data in sent], [first, first + size, first + 2 * size])
+        # the first packet is delivered but the application hasn't read it yet: the window stays where it was
+        self.ack(sender, first + size, window=2 * size)
+        self.assertEqual(self.pump(sender), [])
+        # a window update: the same ack, a bigger window, and no duplicate ack
+        self.ack(sender, first + size, window=4 * size)
+        self.assertEqual(sender.dupacks, 0)
+        self.assertEqual([seqno for msg_type, seqno, data in self.pump(sender)], [first + 3 * size, first + 4 * size])
+
+    def test_persist_probes(self):
+        sender = self.sender(pacing=False)
+        size = sender.payload_size
+        first = self.establish(sender, window=size)
+        self.assertEqual(len(self.pump(sender)), 1)
+        self.ack(sender, first + size, window=0)
+        self.assertEqual(sender.stats['zero_windows'], 1)
+        # nothing in flight and the window closed: one packet goes out anyway after an RTO, then after two, ...
+        waits = []
+        for n in range(3):
+            self.assertEqual(self.pump(sender), []) # arms the persist timer
+            waits.append(sender.persist_at - time.monotonic())
+            time.sleep(max(waits[-1], 0) + 0.001)
+            probe = first + (n + 1) * size
+            self.assertEqual([seqno for msg_type, seqno, data in self.pump(sender)], [probe])
+            # the receiver takes it, but still has no room for more
+            self.ack(sender, probe + size, window=0)
+        self.assertEqual(sender.stats['window_probes'], 3)
+        self.assertGreater(waits[2], waits[0])
+        # however long the window stays closed, the receiver hears from us often enough not to expire the connection
+        sender.rtt = RTT.RTTEstimator()
+        sender.persist_backoff = 10
+        self.pump(sender)
+        self.assertAlmostEqual(sender.persist_at - time.monotonic(), Sender.PERSIST_MAX, delta=0.1)
@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import Checkpoint
+import Session
+
+ADDRESS = ('127.0.0.1', 1)
+
+
+# A consumer that puts the items back together: name -> data, or None if the item was cut short.
+class Items(object):
+    def __init__(self):
+        self.items = {}
+        self.calls = []
+
+    def __call__(self, address, name, data, last):
+        self.calls.append((name, None if data is None else bytes(data), last))
+        if data is None:
+            self.items[name] = None
+            return
+        self.items[name] = self.items.get(name, b'') + bytes(data)
+
+
+class SessionTest(unittest.TestCase):
+    # The whole byte stream of a session with the given (name, [pieces]) items.
+    def stream(self, items):
+        source = Session.SessionSource()
+        for name, pieces in items:
+            source.begin(name)
+            for piece in pieces:
+                source.write(piece)
+            source.end()
+        source.finish()
+        data = bytes(source.read(0, source.buffered))
+        self.assertTrue(source.at_end(len(data)))
+        return data
+
+    def test_framing(self):
+        self.assertEqual(self.stream([('ab', [b'xyz'])]),
+                         b'\x00\x02ab' + b'\x00\x00\x00\x03xyz' + b'\x00\x00\x00\x00')
+
+    def test_round_trip_any_split(self):
+        items = [('a', [b'hello', b' ', b'world']), ('empty', []), ('dir/b', [os.urandom(5000)])]
+        data = self.stream(items)
+        for size in (1, 2, 3, 7, 100, len(data)):
+            consumer = Items()
+            sink = Session.SessionSink(ADDRESS, consumer)
+            for offset in range(0, len(data), size):
+                sink.write(data[offset:offset + size])
+            self.assertEqual(consumer.items, dict((name, b''.join(pieces)) for name, pieces in items), size)
+            self.assertEqual(sink.items, 3)
+            self.assertEqual(sink.position, len(data))
+            self.assertEqual(consumer.calls[-1], ('dir/b', b'', True))
+
+    def test_held_data(self):
+        payload = os.urandom(300)
+        data = self.stream([('a', [payload])])
+        consumer = Items()
+        sink = Session.SessionSink(ADDRESS, consumer)
+        sink.write_at(200, data[200:])
+        sink.write_at(100, data[100:200])
+        self.assertEqual(consumer.calls, [])
+        sink.write(data[:100])
+        sink.skip_to(len(data))
+        self.assertEqual(consumer.items['a'], payload)
+        self.assertEqual(sink.items, 1)
+        self.assertEqual(sink.held, {})
+
+    def test_cut_short(self):
+        data = self.stream([('a', [b'x' * 100])])
+        consumer = Items()
+        sink = Session.SessionSink(ADDRESS, consumer)
+        sink.write(data[:50])
+        sink.close()
+        self.assertEqual(consumer.calls[-1], ('a', None, True))
+        self.assertEqual(sink.items, 0)
+
+    def test_corked_source(self):
+        source = Session.SessionSource()
+        source.begin('a')
+        source.corked = True
+        source.write(b'x' * 10)
+        self.assertEqual(source.read(0, 100), b'') # waits for a full packet while more of the item is coming
+        self.assertFalse(source.at_end(0))
+        source.write(b'y' * 100)
+        self.assertEqual(len(source.read(0, 100)), 100)
+        with self.assertRaises(ValueError):
+            source.read(0, 10)
+
+    def test_item_path(self):
+        output_path = lambda name: 'out_' + name
+        self.assertEqual(Session.item_path('a', output_path), 'out_a')
+        self.assertEqual(Session.item_path('d/e/f', output_path), os.path.join('out_d', 'e', 'f'))
+        for name in ('', '/etc/passwd', 'a/../../b', 'a//b', './a', 'a/', 'a\0b'):
+            self.assertIsNone(Session.item_path(name, output_path), name)
+
+
+class SessionFileTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='session_')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+
+    def output_path(self, name):
+        return os.path.join(self.workdir, 'out_' + name)
+
+    def test_files(self):
+        source = Session.SessionSource()
+        for name, data in (('a', b'first'), ('d/b', b'second'), ('../c', b'nowhere')):
+            source.begin(name)
+            source.write(data)
+            source.end()
+        # an interrupted transfer's checkpoint for a path an item overwrites
+        with open(self.output_path('a') + Checkpoint.SUFFIX, 'w') as f:
+            f.write('{}')
+        sink = Session.SessionSink(ADDRESS, output_path=self.output_path)
+        sink.write(source.read(0, source.buffered))
+        sink.close()
+        with open(self.output_path('a'), 'rb') as f:
+            self.assertEqual(f.read(), b'first')
+        with open(os.path.join(self.output_path('d'), 'b'), 'rb') as f:
+            self.assertEqual(f.read(), b'second')
+        self.assertEqual(sorted(os.listdir(self.workdir)), ['out_a', 'out_d'])
+        self.assertEqual(sink.items, 3)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import Sink
+
+
+class FileSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='sink_')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.path = os.path.join(self.workdir, 'out')
+
+    def contents(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_in_order_and_out_of_order(self):
+        sink = Sink.FileSink(self.path, flush_interval=60)
+        sink.write(b'abc')
+        sink.write_at(6, b'ghi')
+        sink.write(b'def')
+        sink.skip_to(9)
+        sink.write(b'j')
+        sink.close()
+        self.assertEqual(self.contents(), b'abcdefghij')
+
+    def test_flush_if_due(self):
+        sink = Sink.FileSink(self.path, flush_interval=0.05)
+        self.addCleanup(sink.close)
+        sink.write(b'abc')
+        self.assertTrue(sink.flush_if_due()) # too early, still buffered
+        self.assertEqual(self.contents(), b'')
+        time.sleep(0.06)
+        self.assertFalse(sink.flush_if_due())
+        self.assertEqual(self.contents(), b'abc')
+        self.assertFalse(sink.flush_if_due())
+
+    def test_background_writer(self):
+        sink = Sink.FileSink(self.path, flush_bytes=4, background=True)
+        for piece in (b'ab', b'cd', b'ef'):
+            sink.write(piece)
+        sink.flush(wait=True)
+        self.assertEqual(sink.queued(), 0)
+        self.assertEqual(self.contents(), b'abcdef')
+        sink.close()
+
+    def test_preallocate_is_best_effort(self):
+        sink = Sink.FileSink(self.path)
+        sink.preallocate(10 ** 20) # no file can be that big
+        sink.preallocate(-1)
+        sink.write(b'abc')
+        sink.close()
+        self.assertEqual(self.contents(), b'abc')